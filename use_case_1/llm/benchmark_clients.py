@@ -0,0 +1,269 @@
+import re
+import json
+import time
+import zlib
+import hashlib
+import threading
+import numpy as np
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from llm.llm_engine import count_tokens
+
+
+STUB_EMBEDDING_DIMENSIONS = 256
+STUB_CATEGORY_KEYWORDS = [
+    ("Fraud", ("fraud", "unauthori", "stolen", "scam", "identity")),
+    ("Fees", ("fee", "charge", "overdraft", "penalty", "interest")),
+    ("Advertising", ("advert", "promot", "offer", "misleading", "marketing")),
+    ("Account closure", ("clos", "terminat", "shut")),
+    ("Application denial", ("denied", "deny", "reject", "declin", "application")),
+    ("Loan repayment", ("loan", "repay", "mortgage", "instal", "payment")),
+    ("Disclosure", ("disclos", "terms", "inform", "contract", "hidden")),
+]
+
+
+def _usage(prompt_tokens: int, completion_tokens: int = 0) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+
+def _completion(content: str, usage: SimpleNamespace) -> SimpleNamespace:
+    return SimpleNamespace(
+        choices=[
+            SimpleNamespace(message=SimpleNamespace(content=content), logprobs=None)
+        ],
+        usage=usage,
+    )
+
+
+def _embedding_response(vectors: List[List[float]], usage) -> SimpleNamespace:
+    return SimpleNamespace(
+        data=[
+            SimpleNamespace(embedding=vector, index=index)
+            for index, vector in enumerate(vectors)
+        ],
+        usage=usage,
+    )
+
+
+def stub_category(complaint: str) -> str:
+    """
+    Guesses a category from keywords, standing in for a model in offline benchmarks.
+    """
+    text = complaint.lower()
+    for category, keywords in STUB_CATEGORY_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return category
+    return "Customer service"
+
+
+def stub_embedding(
+    text: str, dimensions: int = STUB_EMBEDDING_DIMENSIONS
+) -> List[float]:
+    """
+    Returns a deterministic hashed bag-of-words vector, standing in for an embedding model.
+    """
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for word in re.findall(r"\w+", str(text).lower()):
+        vector[zlib.crc32(word.encode("utf-8")) % dimensions] += 1.0
+    vector[0] += 1e-3
+    return vector.tolist()
+
+
+def create_stub_client(latency_seconds: float = 0.0) -> SimpleNamespace:
+    """
+    Creates an offline stand-in for the OpenAI client's chat completion and embedding endpoints.
+
+    Chat completions answer with `stub_category` of the complaint (or a JSON list of them
+    for packed requests), embeddings are hashed bag-of-words vectors. Every call sleeps
+    `latency_seconds` to simulate network latency, and usage is reported in real tokens.
+
+    Args:
+        latency_seconds (float, optional): Simulated latency per call. Defaults to 0.
+
+    Returns:
+        SimpleNamespace: Object with `chat.completions.create` and `embeddings.create`.
+    """
+
+    def create_completion(model, messages, response_format=None, **kwargs):
+        time.sleep(latency_seconds)
+        user_message = messages[-1]["content"]
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        if response_format and response_format.get("type") == "json_object":
+            items = json.loads(user_message)
+            content = json.dumps(
+                {
+                    "classifications": [
+                        {
+                            "row_id": item["row_id"],
+                            "category": stub_category(item["complaint"]),
+                        }
+                        for item in items
+                    ]
+                }
+            )
+        else:
+            content = stub_category(user_message)
+        return _completion(content, _usage(prompt_tokens, count_tokens(content)))
+
+    def create_embeddings(model, input, **kwargs):
+        time.sleep(latency_seconds)
+        texts = input if isinstance(input, list) else [input]
+        return _embedding_response(
+            [stub_embedding(text) for text in texts],
+            _usage(sum(count_tokens(str(text)) for text in texts)),
+        )
+
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create_completion)),
+        embeddings=SimpleNamespace(create=create_embeddings),
+    )
+
+
+def _request_key(endpoint: str, kwargs: Dict[str, Any]) -> str:
+    payload = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{endpoint}:{payload}".encode("utf-8")).hexdigest()
+
+
+def create_recording_client(
+    client: Any, recording_file: str, replay: bool = False
+) -> SimpleNamespace:
+    """
+    Wraps a client so chat completion and embedding responses are recorded to, or replayed
+    from, a JSONL file keyed by the hash of the request.
+
+    Recording a benchmark once against the real API makes later runs reproducible and
+    free, while still exercising the full classification code.
+
+    Args:
+        client (Any): The client to record; ignored when replaying.
+        recording_file (str): JSONL file with one recorded response per line.
+        replay (bool, optional): Serve responses from the recording only. Defaults to False.
+
+    Returns:
+        SimpleNamespace: Object with `chat.completions.create` and `embeddings.create`.
+    """
+    recordings: Dict[str, Dict[str, Any]] = {}
+    if replay:
+        with open(recording_file, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    recordings[record["key"]] = record
+    lock = threading.Lock()
+
+    def save(key, record):
+        record["key"] = key
+        with lock:
+            recordings[key] = record
+            with open(recording_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def lookup(key):
+        if key not in recordings:
+            raise KeyError(f"Request {key[:12]} is not in recording {recording_file}")
+        return recordings[key]
+
+    def create_completion(**kwargs):
+        key = _request_key("chat", kwargs)
+        if replay:
+            record = lookup(key)
+        else:
+            completion = client.chat.completions.create(**kwargs)
+            record = {
+                "content": completion.choices[0].message.content,
+                "usage": [
+                    completion.usage.prompt_tokens,
+                    completion.usage.completion_tokens,
+                ],
+            }
+            save(key, record)
+        return _completion(record["content"], _usage(*record["usage"]))
+
+    def create_embeddings(**kwargs):
+        key = _request_key("embeddings", kwargs)
+        if replay:
+            record = lookup(key)
+        else:
+            response = client.embeddings.create(**kwargs)
+            ordered = sorted(response.data, key=lambda item: item.index)
+            record = {
+                "vectors": [list(item.embedding) for item in ordered],
+                "usage": [response.usage.prompt_tokens, 0],
+            }
+            save(key, record)
+        return _embedding_response(record["vectors"], _usage(*record["usage"]))
+
+    return SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create_completion)),
+        embeddings=SimpleNamespace(create=create_embeddings),
+    )
+
+
+def create_metered_client(client: Any) -> SimpleNamespace:
+    """
+    Wraps a client to count calls and tokens of the chat completion and embedding endpoints.
+
+    The counters are available as the `stats` attribute of the returned object and can be
+    reset with `reset_stats()`.
+
+    Args:
+        client (Any): The client to meter.
+
+    Returns:
+        SimpleNamespace: Object with `chat.completions.create`, `embeddings.create`,
+        `stats` and `reset_stats`.
+    """
+    stats = {}
+    lock = threading.Lock()
+
+    def reset_stats():
+        with lock:
+            stats.clear()
+            stats.update(
+                {
+                    "chat_calls": 0,
+                    "embedding_calls": 0,
+                    "failed_calls": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                }
+            )
+
+    def metered(endpoint: str, create):
+        def call(**kwargs):
+            try:
+                response = create(**kwargs)
+            except Exception:
+                with lock:
+                    stats["failed_calls"] += 1
+                raise
+            usage: Optional[Any] = getattr(response, "usage", None)
+            with lock:
+                stats[f"{endpoint}_calls"] += 1
+                if usage is not None:
+                    stats["prompt_tokens"] += usage.prompt_tokens or 0
+                    stats["completion_tokens"] += (
+                        getattr(usage, "completion_tokens", 0) or 0
+                    )
+            return response
+
+        return call
+
+    reset_stats()
+    return SimpleNamespace(
+        chat=SimpleNamespace(
+            completions=SimpleNamespace(
+                create=metered("chat", client.chat.completions.create)
+            )
+        ),
+        embeddings=SimpleNamespace(
+            create=metered("embedding", client.embeddings.create)
+        ),
+        stats=stats,
+        reset_stats=reset_stats,
+    )
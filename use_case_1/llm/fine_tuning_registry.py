@@ -0,0 +1,79 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, Optional
+
+
+REGISTRY_FILENAME = "fine_tuning_registry.json"
+
+
+def get_training_data_key(
+    jsonl_filename: str, base_model: str, validation_filename: Optional[str] = None
+) -> str:
+    """
+    Identifies a fine-tuning run by the sha256 of the training (and validation) JSONL
+    content and the base model.
+    """
+    digest = hashlib.sha256()
+    for filename in filter(None, [jsonl_filename, validation_filename]):
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        digest.update(b"\0")
+    return f"{base_model}:{digest.hexdigest()}"
+
+
+def load_registry(registry_file: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Loads the fine-tuning registry, mapping training data keys to their uploaded file,
+    fine-tuning job and resulting model.
+
+    Args:
+        registry_file (str): Path to the registry JSON file.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Registry entries, empty if the file does not exist.
+    """
+    if not os.path.exists(registry_file):
+        return {}
+    try:
+        with open(registry_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Ignoring unreadable fine-tuning registry {registry_file}: {e}")
+        return {}
+
+
+def update_registry_entry(
+    registry_file: str, key: str, **fields: Any
+) -> Dict[str, Any]:
+    """
+    Updates one registry entry and rewrites the registry atomically.
+
+    Args:
+        registry_file (str): Path to the registry JSON file.
+        key (str): Training data key from `get_training_data_key`.
+        **fields: Fields to set, e.g. file_id, job_id, status, fine_tuned_model.
+
+    Returns:
+        Dict[str, Any]: The updated entry.
+    """
+    registry = load_registry(registry_file)
+    entry = registry.setdefault(key, {})
+    entry.update(fields)
+
+    tmp_file = f"{registry_file}.tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(registry, f, indent=2)
+    os.replace(tmp_file, registry_file)
+    return entry
+
+
+def find_entry_by_job(registry_file: str, job_id: str) -> Optional[str]:
+    """
+    Returns the key of the registry entry that recorded a fine-tuning job, if any.
+    """
+    for key, entry in load_registry(registry_file).items():
+        if entry.get("job_id") == job_id:
+            return key
+    return None
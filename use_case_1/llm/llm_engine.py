@@ -1,10 +1,92 @@
 from openai import OpenAI
 from dotenv import load_dotenv
+import json
 import os
 import time
+import tiktoken
+import functools
+from typing import List, Optional, Tuple
+
+from llm.fine_tuning_registry import (
+    find_entry_by_job,
+    get_training_data_key,
+    load_registry,
+    update_registry_entry,
+)
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = None
+
+CATEGORIES = [
+    "Advertising",
+    "Account closure",
+    "Application denial",
+    "Customer service",
+    "Disclosure",
+    "Fees",
+    "Fraud",
+    "Loan repayment",
+]
+
+
+def get_client() -> OpenAI:
+    """
+    Returns the OpenAI client, creating it on first use so that importing this module
+    needs no API key. A client assigned to `client` beforehand, e.g. a benchmark stub, is
+    used instead.
+    """
+    global client
+    if client is None:
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer():
+    """
+    Loads the GPT-4o tokenizer on first use. tiktoken downloads its encoding files
+    the first time, so without network access this fails; None is returned and token
+    counts fall back to an estimate of four characters per token.
+    """
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(
+            f"Warning: could not load the o200k_base tokenizer, estimating token counts: {e}"
+        )
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with the tokenizer used by the GPT-4o model family.
+
+    Args:
+        text (str): The text to count.
+
+    Returns:
+        int: Number of tokens.
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return len(text) // 4
+    return len(tokenizer.encode(text))
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """
+    Counts the tokens of many texts at once, tokenizing them on several threads.
+
+    Args:
+        texts (List[str]): The texts to count.
+
+    Returns:
+        List[int]: Number of tokens of every text.
+    """
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return [len(text) // 4 for text in texts]
+    return [len(tokens) for tokens in tokenizer.encode_ordinary_batch(texts)]
 
 
 def get_category(complaint_text: str, model_name: str) -> str:
@@ -19,7 +101,7 @@ def get_category(complaint_text: str, model_name: str) -> str:
         str: The predicted category label or 'Unknown' in case of failure.
     """
     try:
-        completion = client.chat.completions.create(
+        completion = get_client().chat.completions.create(
             model=model_name,
             messages=[
                 {
@@ -55,7 +137,7 @@ def generate_gpt_response(
         str: The model's response as a classification label or an error message.
     """
     try:
-        completion = client.chat.completions.create(
+        completion = get_client().chat.completions.create(
             model=model,
             messages=[
                 {"role": "system", "content": prompt},
@@ -68,36 +150,173 @@ def generate_gpt_response(
         return f"Error: {e}"
 
 
-def fine_tune_model(jsonl_filename: str) -> str:
+def generate_gpt_json_response(
+    prompt: str, user_message: str, model: str = "gpt-4o", temperature: float = 0.01
+) -> dict:
     """
-    Uploads the JSONL training file and initiates the fine-tuning process.
+    Generates a JSON object response from the GPT model.
 
     Args:
-        jsonl_filename (str): Path to the JSONL file.
+        prompt (str): The system message.
+        user_message (str): The user input.
+        model (str, optional): The OpenAI GPT model to use. Defaults to "gpt-4o".
+        temperature (float, optional): The temperature for response creativity. Defaults to 0.01.
 
     Returns:
-        str: The ID of the fine-tuned model.
+        dict: The parsed JSON response, or an empty dict if the call or parsing fails.
     """
-    upload_response = client.files.create(
-        file=open(jsonl_filename, "rb"), purpose="fine-tune"
-    )
-    file_id = upload_response.id
+    try:
+        completion = get_client().chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": user_message},
+            ],
+            temperature=temperature,
+            response_format={"type": "json_object"},
+        )
+        return json.loads(completion.choices[0].message.content)
+    except json.JSONDecodeError:
+        print("Error decoding JSON response from OpenAI.")
+        return {}
+    except Exception as e:
+        print(f"OpenAI API request failed: {e}")
+        return {}
 
-    finetune_response = client.fine_tuning.jobs.create(
-        training_file=file_id, model="gpt-4o-2024-08-06"
-    )
-    job_id = finetune_response.id
 
-    print("Fine-tuning in progress. This may take some time...")
+FINE_TUNING_BASE_MODEL = "gpt-4o-2024-08-06"
+POLL_INITIAL_INTERVAL = 5
+POLL_MAX_INTERVAL = 300
+POLL_BACKOFF_FACTOR = 1.5
+FINE_TUNING_TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+def wait_for_fine_tuning_job(
+    job_id: str, registry_file: Optional[str] = None, key: Optional[str] = None
+):
+    """
+    Polls a fine-tuning job until it finishes, backing off between polls.
+
+    Polling starts every `POLL_INITIAL_INTERVAL` seconds and the interval grows by
+    `POLL_BACKOFF_FACTOR` up to `POLL_MAX_INTERVAL`, so short jobs are noticed quickly
+    without polling long jobs needlessly often. Status changes are written to the registry.
+
+    Args:
+        job_id (str): The fine-tuning job ID.
+        registry_file (Optional[str]): Registry to record status changes in.
+        key (Optional[str]): Registry key of the job's training data.
 
+    Returns:
+        The finished fine-tuning job.
+    """
+    interval = POLL_INITIAL_INTERVAL
+    last_status = None
     while True:
-        retrieved_job = client.fine_tuning.jobs.retrieve(job_id)
+        retrieved_job = get_client().fine_tuning.jobs.retrieve(job_id)
         status = retrieved_job.status
+        if status != last_status:
+            print(f"Fine-tuning job {job_id}: {status}")
+            if registry_file and key:
+                update_registry_entry(
+                    registry_file,
+                    key,
+                    status=status,
+                    fine_tuned_model=retrieved_job.fine_tuned_model or "",
+                )
+            last_status = status
+
+        if status in FINE_TUNING_TERMINAL_STATUSES:
+            return retrieved_job
+
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF_FACTOR, POLL_MAX_INTERVAL)
+
+
+def fine_tune_model(
+    jsonl_filename: str,
+    registry_file: Optional[str] = None,
+    resume_job: Optional[str] = None,
+    validation_filename: Optional[str] = None,
+) -> str:
+    """
+    Uploads the JSONL training file and initiates the fine-tuning process.
+
+    With a registry, training data is identified by the hash of its content and the base
+    model: a model already trained on identical data is returned directly, a job still
+    running for it is re-attached to, and a file already uploaded is not uploaded again.
 
-        if status in ["succeeded", "failed", "cancelled"]:
-            break
+    Args:
+        jsonl_filename (str): Path to the JSONL file.
+        registry_file (Optional[str]): Path to the fine-tuning registry JSON file.
+        resume_job (Optional[str]): ID of an existing fine-tuning job to re-attach to
+            instead of starting a new one.
+        validation_filename (Optional[str]): Path to a validation JSONL file.
 
-        time.sleep(600)
+    Returns:
+        str: The ID of the fine-tuned model.
+    """
+    key = None
+    entry = {}
+    if registry_file:
+        key = get_training_data_key(
+            jsonl_filename, FINE_TUNING_BASE_MODEL, validation_filename
+        )
+        entry = load_registry(registry_file).get(key, {})
+
+    if resume_job:
+        key = find_entry_by_job(registry_file, resume_job) if registry_file else None
+        job_id = resume_job
+        print(f"Re-attaching to fine-tuning job {job_id}...")
+    elif entry.get("status") == "succeeded" and entry.get("fine_tuned_model"):
+        print(
+            f"Reusing fine-tuned model {entry['fine_tuned_model']} trained on identical data."
+        )
+        return entry["fine_tuned_model"]
+    elif entry.get("job_id") and entry.get("status") not in (
+        FINE_TUNING_TERMINAL_STATUSES
+    ):
+        job_id = entry["job_id"]
+        print(f"Re-attaching to running fine-tuning job {job_id} for identical data...")
+    else:
+        file_id = entry.get("file_id")
+        if not file_id:
+            with open(jsonl_filename, "rb") as f:
+                upload_response = get_client().files.create(file=f, purpose="fine-tune")
+            file_id = upload_response.id
+            if registry_file:
+                update_registry_entry(registry_file, key, file_id=file_id)
+
+        validation_file_id = entry.get("validation_file_id")
+        if validation_filename and not validation_file_id:
+            with open(validation_filename, "rb") as f:
+                upload_response = get_client().files.create(file=f, purpose="fine-tune")
+            validation_file_id = upload_response.id
+            if registry_file:
+                update_registry_entry(
+                    registry_file, key, validation_file_id=validation_file_id
+                )
+
+        job_arguments = {"training_file": file_id, "model": FINE_TUNING_BASE_MODEL}
+        if validation_file_id:
+            job_arguments["validation_file"] = validation_file_id
+        finetune_response = get_client().fine_tuning.jobs.create(**job_arguments)
+        job_id = finetune_response.id
+        if registry_file:
+            update_registry_entry(
+                registry_file,
+                key,
+                job_id=job_id,
+                base_model=FINE_TUNING_BASE_MODEL,
+                status=finetune_response.status,
+                fine_tuned_model="",
+            )
+        print(f"Started fine-tuning job {job_id}.")
+
+    print(
+        f"Fine-tuning in progress. This may take some time; an interrupted run can re-attach with --resume-job {job_id}"
+    )
+    retrieved_job = wait_for_fine_tuning_job(job_id, registry_file, key)
+    status = retrieved_job.status
 
     if status == "succeeded":
         print("Fine-tuning completed successfully!")
@@ -135,13 +354,10 @@ def create_user_prompt(complaint_text: str) -> str:
     return f"Complaint: {complaint_text}"
 
 
-def get_prompt_for_few_short_classification() -> str:
+def get_few_shot_instructions() -> str:
     """
-    Generates the system message prompt for classifying consumer complaints.
-
-    Returns:
-        str: A formatted system message containing classification categories, descriptions,
-             instructions, and labeled complaint examples.
+    Returns the role, instructions, category descriptions and output format shared by the
+    few-shot prompts, without any examples.
     """
     return """
     # Role & task
@@ -163,7 +379,39 @@ def get_prompt_for_few_short_classification() -> str:
 
     # Output Format
     Your response strictly consists of the category label only, without any additional commentary.
+"""
+
+
+def format_few_shot_example(number: int, complaint: str, category: str) -> str:
+    """
+    Formats a labelled complaint as a numbered example of the few-shot prompt.
 
+    Args:
+        number (int): Example number shown in the heading.
+        complaint (str): The example complaint text.
+        category (str): Its category label.
+
+    Returns:
+        str: The example block.
+    """
+    return f"""
+    ## Example {number}
+    Consumer complaint: {complaint}
+    Assistant response: {category}
+"""
+
+
+def get_prompt_for_few_short_classification() -> str:
+    """
+    Generates the system message prompt for classifying consumer complaints.
+
+    Returns:
+        str: A formatted system message containing classification categories, descriptions,
+             instructions, and labeled complaint examples.
+    """
+    return (
+        get_few_shot_instructions()
+        + """
     # Examples
 
     ## Example 1
@@ -198,3 +446,49 @@ def get_prompt_for_few_short_classification() -> str:
     Consumer complaint: I tried to enroll in an income-driven repayment plan, but Entity F delayed my application for months without explanation. In the meantime, they continued charging the standard rate, which is completely unaffordable given my current income. After multiple calls, I finally got a partial forbearance, but that only added more interest. Nobody explained the long-term consequences of these measures. I’m drowning in debt while waiting for them to finalize my paperwork.
     Assistant response: Loan repayment
     """
+    )
+
+
+def get_prompt_for_dynamic_few_shot_classification(
+    examples: List[Tuple[str, str]],
+) -> str:
+    """
+    Generates the few-shot system message with examples chosen for a specific complaint
+    instead of the fixed ones.
+
+    Args:
+        examples (List[Tuple[str, str]]): (complaint, category) pairs, in prompt order.
+
+    Returns:
+        str: The few-shot instructions followed by the numbered examples.
+    """
+    return (
+        get_few_shot_instructions()
+        + "\n    # Examples\n"
+        + "".join(
+            format_few_shot_example(number, complaint, category)
+            for number, (complaint, category) in enumerate(examples, start=1)
+        )
+    )
+
+
+def get_prompt_for_packed_few_shot_classification() -> str:
+    """
+    Generates the system message prompt for classifying several consumer complaints in one request.
+
+    The few-shot instructions and examples are shared by all complaints of the request;
+    only the output format differs from the single-complaint prompt.
+
+    Returns:
+        str: The few-shot system message followed by the JSON output instructions.
+    """
+    return (
+        get_prompt_for_few_short_classification()
+        + """
+    # Multiple complaints
+    The user message is a JSON array of objects, each with a "row_id" and a "complaint".
+    Classify every complaint independently, following the instructions and examples above.
+    Your response is a valid JSON object with a single key "classifications", holding an array
+    with one object per complaint: {"row_id": "<row_id as given>", "category": "<category label>"}.
+    """
+    )
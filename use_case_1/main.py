@@ -1,6 +1,14 @@
 from scripts.few_shot_classifier import few_shot_classification
 from scripts.fine_tuning import fine_tuning_classification
 from scripts.vector_embedding import embedding_classification
+from scripts.cascade_classifier import (
+    DEFAULT_MARGIN_THRESHOLD,
+    cascade_classification,
+)
+from retrieval.ann_index import DEFAULT_N_PROBE
+from retrieval.quantization import PRECISIONS
+from retrieval.retriever import KNN_TOP_K
+from utils.chunked_io import CHUNK_SIZE
 from utils.file_handler import check_file_exists
 import os
 import sys
@@ -14,6 +22,7 @@ def main():
     - Few-Shot Classification (Using prompt-based approaches)
     - Fine-Tuning (Training a model on labeled complaints)
     - Vector Embeddings (Using cosine similarity for classification)
+    - Cascade (Vector embeddings first, LLM only for ambiguous complaints)
     """
     current_dir = os.getcwd()
     input_dir = os.path.join(current_dir, "input")
@@ -26,19 +35,110 @@ def main():
     )
     parser.add_argument(
         "--technique",
-        choices=["few-shot", "fine-tuning", "vector-embedding"],
+        choices=["few-shot", "fine-tuning", "vector-embedding", "cascade"],
         required=True,
         help="Select the classification technique to use.",
     )
+    parser.add_argument(
+        "--packed",
+        action="store_true",
+        help="Few-shot only: classify several complaints per request.",
+    )
+    parser.add_argument(
+        "--dynamic-examples",
+        type=int,
+        default=0,
+        help="Few-shot only: prompt every complaint with up to this many of its most similar reference examples (at least one per category) instead of the fixed examples.",
+    )
+    parser.add_argument(
+        "--embedding-mode",
+        choices=["nearest", "knn", "centroid", "medoid"],
+        default="nearest",
+        help="Vector-embedding only: nearest reference, similarity-weighted k-NN vote, category centroid or category medoid.",
+    )
+    parser.add_argument(
+        "--knn-k",
+        type=int,
+        default=KNN_TOP_K,
+        help="Vector-embedding only: number of neighbours voting in k-NN mode.",
+    )
+    parser.add_argument(
+        "--ann",
+        action="store_true",
+        help="Vector-embedding only: search an approximate nearest-neighbour (IVF) index instead of all references.",
+    )
+    parser.add_argument(
+        "--n-probe",
+        type=int,
+        default=DEFAULT_N_PROBE,
+        help="Vector-embedding only: number of IVF lists scanned per complaint with --ann.",
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="float32",
+        help="Vector-embedding and cascade only: storage precision of the reference embeddings searched.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="Number of complaints read, classified and written per chunk.",
+    )
+    parser.add_argument(
+        "--deduplicate",
+        action="store_true",
+        help="Classify one representative per cluster of exact and near-duplicate complaints and copy its label to the others.",
+    )
+    parser.add_argument(
+        "--resume-job",
+        default=None,
+        help="Fine-tuning and cascade only: ID of a running fine-tuning job to re-attach to instead of starting a new one.",
+    )
+    parser.add_argument(
+        "--margin-threshold",
+        type=float,
+        default=DEFAULT_MARGIN_THRESHOLD,
+        help="Cascade only: minimum top-2 category similarity margin for the embedding tier to decide.",
+    )
+    parser.add_argument(
+        "--cascade-llm",
+        choices=["few-shot", "fine-tuning"],
+        default="few-shot",
+        help="Cascade only: LLM technique used for low-margin complaints.",
+    )
 
     args = parser.parse_args()
+    if args.dynamic_examples and args.packed:
+        parser.error("--dynamic-examples cannot be combined with --packed.")
+    if (
+        args.ann
+        and args.technique == "vector-embedding"
+        and args.precision != "float32"
+    ):
+        parser.error(
+            "--ann searches float32 vectors and cannot be combined with a lower --precision."
+        )
 
     if args.technique == "few-shot":
         print("\n Running Few-Shot Classification...\n")
         try:
             input_file = "complaints_data_synthetic.xlsx"
             file_path = check_file_exists(input_dir, input_file)
-            few_shot_classification(file_path, output_dir)
+            reference_file = None
+            if args.dynamic_examples:
+                reference_file = check_file_exists(
+                    input_dir, "complaints_data_classification_reference_examples.xlsx"
+                )
+            few_shot_classification(
+                file_path,
+                output_dir,
+                packed=args.packed,
+                chunk_size=args.chunk_size,
+                deduplicate=args.deduplicate,
+                dynamic_examples=args.dynamic_examples,
+                reference_file=reference_file,
+            )
         except FileNotFoundError as e:
             print(e)
             sys.exit(1)
@@ -52,7 +152,12 @@ def main():
             uncategorized_file: str = "complaints_data_synthetic.xlsx"
             uncategorized_file_path = check_file_exists(input_dir, uncategorized_file)
             fine_tuning_classification(
-                complaints_data_path, uncategorized_file_path, output_dir
+                complaints_data_path,
+                uncategorized_file_path,
+                output_dir,
+                chunk_size=args.chunk_size,
+                deduplicate=args.deduplicate,
+                resume_job=args.resume_job,
             )
         except FileNotFoundError as e:
             print(e)
@@ -61,7 +166,7 @@ def main():
     elif args.technique == "vector-embedding":
         print("\n Running Vector Embedding Classification...\n")
         try:
-            reference_data_path = "complaint_data_classification_reference_examples.xlsx"
+            reference_data_path = "complaints_data_classification_reference_examples.xlsx"
             reference_data_path = check_file_exists(input_dir, reference_data_path)
 
             uncategorized_data_path = "complaints_data_synthetic.xlsx"
@@ -70,13 +175,53 @@ def main():
             )
 
             embedding_classification(
-                reference_data_path, uncategorized_data_path, output_dir
+                reference_data_path,
+                uncategorized_data_path,
+                output_dir,
+                mode=args.embedding_mode,
+                top_k=args.knn_k,
+                use_ann=args.ann,
+                n_probe=args.n_probe,
+                precision=args.precision,
+                chunk_size=args.chunk_size,
+                deduplicate=args.deduplicate,
             )
 
         except FileNotFoundError as e:
             print(e)
             sys.exit(1)
 
+    elif args.technique == "cascade":
+        print("\n Running Cascade Classification...\n")
+        try:
+            reference_data_path = check_file_exists(
+                input_dir, "complaints_data_classification_reference_examples.xlsx"
+            )
+            uncategorized_data_path = check_file_exists(
+                input_dir, "complaints_data_synthetic.xlsx"
+            )
+            training_file = None
+            if args.cascade_llm == "fine-tuning":
+                training_file = check_file_exists(
+                    input_dir, "complaints_data_training.xlsx"
+                )
+
+            cascade_classification(
+                reference_data_path,
+                uncategorized_data_path,
+                output_dir,
+                margin_threshold=args.margin_threshold,
+                llm_technique=args.cascade_llm,
+                training_file=training_file,
+                chunk_size=args.chunk_size,
+                deduplicate=args.deduplicate,
+                resume_job=args.resume_job,
+                precision=args.precision,
+            )
+        except FileNotFoundError as e:
+            print(e)
+            sys.exit(1)
+
     print("\n Classification process completed!\n")
 
 
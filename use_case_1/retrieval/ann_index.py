@@ -0,0 +1,311 @@
+import os
+import json
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from retrieval.embedding_store import get_store_paths
+
+
+DEFAULT_N_PROBE = 8
+KMEANS_ITERATIONS = 20
+KMEANS_TRAINING_POINTS_PER_LIST = 256
+ASSIGNMENT_BLOCK_SIZE = 8192
+
+
+def _assign_to_centroids(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Returns the index of the most similar centroid of every row, computed in blocks.
+    """
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], ASSIGNMENT_BLOCK_SIZE):
+        block = np.asarray(matrix[start : start + ASSIGNMENT_BLOCK_SIZE], np.float32)
+        assignments[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_coarse_quantizer(
+    matrix: np.ndarray, n_lists: int, seed: int = 0
+) -> np.ndarray:
+    """
+    Trains the coarse quantizer of an IVF index with spherical k-means.
+
+    Training runs on a random sample of at most `KMEANS_TRAINING_POINTS_PER_LIST` rows per
+    list, which is plenty to place the centroids and keeps training time independent of the
+    corpus size.
+
+    Args:
+        matrix (np.ndarray): (n, d) normalized vectors.
+        n_lists (int): Number of inverted lists (k-means clusters).
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        np.ndarray: (n_lists, d) normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = matrix.shape[0]
+    n_lists = max(1, min(n_lists, n_rows))
+    sample_size = min(n_rows, n_lists * KMEANS_TRAINING_POINTS_PER_LIST)
+    sample_rows = np.sort(rng.choice(n_rows, size=sample_size, replace=False))
+    sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+
+    centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = _assign_to_centroids(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = sample[rng.choice(sample_size, size=len(empty))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        updated = np.divide(sums, norms, out=np.zeros_like(sums), where=norms > 0)
+        if np.allclose(updated, centroids, atol=1e-6):
+            break
+        centroids = updated
+    return centroids
+
+
+def build_ivf_index(
+    matrix: np.ndarray, n_lists: Optional[int] = None, seed: int = 0
+) -> Dict[str, Any]:
+    """
+    Builds an inverted-file (IVF) index over normalized vectors.
+
+    Every vector is assigned to its nearest coarse centroid. The vectors of each list are
+    kept together so that a query only reads the lists it probes.
+
+    Args:
+        matrix (np.ndarray): (n, d) normalized vectors; row positions become the ids.
+        n_lists (Optional[int]): Number of inverted lists. Defaults to about sqrt(n).
+        seed (int, optional): Random seed for k-means. Defaults to 0.
+
+    Returns:
+        Dict[str, Any]: The index with `centroids` and, per list, `list_ids` and `list_vectors`.
+    """
+    if n_lists is None:
+        n_lists = max(1, int(np.sqrt(matrix.shape[0])))
+    centroids = train_coarse_quantizer(matrix, n_lists, seed)
+    index = {
+        "centroids": centroids,
+        "list_ids": [np.empty(0, dtype=np.int64) for _ in range(len(centroids))],
+        "list_vectors": [
+            np.empty((0, centroids.shape[1]), dtype=np.float32)
+            for _ in range(len(centroids))
+        ],
+    }
+    add_to_ivf_index(index, matrix, np.arange(matrix.shape[0]))
+    return index
+
+
+def add_to_ivf_index(
+    index: Dict[str, Any], vectors: np.ndarray, ids: Sequence[int]
+) -> None:
+    """
+    Inserts vectors into an existing IVF index without retraining the coarse quantizer.
+
+    Args:
+        index (Dict[str, Any]): Index from `build_ivf_index`, updated in place.
+        vectors (np.ndarray): (n, d) normalized vectors to insert.
+        ids (Sequence[int]): Id of every inserted vector.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return
+    assignments = _assign_to_centroids(vectors, index["centroids"])
+    order = np.argsort(assignments, kind="stable")
+    boundaries = np.searchsorted(
+        assignments[order], np.arange(len(index["centroids"]) + 1)
+    )
+    for list_no in range(len(index["centroids"])):
+        rows = order[boundaries[list_no] : boundaries[list_no + 1]]
+        if len(rows) == 0:
+            continue
+        index["list_ids"][list_no] = np.concatenate(
+            [index["list_ids"][list_no], ids[rows]]
+        )
+        index["list_vectors"][list_no] = np.concatenate(
+            [index["list_vectors"][list_no], np.asarray(vectors[rows], np.float32)]
+        )
+
+
+def search_ivf_index(
+    index: Dict[str, Any],
+    query_matrix: np.ndarray,
+    top_k: int = 1,
+    n_probe: int = DEFAULT_N_PROBE,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the approximate top-k neighbours of every query by scanning its n_probe closest lists.
+
+    Work is grouped by list rather than by query: each probed list is scored against all
+    queries that probe it with one matrix multiply, and the results are merged into a
+    running top-k per query.
+
+    Args:
+        index (Dict[str, Any]): Index from `build_ivf_index`.
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        top_k (int, optional): Number of neighbours per query. Defaults to 1.
+        n_probe (int, optional): Number of lists scanned per query.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (n_queries, top_k) ids and similarities, sorted by
+        descending similarity. Missing neighbours have id -1 and similarity -inf.
+    """
+    query_matrix = np.asarray(query_matrix, dtype=np.float32)
+    n_queries = query_matrix.shape[0]
+    n_probe = max(1, min(n_probe, len(index["centroids"])))
+
+    best_ids = np.full((n_queries, top_k), -1, dtype=np.int64)
+    best_scores = np.full((n_queries, top_k), -np.inf, dtype=np.float32)
+    if n_queries == 0:
+        return best_ids, best_scores
+
+    centroid_scores = query_matrix @ index["centroids"].T
+    if n_probe < centroid_scores.shape[1]:
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+    else:
+        probes = np.tile(np.arange(centroid_scores.shape[1]), (n_queries, 1))
+
+    probe_lists = probes.ravel()
+    probe_queries = np.repeat(np.arange(n_queries), n_probe)
+    order = np.argsort(probe_lists, kind="stable")
+    boundaries = np.searchsorted(
+        probe_lists[order], np.arange(len(index["centroids"]) + 1)
+    )
+
+    for list_no in range(len(index["centroids"])):
+        list_ids = index["list_ids"][list_no]
+        queries = probe_queries[order[boundaries[list_no] : boundaries[list_no + 1]]]
+        if len(queries) == 0 or len(list_ids) == 0:
+            continue
+
+        similarities = query_matrix[queries] @ index["list_vectors"][list_no].T
+        k = min(top_k, similarities.shape[1])
+        if k < similarities.shape[1]:
+            columns = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            columns = np.tile(np.arange(similarities.shape[1]), (len(queries), 1))
+
+        merged_scores = np.concatenate(
+            [
+                best_scores[queries],
+                np.take_along_axis(similarities, columns, axis=1),
+            ],
+            axis=1,
+        )
+        merged_ids = np.concatenate([best_ids[queries], list_ids[columns]], axis=1)
+        selected = np.argsort(-merged_scores, axis=1)[:, :top_k]
+        best_scores[queries] = np.take_along_axis(merged_scores, selected, axis=1)
+        best_ids[queries] = np.take_along_axis(merged_ids, selected, axis=1)
+
+    return best_ids, best_scores
+
+
+def _get_ivf_index_paths(reference_file: str, model: str) -> Tuple[str, str]:
+    matrix_path, _ = get_store_paths(reference_file, model)
+    stem = matrix_path[: -len(".npy")]
+    return f"{stem}.ivf.npz", f"{stem}.ivf.json"
+
+
+def save_ivf_index(
+    index: Dict[str, Any], reference_file: str, model: str, row_keys: List[str]
+) -> None:
+    """
+    Persists an IVF index beside the reference embedding store.
+
+    Args:
+        index (Dict[str, Any]): Index from `build_ivf_index`.
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model of the store.
+        row_keys (List[str]): Key of every store row covered by the index, in id order.
+    """
+    arrays_path, meta_path = _get_ivf_index_paths(reference_file, model)
+    list_sizes = np.array([len(ids) for ids in index["list_ids"]], dtype=np.int64)
+    np.savez(
+        arrays_path,
+        centroids=index["centroids"],
+        ids=np.concatenate(index["list_ids"]),
+        vectors=np.concatenate(index["list_vectors"]),
+        offsets=np.concatenate([[0], np.cumsum(list_sizes)]),
+    )
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "row_keys": row_keys}, f)
+
+
+def load_ivf_index(
+    reference_file: str, model: str
+) -> Optional[Tuple[Dict[str, Any], List[str]]]:
+    """
+    Loads an IVF index persisted beside the reference embedding store.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model of the store.
+
+    Returns:
+        Optional[Tuple[Dict[str, Any], List[str]]]: The index and the store row keys it
+        covers, or None if no index has been saved.
+    """
+    arrays_path, meta_path = _get_ivf_index_paths(reference_file, model)
+    if not os.path.exists(arrays_path) or not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    arrays = np.load(arrays_path)
+    offsets = arrays["offsets"]
+    index = {
+        "centroids": arrays["centroids"],
+        "list_ids": [
+            arrays["ids"][offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)
+        ],
+        "list_vectors": [
+            arrays["vectors"][offsets[i] : offsets[i + 1]]
+            for i in range(len(offsets) - 1)
+        ],
+    }
+    return index, meta["row_keys"]
+
+
+def load_or_build_ivf_index(
+    reference_file: str,
+    model: str,
+    reference_matrix: np.ndarray,
+    row_keys: List[str],
+    n_lists: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Loads the persisted IVF index, inserting new store rows incrementally where possible.
+
+    If the rows the saved index covers are a prefix of the current store (references were
+    only appended), the new rows are added without retraining. Any other change to the
+    store rebuilds the index.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model of the store.
+        reference_matrix (np.ndarray): (n, d) normalized reference embeddings.
+        row_keys (List[str]): Key identifying every store row, e.g. row id and text hash.
+        n_lists (Optional[int]): Number of inverted lists when (re)building.
+
+    Returns:
+        Dict[str, Any]: The up-to-date IVF index; ids are row positions in the store.
+    """
+    saved = load_ivf_index(reference_file, model)
+    if saved is not None:
+        index, indexed_keys = saved
+        if indexed_keys == row_keys[: len(indexed_keys)]:
+            n_new = len(row_keys) - len(indexed_keys)
+            if n_new:
+                print(f"Adding {n_new} new references to the ANN index.")
+                add_to_ivf_index(
+                    index,
+                    reference_matrix[len(indexed_keys) :],
+                    np.arange(len(indexed_keys), len(row_keys)),
+                )
+                save_ivf_index(index, reference_file, model, row_keys)
+            return index
+
+    print("Building ANN index...")
+    index = build_ivf_index(reference_matrix, n_lists)
+    save_ivf_index(index, reference_file, model, row_keys)
+    return index
@@ -0,0 +1,248 @@
+import os
+import json
+import numpy as np
+from typing import Any, Dict, Tuple
+from retrieval.embedding_store import get_store_fingerprint, get_store_paths
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def _select_medoids(
+    members: np.ndarray, n_medoids: int, n_iterations: int = 10
+) -> np.ndarray:
+    """
+    Picks up to n_medoids representative rows of one category with a small k-medoids loop.
+
+    For unit vectors the member maximizing the summed cosine similarity to a cluster is
+    the one most similar to the cluster's (unnormalized) sum, so each update is a single
+    matrix-vector product.
+    """
+    n_medoids = min(n_medoids, members.shape[0])
+    medoids = [int(np.argmax(members @ members.sum(axis=0)))]
+    while len(medoids) < n_medoids:
+        closest = (members @ members[medoids].T).max(axis=1)
+        medoids.append(int(np.argmin(closest)))
+
+    for _ in range(n_iterations):
+        assignment = np.argmax(members @ members[medoids].T, axis=1)
+        updated = []
+        for cluster in range(n_medoids):
+            cluster_members = np.flatnonzero(assignment == cluster)
+            if len(cluster_members) == 0:
+                updated.append(medoids[cluster])
+                continue
+            cluster_sum = members[cluster_members].sum(axis=0)
+            updated.append(
+                int(cluster_members[np.argmax(members[cluster_members] @ cluster_sum)])
+            )
+        if updated == medoids:
+            break
+        medoids = updated
+    return members[medoids]
+
+
+def build_category_index(
+    reference_matrix: np.ndarray,
+    reference_labels: np.ndarray,
+    medoids_per_category: int = 1,
+) -> Dict[str, Any]:
+    """
+    Precomputes per-category centroids, medoids and statistics from the reference embeddings.
+
+    Args:
+        reference_matrix (np.ndarray): (n, d) normalized reference embeddings.
+        reference_labels (np.ndarray): Category label of every reference row.
+        medoids_per_category (int, optional): Number of medoids kept per category. Defaults to 1.
+
+    Returns:
+        Dict[str, Any]: The category index with keys `categories`, `centroids`, `medoids`,
+        `medoid_labels` and `statistics`.
+    """
+    reference_matrix = np.asarray(reference_matrix, dtype=np.float32)
+    categories = sorted(set(reference_labels.tolist()))
+
+    centroids = []
+    medoids = []
+    medoid_labels = []
+    statistics = {}
+    for category in categories:
+        members = reference_matrix[reference_labels == category]
+        mean_vector = members.mean(axis=0)
+        centroid = _l2_normalize(mean_vector[None, :])[0]
+        similarities = members @ centroid
+
+        category_medoids = _select_medoids(members, medoids_per_category)
+        centroids.append(centroid)
+        medoids.append(category_medoids)
+        medoid_labels.extend([category] * len(category_medoids))
+        statistics[category] = {
+            "count": int(members.shape[0]),
+            "cohesion": float(np.linalg.norm(mean_vector)),
+            "mean_similarity_to_centroid": float(similarities.mean()),
+            "std_similarity_to_centroid": float(similarities.std()),
+            "min_similarity_to_centroid": float(similarities.min()),
+        }
+
+    return {
+        "categories": np.asarray(categories, dtype=object),
+        "centroids": np.asarray(centroids, dtype=np.float32),
+        "medoids": np.concatenate(medoids).astype(np.float32),
+        "medoid_labels": np.asarray(medoid_labels, dtype=object),
+        "statistics": statistics,
+    }
+
+
+def _get_category_index_paths(reference_file: str, model: str) -> Tuple[str, str]:
+    matrix_path, _ = get_store_paths(reference_file, model)
+    stem = matrix_path[: -len(".npy")]
+    return f"{stem}.categories.npz", f"{stem}.categories.json"
+
+
+def load_or_build_category_index(
+    reference_file: str,
+    model: str,
+    reference_matrix: np.ndarray,
+    reference_labels: np.ndarray,
+    medoids_per_category: int = 1,
+) -> Dict[str, Any]:
+    """
+    Loads the category index persisted beside the reference store, rebuilding it when stale.
+
+    The index is tied to the exact store it was built from via its fingerprint (see
+    `get_store_fingerprint`), so added, edited or relabelled references trigger a rebuild.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model of the store.
+        reference_matrix (np.ndarray): (n, d) normalized reference embeddings.
+        reference_labels (np.ndarray): Category label of every reference row.
+        medoids_per_category (int, optional): Number of medoids kept per category. Defaults to 1.
+
+    Returns:
+        Dict[str, Any]: The category index (see `build_category_index`).
+    """
+    arrays_path, meta_path = _get_category_index_paths(reference_file, model)
+    fingerprint = get_store_fingerprint(reference_file, model)
+
+    if os.path.exists(arrays_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if (
+            meta.get("store_fingerprint") == fingerprint
+            and meta.get("medoids_per_category") == medoids_per_category
+        ):
+            arrays = np.load(arrays_path)
+            return {
+                "categories": np.asarray(meta["categories"], dtype=object),
+                "centroids": arrays["centroids"],
+                "medoids": arrays["medoids"],
+                "medoid_labels": np.asarray(meta["medoid_labels"], dtype=object),
+                "statistics": meta["statistics"],
+            }
+
+    index = build_category_index(
+        reference_matrix, reference_labels, medoids_per_category
+    )
+    np.savez(arrays_path, centroids=index["centroids"], medoids=index["medoids"])
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "store_fingerprint": fingerprint,
+                "medoids_per_category": medoids_per_category,
+                "categories": index["categories"].tolist(),
+                "medoid_labels": index["medoid_labels"].tolist(),
+                "statistics": index["statistics"],
+            },
+            f,
+            ensure_ascii=False,
+            indent=4,
+        )
+    return index
+
+
+def classify_by_centroid(
+    query_matrix: np.ndarray, category_index: Dict[str, Any]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assigns every query the category with the most similar centroid, at O(categories) per query.
+
+    Args:
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        category_index (Dict[str, Any]): Index from `build_category_index`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The assigned category and its similarity for every query.
+    """
+    similarities = (
+        np.asarray(query_matrix, dtype=np.float32) @ category_index["centroids"].T
+    )
+    best = np.argmax(similarities, axis=1)
+    return category_index["categories"][best], similarities[np.arange(len(best)), best]
+
+
+def classify_by_medoids(
+    query_matrix: np.ndarray, category_index: Dict[str, Any]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assigns every query the category of its most similar medoid.
+
+    Args:
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        category_index (Dict[str, Any]): Index from `build_category_index`.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The assigned category and its similarity for every query.
+    """
+    similarities = (
+        np.asarray(query_matrix, dtype=np.float32) @ category_index["medoids"].T
+    )
+    best = np.argmax(similarities, axis=1)
+    return category_index["medoid_labels"][best], similarities[
+        np.arange(len(best)), best
+    ]
+
+
+def vote_top_k(
+    neighbour_indices: np.ndarray,
+    neighbour_scores: np.ndarray,
+    reference_labels: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combines top-k neighbours into a similarity-weighted category vote.
+
+    Args:
+        neighbour_indices (np.ndarray): (n_queries, k) reference indices of the neighbours.
+        neighbour_scores (np.ndarray): (n_queries, k) cosine similarities of the neighbours.
+        reference_labels (np.ndarray): Category label of every reference row.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The winning category and its share of the total vote
+        weight for every query.
+    """
+    categories, label_codes = np.unique(
+        reference_labels.astype(str), return_inverse=True
+    )
+    neighbour_codes = label_codes[neighbour_indices]
+    weights = np.clip(neighbour_scores, 0, None)
+
+    votes = np.zeros((neighbour_codes.shape[0], len(categories)), dtype=np.float32)
+    np.add.at(
+        votes,
+        (
+            np.repeat(np.arange(neighbour_codes.shape[0]), neighbour_codes.shape[1]),
+            neighbour_codes.ravel(),
+        ),
+        weights.ravel(),
+    )
+    winner = np.argmax(votes, axis=1)
+    totals = votes.sum(axis=1)
+    shares = np.divide(
+        votes[np.arange(len(winner)), winner],
+        totals,
+        out=np.zeros(len(winner), dtype=np.float32),
+        where=totals > 0,
+    )
+    return categories[winner].astype(object), shares
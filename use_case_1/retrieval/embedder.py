@@ -1,28 +1,130 @@
 import os
+import time
+import random
+import openai
+import numpy as np
 import pandas as pd
+import tiktoken
+import functools
+import threading
+import contextlib
 import concurrent.futures
 from openai import OpenAI
 from dotenv import load_dotenv
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+from retrieval.embedding_cache import (
+    append_embedding_cache,
+    load_embedding_cache,
+    normalize_text,
+    text_hash,
+)
+from retrieval.embedding_store import (
+    get_store_paths,
+    load_embedding_store,
+    normalize_embeddings,
+    write_embedding_store,
+)
+from retrieval.projection import (
+    get_projection_path,
+    load_projection,
+    project_embeddings,
+)
 
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = None
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+SHORTENABLE_EMBEDDING_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
 
-def generate_text_embedding(text: str) -> Optional[List[float]]:
+MAX_INPUT_TOKENS = 8191
+MAX_BATCH_ITEMS = 2048
+MAX_BATCH_TOKENS = 300000
+EMBEDDING_MAX_WORKERS = 4
+EMBEDDING_MAX_RETRIES = 5
+EMBEDDING_RETRY_BASE_SECONDS = 1.0
+
+
+def get_client() -> OpenAI:
+    """
+    Returns the OpenAI client, creating it on first use so that importing this module
+    needs no API key. A client assigned to `client` beforehand, e.g. a benchmark stub, is
+    used instead.
+    """
+    global client
+    if client is None:
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer():
+    """
+    Loads the embedding model's tokenizer on first use. tiktoken downloads its encoding files
+    the first time, so without network access this fails; None is returned and token
+    counts fall back to an estimate of four characters per token.
+    """
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(
+            f"Warning: could not load the cl100k_base tokenizer, estimating token counts: {e}"
+        )
+        return None
+
+
+def parse_embedding_model(model: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    Splits an embedding model name into the OpenAI model, its requested output dimensions
+    and an optional PCA projection.
+
+    Names have the form "<model>[@<dimensions>][+pca<components>]":
+    "text-embedding-3-small@512" asks the API for shortened 512-dimensional vectors and
+    "text-embedding-ada-002+pca256" projects ada-002 vectors onto 256 principal components.
+    Every name has its own cache, reference store and indexes.
+
+    Args:
+        model (str): Embedding model name.
+
+    Returns:
+        Tuple[str, Optional[int], Optional[int]]: OpenAI model, API dimensions (or None)
+        and PCA components (or None).
+    """
+    name, _, pca = model.partition("+pca")
+    name, _, dimensions = name.partition("@")
+    if dimensions and name not in SHORTENABLE_EMBEDDING_MODELS:
+        raise ValueError(f"'{name}' does not support shortened embeddings.")
+    return name, int(dimensions) if dimensions else None, int(pca) if pca else None
+
+
+def _embedding_arguments(model: str) -> Dict[str, object]:
+    name, dimensions, pca = parse_embedding_model(model)
+    if pca:
+        raise ValueError(
+            f"'{model}' is a PCA projection; embed with `embed_texts_with_cache`."
+        )
+    arguments = {"model": name, "encoding_format": "float"}
+    if dimensions:
+        arguments["dimensions"] = dimensions
+    return arguments
+
+
+def generate_text_embedding(
+    text: str, model: str = EMBEDDING_MODEL
+) -> Optional[List[float]]:
     """
     Generates a vector embedding for a given text using OpenAI's embedding model.
 
     Args:
         text (str): The input text to be converted into an embedding.
+        model (str, optional): Embedding model name (see `parse_embedding_model`).
 
     Returns:
         Optional[List[float]]: The vector embedding of the text or None if an error occurs.
     """
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002", input=text, encoding_format="float"
+        response = get_client().embeddings.create(
+            input=text, **_embedding_arguments(model)
         )
         return response.data[0].embedding
     except Exception as e:
@@ -30,16 +132,270 @@ def generate_text_embedding(text: str) -> Optional[List[float]]:
         return None
 
 
-def create_reference_embeddings(input_file: str) -> None:
+def pack_embedding_batches(token_counts: Sequence[int]) -> List[List[int]]:
+    """
+    Greedily packs inputs, in order, into batches that respect the API's item and token limits.
+
+    Args:
+        token_counts (Sequence[int]): Token count of every input.
+
+    Returns:
+        List[List[int]]: Batches of input positions.
+    """
+    batches = []
+    current_batch = []
+    current_tokens = 0
+    for position, n_tokens in enumerate(token_counts):
+        if current_batch and (
+            len(current_batch) >= MAX_BATCH_ITEMS
+            or current_tokens + n_tokens > MAX_BATCH_TOKENS
+        ):
+            batches.append(current_batch)
+            current_batch = []
+            current_tokens = 0
+        current_batch.append(position)
+        current_tokens += n_tokens
+    if current_batch:
+        batches.append(current_batch)
+    return batches
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """
+    Returns whether an API error is worth retrying unchanged: rate limits, connection
+    problems and server errors.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _embed_batch(
+    texts: List[str], positions: List[int], model: str = EMBEDDING_MODEL
+) -> Tuple[Dict[int, List[float]], Dict[int, str]]:
+    """
+    Embeds one packed batch. Transient errors are retried on the same batch with
+    exponential backoff. If the API rejects the batch as a bad request, it is split in half
+    and retried so that a single bad input only fails itself; any other error fails the
+    whole batch.
+    """
+    for attempt in range(EMBEDDING_MAX_RETRIES + 1):
+        try:
+            response = get_client().embeddings.create(
+                input=[texts[position] for position in positions],
+                **_embedding_arguments(model),
+            )
+            ordered = sorted(response.data, key=lambda item: item.index)
+            return {
+                position: item.embedding for position, item in zip(positions, ordered)
+            }, {}
+        except openai.BadRequestError as e:
+            if len(positions) == 1:
+                return {}, {positions[0]: str(e)}
+            break
+        except Exception as e:
+            if not _is_transient_error(e) or attempt == EMBEDDING_MAX_RETRIES:
+                return {}, {position: str(e) for position in positions}
+            time.sleep(
+                EMBEDDING_RETRY_BASE_SECONDS * 2**attempt * random.uniform(1, 1.5)
+            )
+
+    middle = len(positions) // 2
+    left_vectors, left_failures = _embed_batch(texts, positions[:middle], model)
+    right_vectors, right_failures = _embed_batch(texts, positions[middle:], model)
+    return {**left_vectors, **right_vectors}, {**left_failures, **right_failures}
+
+
+def generate_text_embeddings(
+    texts: Sequence[str], model: str = EMBEDDING_MODEL
+) -> Tuple[List[Optional[List[float]]], Dict[int, str]]:
     """
-    Generates embeddings for labeled complaints and stores them in an Excel file.
+    Generates embeddings for a list of texts with as few API requests as possible.
+
+    Inputs are counted with tiktoken (or estimated, see `get_tokenizer`), truncated to the model's input limit and packed into
+    requests of at most `MAX_BATCH_ITEMS` items and `MAX_BATCH_TOKENS` tokens. The output
+    preserves the input order; inputs that could not be embedded are None and their error
+    is recorded instead of failing the whole batch.
+
+    Args:
+        texts (Sequence[str]): The texts to embed.
+        model (str, optional): Embedding model name, optionally with shortened dimensions.
+
+    Returns:
+        Tuple[List[Optional[List[float]]], Dict[int, str]]: One embedding per text (None on
+        failure) and a mapping from failed input position to error message.
+    """
+    prepared_texts = []
+    token_counts = []
+    tokenizer = get_tokenizer()
+    for text in texts:
+        text = str(text)
+        if tokenizer is None:
+            text = text[: MAX_INPUT_TOKENS * 4]
+            n_tokens = len(text) // 4
+        else:
+            tokens = tokenizer.encode(text)
+            if len(tokens) > MAX_INPUT_TOKENS:
+                tokens = tokens[:MAX_INPUT_TOKENS]
+                text = tokenizer.decode(tokens)
+            n_tokens = len(tokens)
+        prepared_texts.append(text)
+        token_counts.append(max(n_tokens, 1))
+
+    batches = pack_embedding_batches(token_counts)
+    embeddings: List[Optional[List[float]]] = [None] * len(prepared_texts)
+    failures: Dict[int, str] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=EMBEDDING_MAX_WORKERS
+    ) as executor:
+        for batch_vectors, batch_failures in executor.map(
+            lambda positions: _embed_batch(prepared_texts, positions, model), batches
+        ):
+            for position, vector in batch_vectors.items():
+                embeddings[position] = vector
+            failures.update(batch_failures)
+
+    for position, error in failures.items():
+        print(f"Error generating embedding for text {position}: {error}")
+    return embeddings, failures
+
+
+def embed_texts_with_cache(
+    texts: Sequence[str],
+    cache_dir: str,
+    cache: Optional[Dict[str, np.ndarray]] = None,
+    model: str = EMBEDDING_MODEL,
+    lock: Optional[threading.Lock] = None,
+) -> List[Optional[np.ndarray]]:
+    """
+    Returns an embedding for every text, only calling the embeddings API for texts not yet cached.
+
+    The cache is keyed by (model, sha256 of the normalized text), so repeated or unchanged
+    complaints are embedded once across all runs and input files. For a PCA model, missing
+    texts are embedded with the underlying model (through its own cache) and projected.
+
+    Args:
+        texts (Sequence[str]): The texts to embed.
+        cache_dir (str): Root directory of the persistent embedding cache.
+        cache (Optional[Dict[str, np.ndarray]]): Cache already loaded with
+            `load_embedding_cache`, kept up to date in place. Loaded from disk if omitted.
+        model (str, optional): Embedding model name (see `parse_embedding_model`).
+        lock (Optional[threading.Lock]): Lock guarding a cache shared between threads. It
+            is held while the cache is read and updated, but not during API calls.
+
+    Returns:
+        List[Optional[np.ndarray]]: One vector per text, or None where embedding failed.
+    """
+    lock = lock or contextlib.nullcontext()
+    hashes = [text_hash(text) for text in texts]
+
+    with lock:
+        if cache is None:
+            cache = load_embedding_cache(cache_dir, model)
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cache and key not in missing:
+                missing[key] = normalize_text(text)
+
+    print(
+        f"Embedding cache: {len(texts) - sum(h in missing for h in hashes)} hits, {len(missing)} texts to embed."
+    )
+    if missing:
+        if parse_embedding_model(model)[2]:
+            projection = load_projection(get_projection_path(cache_dir, model))
+            base_vectors = embed_texts_with_cache(
+                list(missing.values()),
+                cache_dir,
+                model=model.partition("+pca")[0],
+                lock=lock,
+            )
+            embedded = [
+                (key, vector)
+                for key, vector in zip(missing, base_vectors)
+                if vector is not None
+            ]
+            new_entries = {}
+            if embedded:
+                projected = project_embeddings(
+                    np.stack([vector for _, vector in embedded]), projection
+                )
+                new_entries = {
+                    key: vector for (key, _), vector in zip(embedded, projected)
+                }
+        else:
+            vectors, _ = generate_text_embeddings(list(missing.values()), model)
+            new_entries = {
+                key: vector for key, vector in zip(missing, vectors) if vector
+            }
+        with lock:
+            new_entries = {
+                key: vector for key, vector in new_entries.items() if key not in cache
+            }
+            append_embedding_cache(cache_dir, model, new_entries)
+            cache.update(
+                {
+                    key: np.asarray(vector, dtype=np.float32)
+                    for key, vector in new_entries.items()
+                }
+            )
+
+    with lock:
+        return [cache.get(key) for key in hashes]
+
+
+def create_reference_embeddings(
+    input_file: str, cache_dir: str, model: str = EMBEDDING_MODEL
+) -> str:
+    """
+    Generates embeddings for labeled complaints and stores them in the binary sidecar store.
+
+    The Excel file is left untouched and remains the human-readable source of the labels.
+    If the store already holds exactly the current rows, labels and texts it is reused
+    as-is; otherwise only new or edited complaints are sent to the embeddings API.
 
     Args:
         input_file (str): Path to the reference complaints dataset (Excel file).
+        cache_dir (str): Root directory of the persistent embedding cache.
+        model (str, optional): Embedding model name (see `parse_embedding_model`).
+
+    Returns:
+        str: Path to the written embedding matrix.
     """
     df = pd.read_excel(input_file)
+    hashes = [text_hash(text) for text in df["Complaint"]]
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        df["embeddings"] = list(executor.map(generate_text_embedding, df["Complaint"]))
+    store = load_embedding_store(input_file, model)
+    if store is not None:
+        stored_rows = [
+            (row["row_id"], row["label"], row.get("text_hash"))
+            for row in store[1]["rows"]
+        ]
+        current_rows = [
+            (row_id, str(label), key)
+            for row_id, label, key in zip(
+                df["ID"].tolist(), df["Issue_category_manual"].tolist(), hashes
+            )
+        ]
+        if stored_rows == current_rows:
+            print("Reference embeddings are up to date.")
+            return get_store_paths(input_file, model)[0]
 
-    df.to_excel(input_file, index=False)
+    embeddings = embed_texts_with_cache(
+        df["Complaint"].tolist(), cache_dir, model=model
+    )
+
+    matrix, valid_mask = normalize_embeddings(embeddings)
+    if not valid_mask.all():
+        print(
+            f"Warning: {int((~valid_mask).sum())} reference complaints could not be embedded and were skipped."
+        )
+
+    rows = [
+        {"row_id": row_id, "label": str(label), "text_hash": key}
+        for row_id, label, key, is_valid in zip(
+            df["ID"].tolist(), df["Issue_category_manual"].tolist(), hashes, valid_mask
+        )
+        if is_valid
+    ]
+    return write_embedding_store(input_file, model, matrix[valid_mask], rows)
@@ -0,0 +1,153 @@
+import os
+import json
+import hashlib
+import unicodedata
+import numpy as np
+from typing import Dict, Sequence
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes complaint text so that cosmetic differences do not produce a new cache entry.
+
+    Applies Unicode NFC normalization and collapses all runs of whitespace.
+
+    Args:
+        text (str): Raw complaint text.
+
+    Returns:
+        str: The normalized text.
+    """
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+def text_hash(text: str) -> str:
+    """
+    Returns the sha256 hex digest of the normalized text.
+
+    Args:
+        text (str): Raw complaint text.
+
+    Returns:
+        str: Hex digest used as the cache key.
+    """
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def _get_cache_paths(cache_dir: str, model: str) -> Dict[str, str]:
+    model_dir = os.path.join(cache_dir, model)
+    return {
+        "dir": model_dir,
+        "meta": os.path.join(model_dir, "meta.json"),
+        "keys": os.path.join(model_dir, "keys.txt"),
+        "vectors": os.path.join(model_dir, "vectors.f32"),
+    }
+
+
+def load_embedding_cache(cache_dir: str, model: str) -> Dict[str, np.ndarray]:
+    """
+    Loads the persistent embedding cache of a model.
+
+    Vectors are appended to a raw float32 file and their keys to a text file, one
+    sha256 digest per line in the same order. A row only counts once both its key
+    and its full vector are on disk, so an interrupted append is simply ignored.
+
+    Args:
+        cache_dir (str): Root directory of the embedding cache.
+        model (str): Name of the embedding model.
+
+    Returns:
+        Dict[str, np.ndarray]: Mapping from text hash to a read-only float32 vector.
+    """
+    paths = _get_cache_paths(cache_dir, model)
+    if not os.path.exists(paths["meta"]) or not os.path.exists(paths["keys"]):
+        return {}
+
+    with open(paths["meta"], "r", encoding="utf-8") as f:
+        dimensions = int(json.load(f)["dimensions"])
+    with open(paths["keys"], "r", encoding="utf-8") as f:
+        keys = [line.strip() for line in f if len(line.strip()) == 64]
+
+    if not keys or not os.path.exists(paths["vectors"]):
+        return {}
+    n_vectors = os.path.getsize(paths["vectors"]) // (4 * dimensions)
+    n_rows = min(len(keys), n_vectors)
+    if n_rows == 0:
+        return {}
+
+    vectors = np.memmap(
+        paths["vectors"], dtype=np.float32, mode="r", shape=(n_rows, dimensions)
+    )
+    return {key: vectors[row] for row, key in enumerate(keys[:n_rows])}
+
+
+def append_embedding_cache(
+    cache_dir: str, model: str, entries: Dict[str, Sequence[float]]
+) -> None:
+    """
+    Appends new embeddings to the persistent cache of a model.
+
+    Args:
+        cache_dir (str): Root directory of the embedding cache.
+        model (str): Name of the embedding model.
+        entries (Dict[str, Sequence[float]]): Mapping from text hash to embedding vector.
+    """
+    if not entries:
+        return
+
+    paths = _get_cache_paths(cache_dir, model)
+    os.makedirs(paths["dir"], exist_ok=True)
+
+    matrix = np.asarray(list(entries.values()), dtype=np.float32)
+    if os.path.exists(paths["meta"]):
+        with open(paths["meta"], "r", encoding="utf-8") as f:
+            dimensions = int(json.load(f)["dimensions"])
+        if matrix.shape[1] != dimensions:
+            raise ValueError(
+                f"Cannot add {matrix.shape[1]}-dimensional vectors to a {dimensions}-dimensional cache."
+            )
+    else:
+        with open(paths["meta"], "w", encoding="utf-8") as f:
+            json.dump({"model": model, "dimensions": int(matrix.shape[1])}, f)
+
+    _truncate_to_complete_rows(paths, matrix.shape[1])
+    with open(paths["vectors"], "ab") as f:
+        f.write(matrix.tobytes())
+    with open(paths["keys"], "a", encoding="utf-8") as f:
+        f.write("".join(f"{key}\n" for key in entries))
+
+
+def _truncate_to_complete_rows(paths: Dict[str, str], dimensions: int) -> None:
+    """
+    Drops a torn trailing key or vector left behind by an interrupted append.
+
+    Every key line takes 65 bytes, so a consistent cache is recognized from the file sizes
+    and the last byte of the keys file; only an inconsistent one is read and rewritten.
+    """
+    if not os.path.exists(paths["keys"]) or not os.path.exists(paths["vectors"]):
+        open(paths["keys"], "w", encoding="utf-8").close()
+        open(paths["vectors"], "wb").close()
+        return
+
+    row_bytes = 4 * dimensions
+    keys_size = os.path.getsize(paths["keys"])
+    vectors_size = os.path.getsize(paths["vectors"])
+    if keys_size % 65 == 0 and keys_size // 65 * row_bytes == vectors_size:
+        if keys_size == 0:
+            return
+        with open(paths["keys"], "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+
+    with open(paths["keys"], "r", encoding="utf-8") as f:
+        raw_keys = f.read()
+    keys = [line.strip() for line in raw_keys.splitlines() if len(line.strip()) == 64]
+    n_rows = min(len(keys), os.path.getsize(paths["vectors"]) // row_bytes)
+
+    if os.path.getsize(paths["vectors"]) != n_rows * row_bytes:
+        with open(paths["vectors"], "r+b") as f:
+            f.truncate(n_rows * row_bytes)
+    if len(keys) != n_rows or (raw_keys and not raw_keys.endswith("\n")):
+        with open(paths["keys"], "w", encoding="utf-8") as f:
+            f.write("".join(f"{key}\n" for key in keys[:n_rows]))
@@ -0,0 +1,240 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+STORE_VERSION = 1
+
+
+def normalize_embeddings(
+    embeddings: Sequence[Optional[Sequence[float]]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Stacks embeddings into a single float32 matrix with L2-normalized rows.
+
+    Missing embeddings (None or empty) become zero rows so that they never win a
+    similarity comparison.
+
+    Args:
+        embeddings (Sequence[Optional[Sequence[float]]]): Embedding vectors, one per row.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The normalized (n, d) float32 matrix and a
+        boolean mask marking the rows that had a valid embedding.
+    """
+    valid_mask = np.array(
+        [emb is not None and len(emb) > 0 for emb in embeddings], dtype=bool
+    )
+    if not valid_mask.any():
+        return np.zeros((len(embeddings), 0), dtype=np.float32), valid_mask
+
+    dimensions = len(embeddings[int(np.argmax(valid_mask))])
+    matrix = np.zeros((len(embeddings), dimensions), dtype=np.float32)
+    for row, emb in enumerate(embeddings):
+        if valid_mask[row]:
+            matrix[row] = np.asarray(emb, dtype=np.float32)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix, valid_mask
+
+
+def get_store_paths(reference_file: str, model: str) -> Tuple[str, str]:
+    """
+    Returns the paths of the embedding matrix and row index that sit beside a reference file.
+
+    The store is keyed by embedding model and format version, so vectors produced by
+    different models never get mixed up.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model used to produce the vectors.
+
+    Returns:
+        Tuple[str, str]: Paths to the `.npy` matrix and the JSON row index.
+    """
+    base_name = os.path.splitext(os.path.basename(reference_file))[0]
+    store_dir = os.path.join(
+        os.path.dirname(reference_file), f"{base_name}_embeddings"
+    )
+    stem = os.path.join(store_dir, f"{model}.v{STORE_VERSION}")
+    return f"{stem}.npy", f"{stem}.index.json"
+
+
+def write_embedding_store(
+    reference_file: str,
+    model: str,
+    matrix: np.ndarray,
+    rows: List[Dict[str, Any]],
+) -> str:
+    """
+    Writes a normalized embedding matrix and its row index to the sidecar store.
+
+    Both files are written to temporary paths first and then moved into place, so a
+    reader never sees a half-written store.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model used to produce the vectors.
+        matrix (np.ndarray): (n, d) float32 matrix with L2-normalized rows.
+        rows (List[Dict[str, Any]]): One entry per matrix row with at least `row_id` and `label`.
+
+    Returns:
+        str: Path to the written `.npy` matrix.
+    """
+    if matrix.shape[0] != len(rows):
+        raise ValueError(
+            f"Embedding matrix has {matrix.shape[0]} rows but the index has {len(rows)} entries."
+        )
+
+    matrix_path, index_path = get_store_paths(reference_file, model)
+    os.makedirs(os.path.dirname(matrix_path), exist_ok=True)
+
+    tmp_matrix_path = f"{matrix_path}.tmp.npy"
+    np.save(tmp_matrix_path, np.ascontiguousarray(matrix, dtype=np.float32))
+
+    index = {
+        "version": STORE_VERSION,
+        "model": model,
+        "dimensions": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "count": len(rows),
+        "rows": rows,
+    }
+    tmp_index_path = f"{index_path}.tmp"
+    with open(tmp_index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, default=str)
+
+    os.replace(tmp_matrix_path, matrix_path)
+    os.replace(tmp_index_path, index_path)
+    return matrix_path
+
+
+def load_embedding_store(
+    reference_file: str, model: str
+) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+    """
+    Opens the sidecar store of a reference file with the matrix memory-mapped read-only.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model used to produce the vectors.
+
+    Returns:
+        Optional[Tuple[np.ndarray, Dict[str, Any]]]: The memory-mapped matrix and the row
+        index, or None if no valid store exists for this model and version.
+    """
+    matrix_path, index_path = get_store_paths(reference_file, model)
+    if not os.path.exists(matrix_path) or not os.path.exists(index_path):
+        return None
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except json.JSONDecodeError as e:
+        print(f"Error reading embedding store index '{index_path}': {e}")
+        return None
+
+    if index.get("version") != STORE_VERSION or index.get("model") != model:
+        return None
+
+    matrix = np.load(matrix_path, mmap_mode="r")
+    if matrix.shape[0] != index.get("count"):
+        print(f"Embedding store '{matrix_path}' does not match its index, ignoring it.")
+        return None
+    return matrix, index
+
+
+def load_store_row_keys(reference_file: str, model: str) -> List[str]:
+    """
+    Returns a key identifying the content of every row of the store, in row order.
+
+    The key combines the row id and the text hash, so it changes whenever a reference
+    complaint is edited, even if its id stays the same.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model used to produce the vectors.
+
+    Returns:
+        List[str]: One key per store row, or an empty list if no store exists.
+    """
+    store = load_embedding_store(reference_file, model)
+    if store is None:
+        return []
+    return [f"{row['row_id']}:{row.get('text_hash', '')}" for row in store[1]["rows"]]
+
+
+def get_store_fingerprint(reference_file: str, model: str) -> str:
+    """
+    Returns a hash of the ids, texts and labels of all rows of the store, which changes
+    whenever a reference complaint is added, removed, edited or relabelled.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model used to produce the vectors.
+
+    Returns:
+        str: The fingerprint, or an empty string if no store exists.
+    """
+    store = load_embedding_store(reference_file, model)
+    if store is None:
+        return ""
+    digest = hashlib.sha256()
+    for row in store[1]["rows"]:
+        key = f"{row['row_id']}:{row.get('text_hash', '')}:{row['label']}\n"
+        digest.update(key.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _get_active_model_path(reference_file: str) -> str:
+    store_dir = os.path.dirname(get_store_paths(reference_file, "")[0])
+    return os.path.join(store_dir, "active_model.json")
+
+
+def get_active_embedding_model(reference_file: str, default: str) -> str:
+    """
+    Returns the embedding model whose store classification of a reference file uses.
+
+    Stores of several models can sit beside the same reference file, for example while
+    the references are migrated to a new model. Only the model recorded as active is
+    queried; without a record the default model is used.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        default (str): Model used when no active model has been recorded.
+
+    Returns:
+        str: Name of the active embedding model.
+    """
+    path = _get_active_model_path(reference_file)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["model"]
+    except (json.JSONDecodeError, KeyError) as e:
+        print(f"Error reading active embedding model '{path}': {e}")
+        return default
+
+
+def set_active_embedding_model(reference_file: str, model: str) -> None:
+    """
+    Switches classification of a reference file over to the store of another model.
+
+    The record is replaced atomically, so readers see either the old or the new model.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model to activate; its store must exist.
+    """
+    if load_embedding_store(reference_file, model) is None:
+        raise FileNotFoundError(
+            f"Error: No '{model}' embedding store found for '{reference_file}'."
+        )
+    path = _get_active_model_path(reference_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump({"model": model}, f)
+    os.replace(f"{path}.tmp", path)
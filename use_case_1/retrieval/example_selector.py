@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional
+
+from llm.llm_engine import (
+    count_tokens,
+    count_tokens_batch,
+    format_few_shot_example,
+    get_few_shot_instructions,
+)
+from retrieval.embedder import EMBEDDING_MODEL, create_reference_embeddings
+from retrieval.embedding_store import (
+    get_active_embedding_model,
+    get_store_fingerprint,
+    load_embedding_store,
+)
+
+
+DYNAMIC_EXAMPLES_K = 8
+DYNAMIC_PROMPT_TOKEN_BUDGET = 4000
+EXAMPLE_QUERY_BLOCK_SIZE = 1024
+
+
+def load_example_pool(reference_file: str, cache_dir: str) -> Dict[str, Any]:
+    """
+    Loads the labelled reference complaints that few-shot examples are selected from.
+
+    The pool shares the reference embedding store of vector-embedding classification; only
+    the complaint texts are read from the reference file, matched to the store rows by ID.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        cache_dir (str): Root directory of the persistent embedding cache.
+
+    Returns:
+        Dict[str, Any]: The embedding `model`, the store `fingerprint`, the normalized
+        reference `matrix`, the `texts` and `labels` of its rows, the prompt `tokens` of
+        every row formatted as an example, the row positions of every category in
+        `category_rows` and the `instruction_tokens` of the prompt.
+    """
+    model = get_active_embedding_model(reference_file, EMBEDDING_MODEL)
+    create_reference_embeddings(reference_file, cache_dir, model)
+    matrix, index = load_embedding_store(reference_file, model)
+
+    df = pd.read_excel(reference_file)
+    texts_by_id = dict(zip(df["ID"].tolist(), df["Complaint"].astype(str).tolist()))
+    texts = [texts_by_id.get(row["row_id"], "") for row in index["rows"]]
+    labels = np.asarray([row["label"] for row in index["rows"]], dtype=object)
+
+    tokens = np.asarray(
+        count_tokens_batch(
+            [
+                format_few_shot_example(0, text, label)
+                for text, label in zip(texts, labels)
+            ]
+        ),
+        dtype=np.int64,
+    )
+    available = np.asarray([bool(text) for text in texts])
+    category_rows = {
+        category: np.flatnonzero((labels == category) & available)
+        for category in np.unique(labels[available])
+    }
+    return {
+        "model": model,
+        "fingerprint": get_store_fingerprint(reference_file, model),
+        "matrix": np.asarray(matrix, dtype=np.float32),
+        "texts": texts,
+        "labels": labels,
+        "tokens": tokens,
+        "available": available,
+        "category_rows": category_rows,
+        "instruction_tokens": count_tokens(get_few_shot_instructions()),
+    }
+
+
+def select_examples(
+    query_matrix: np.ndarray,
+    pool: Dict[str, Any],
+    k: int = DYNAMIC_EXAMPLES_K,
+    token_budget: int = DYNAMIC_PROMPT_TOKEN_BUDGET,
+    query_tokens: Optional[List[int]] = None,
+) -> List[List[int]]:
+    """
+    Selects the most similar labelled examples for every complaint.
+
+    Every category contributes its most similar example, so the model always sees each
+    label at least once. The remaining slots, up to `k` examples in total, are filled with
+    the most similar examples of any category, as long as the prompt stays within
+    `token_budget`; examples that do not fit are skipped in favour of shorter ones. A larger
+    budget therefore buys more examples, a smaller one fewer, down to the per-category floor.
+
+    Args:
+        query_matrix (np.ndarray): (n, d) normalized complaint embeddings.
+        pool (Dict[str, Any]): Example pool from `load_example_pool`.
+        k (int, optional): Maximum number of examples per complaint.
+        token_budget (int, optional): Maximum prompt tokens per request, including the
+            instructions and the complaint.
+        query_tokens (Optional[List[int]]): Tokens of every complaint, subtracted from the budget.
+
+    Returns:
+        List[List[int]]: Pool row positions of the examples of every complaint, ordered
+        from least to most similar so the closest example sits next to the complaint.
+    """
+    reference_matrix = pool["matrix"]
+    example_tokens = pool["tokens"]
+    n_candidates = min(len(reference_matrix), k + len(pool["category_rows"]))
+    selections = []
+
+    for start in range(0, len(query_matrix), EXAMPLE_QUERY_BLOCK_SIZE):
+        scores = (
+            np.asarray(
+                query_matrix[start : start + EXAMPLE_QUERY_BLOCK_SIZE], dtype=np.float32
+            )
+            @ reference_matrix.T
+        )
+        scores[:, ~pool["available"]] = -np.inf
+        floors = np.stack(
+            [
+                rows[np.argmax(scores[:, rows], axis=1)]
+                for rows in pool["category_rows"].values()
+            ],
+            axis=1,
+        )
+        candidates = np.argpartition(-scores, n_candidates - 1, axis=1)[
+            :, :n_candidates
+        ]
+
+        for row, query_scores in enumerate(scores):
+            budget = token_budget - pool["instruction_tokens"]
+            if query_tokens is not None:
+                budget -= query_tokens[start + row]
+
+            selected = list(floors[row])
+            budget -= int(example_tokens[selected].sum())
+            ranked = candidates[row][np.argsort(-query_scores[candidates[row]])]
+            for candidate in ranked:
+                if len(selected) >= k:
+                    break
+                if candidate in selected or not np.isfinite(query_scores[candidate]):
+                    continue
+                if example_tokens[candidate] <= budget:
+                    selected.append(candidate)
+                    budget -= int(example_tokens[candidate])
+
+            selected.sort(key=lambda position: query_scores[position])
+            selections.append([int(position) for position in selected])
+    return selections
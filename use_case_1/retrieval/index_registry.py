@@ -0,0 +1,180 @@
+import os
+import time
+import threading
+import collections
+import numpy as np
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+
+DEFAULT_REGISTRY_MAX_BYTES = 2 * 1024**3
+
+
+def discover_reference_indexes(directory: str) -> Dict[str, str]:
+    """
+    Finds the reference files of all institutions in a directory.
+
+    Every Excel file is the labelled reference set of one institution, named after the
+    file, e.g. "bank_a.xlsx" holds the references of "bank_a".
+
+    Args:
+        directory (str): Directory with one reference Excel file per institution.
+
+    Returns:
+        Dict[str, str]: Mapping from institution name to reference file path.
+    """
+    return {
+        os.path.splitext(filename)[0]: os.path.join(directory, filename)
+        for filename in sorted(os.listdir(directory))
+        if filename.endswith(".xlsx") and not filename.startswith("~$")
+    }
+
+
+def _materialize(value: Any) -> Any:
+    """
+    Copies memory-mapped arrays of a loaded index into memory, so the bytes counted for it
+    are actually resident and released when it is evicted.
+    """
+    if isinstance(value, np.memmap):
+        return np.array(value)
+    if isinstance(value, dict):
+        return {key: _materialize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_materialize(item) for item in value]
+    return value
+
+
+def index_nbytes(value: Any) -> int:
+    """
+    Returns the total size of the NumPy arrays held by a loaded index.
+    """
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return sum(index_nbytes(item) for item in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(index_nbytes(item) for item in value)
+    return 0
+
+
+def create_index_registry(
+    reference_files: Dict[str, str],
+    load_index: Callable[[str], Dict[str, Any]],
+    max_bytes: int = DEFAULT_REGISTRY_MAX_BYTES,
+    current_version: Optional[Callable[[str], Any]] = None,
+    version_check_seconds: float = 0.0,
+) -> SimpleNamespace:
+    """
+    Creates a registry of named reference indexes that are loaded on first use and kept
+    resident up to a memory cap.
+
+    An index is loaded with `load_index` the first time its name is requested. When the
+    resident indexes would exceed `max_bytes`, the least recently used ones are evicted; an
+    evicted index is loaded again on its next request. Concurrent requests for the same
+    index load it once, while other indexes stay available.
+
+    With `current_version`, every index is stored with the version of its reference file
+    it was loaded for, e.g. the active embedding model, and is loaded again once that
+    version changes. The version is checked at most every `version_check_seconds`.
+
+    Args:
+        reference_files (Dict[str, str]): Mapping from index name to reference file.
+        load_index (Callable[[str], Dict[str, Any]]): Loads the index of a reference file,
+            e.g. `load_embedding_classifier` with fixed settings.
+        max_bytes (int, optional): Memory cap of the resident indexes.
+        current_version (Optional[Callable[[str], Any]]): Returns the version of a
+            reference file an index depends on.
+        version_check_seconds (float, optional): Minimum interval between two version
+            checks of the same index.
+
+    Returns:
+        SimpleNamespace: Object with `get(name)`, `names`, `resident()`, `stats` (hits,
+        misses, loads, evictions, resident indexes and bytes) and `reset_stats()`.
+    """
+    resident = collections.OrderedDict()
+    loading_locks: Dict[str, threading.Lock] = {}
+    versions = {}
+    lock = threading.Lock()
+    stats = {}
+
+    def reset_stats():
+        with lock:
+            stats.update({"hits": 0, "misses": 0, "loads": 0, "evictions": 0})
+            stats["resident_indexes"] = len(resident)
+            stats["resident_bytes"] = sum(entry[1] for entry in resident.values())
+
+    def lookup(name):
+        entry = resident.get(name)
+        if entry is not None:
+            resident.move_to_end(name)
+        return entry
+
+    def active_version(name):
+        if current_version is None:
+            return None
+        with lock:
+            cached = versions.get(name)
+        if cached and time.monotonic() - cached[1] < version_check_seconds:
+            return cached[0]
+        version = current_version(reference_files[name])
+        with lock:
+            versions[name] = (version, time.monotonic())
+        return version
+
+    def get(name: str) -> Dict[str, Any]:
+        if name not in reference_files:
+            raise KeyError(f"Unknown reference index '{name}'.")
+        version = active_version(name)
+        with lock:
+            entry = lookup(name)
+            if entry is not None and entry[2] == version:
+                stats["hits"] += 1
+                return entry[0]
+            stats["misses"] += 1
+            loading_lock = loading_locks.setdefault(name, threading.Lock())
+
+        with loading_lock:
+            with lock:
+                entry = lookup(name)
+                if entry is not None and entry[2] != version:
+                    resident.pop(name)
+                    stats["resident_bytes"] -= entry[1]
+                    stats["resident_indexes"] = len(resident)
+                    print(
+                        f"Reloading reference index '{name}' for version '{version}'."
+                    )
+                    entry = None
+            if entry is not None:
+                return entry[0]
+
+            index = _materialize(load_index(reference_files[name]))
+            size = index_nbytes(index)
+            with lock:
+                while resident and stats["resident_bytes"] + size > max_bytes:
+                    evicted, (_, evicted_size, _) = resident.popitem(last=False)
+                    stats["resident_bytes"] -= evicted_size
+                    stats["evictions"] += 1
+                    print(f"Evicted reference index '{evicted}'.")
+                if size > max_bytes:
+                    print(
+                        f"Warning: reference index '{name}' ({size / 2**20:.1f} MiB) exceeds "
+                        f"the registry cap of {max_bytes / 2**20:.1f} MiB."
+                    )
+                resident[name] = (index, size, version)
+                stats["loads"] += 1
+                stats["resident_bytes"] += size
+                stats["resident_indexes"] = len(resident)
+            return index
+
+    def resident_names():
+        with lock:
+            return list(resident)
+
+    reset_stats()
+    return SimpleNamespace(
+        get=get,
+        names=sorted(reference_files),
+        resident=resident_names,
+        stats=stats,
+        reset_stats=reset_stats,
+    )
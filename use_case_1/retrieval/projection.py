@@ -0,0 +1,100 @@
+import os
+import numpy as np
+from typing import Dict
+
+
+PCA_BLOCK_SIZE = 8192
+
+
+def fit_pca_projection(matrix: np.ndarray, dimensions: int) -> Dict[str, np.ndarray]:
+    """
+    Fits a PCA projection of normalized embeddings onto their top principal components.
+
+    The covariance is accumulated block by block, so the matrix may be memory-mapped and
+    larger than memory; only a (d, d) matrix is held at once.
+
+    Args:
+        matrix (np.ndarray): (n, d) normalized embeddings to fit on, e.g. the reference store.
+        dimensions (int): Number of principal components kept.
+
+    Returns:
+        Dict[str, np.ndarray]: The `mean` (d,), the `components` (d, dimensions) and the
+        `explained_variance_ratio` of every kept component.
+    """
+    n_rows, n_columns = matrix.shape
+    if not 0 < dimensions <= min(n_rows, n_columns):
+        raise ValueError(
+            f"Cannot project {n_rows} {n_columns}-dimensional embeddings onto {dimensions} components."
+        )
+
+    total = np.zeros(n_columns, dtype=np.float64)
+    gram = np.zeros((n_columns, n_columns), dtype=np.float64)
+    for start in range(0, n_rows, PCA_BLOCK_SIZE):
+        block = np.asarray(matrix[start : start + PCA_BLOCK_SIZE], dtype=np.float64)
+        total += block.sum(axis=0)
+        gram += block.T @ block
+    mean = total / n_rows
+    covariance = gram / n_rows - np.outer(mean, mean)
+
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+    order = np.argsort(eigenvalues)[::-1][:dimensions]
+    eigenvalues = np.clip(eigenvalues, 0, None)
+    return {
+        "mean": mean.astype(np.float32),
+        "components": eigenvectors[:, order].astype(np.float32),
+        "explained_variance_ratio": (
+            eigenvalues[order] / max(eigenvalues.sum(), 1e-12)
+        ).astype(np.float32),
+    }
+
+
+def project_embeddings(
+    matrix: np.ndarray, projection: Dict[str, np.ndarray]
+) -> np.ndarray:
+    """
+    Projects embeddings with a fitted PCA projection and L2-normalizes the result.
+
+    Rows that are all zeros (missing embeddings) stay all zeros.
+
+    Args:
+        matrix (np.ndarray): (n, d) embeddings.
+        projection (Dict[str, np.ndarray]): Projection from `fit_pca_projection`.
+
+    Returns:
+        np.ndarray: (n, dimensions) normalized float32 embeddings.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    projected = (matrix - projection["mean"]) @ projection["components"]
+    projected[~matrix.any(axis=1)] = 0.0
+    norms = np.linalg.norm(projected, axis=1, keepdims=True)
+    np.divide(projected, norms, out=projected, where=norms > 0)
+    return projected
+
+
+def get_projection_path(cache_dir: str, model: str) -> str:
+    """
+    Returns the path of the PCA projection of an embedding model, kept with its cache.
+    """
+    return os.path.join(cache_dir, model, "projection.npz")
+
+
+def save_projection(path: str, projection: Dict[str, np.ndarray]) -> None:
+    """
+    Saves a fitted projection; a projection is fitted once and then never changes, since
+    cached and stored vectors of its model depend on it.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(f"{path}.tmp.npz", **projection)
+    os.replace(f"{path}.tmp.npz", path)
+
+
+def load_projection(path: str) -> Dict[str, np.ndarray]:
+    """
+    Loads a projection saved with `save_projection`.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"Error: No PCA projection found at '{path}'. Fit it with scripts.migrate_embeddings first."
+        )
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
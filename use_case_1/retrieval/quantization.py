@@ -0,0 +1,117 @@
+import os
+import json
+import numpy as np
+from typing import Optional, Tuple
+
+from retrieval.embedding_store import get_store_fingerprint, get_store_paths
+
+
+PRECISIONS = ("float32", "float16", "int8")
+QUANTIZATION_BLOCK_SIZE = 8192
+
+
+def quantize_embeddings(
+    matrix: np.ndarray, precision: str = "float32"
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Converts a normalized embedding matrix to a compact storage precision.
+
+    "float16" halves the memory of float32. "int8" quarters it: every row is divided by its
+    own scale (its largest absolute component / 127) and rounded, so each vector uses the
+    full int8 range regardless of how its values are distributed.
+
+    Args:
+        matrix (np.ndarray): (n, d) normalized float32 embeddings; may be memory-mapped.
+        precision (str, optional): "float32", "float16" or "int8". Defaults to "float32".
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The stored vectors and, for "int8", the
+        (n,) float32 per-vector scales (None otherwise).
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unsupported embedding precision: '{precision}'")
+    if precision == "float32":
+        return np.asarray(matrix, dtype=np.float32), None
+    if precision == "float16":
+        return np.asarray(matrix, dtype=np.float16), None
+
+    vectors = np.empty(matrix.shape, dtype=np.int8)
+    scales = np.empty(matrix.shape[0], dtype=np.float32)
+    for start in range(0, matrix.shape[0], QUANTIZATION_BLOCK_SIZE):
+        block = np.asarray(
+            matrix[start : start + QUANTIZATION_BLOCK_SIZE], dtype=np.float32
+        )
+        block_scales = np.abs(block).max(axis=1) / 127.0
+        block_scales[block_scales == 0] = 1.0
+        vectors[start : start + len(block)] = np.rint(block / block_scales[:, None])
+        scales[start : start + len(block)] = block_scales
+    return vectors, scales
+
+
+def dequantize_embeddings(
+    vectors: np.ndarray, scales: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Returns float32 embeddings from stored vectors and their optional per-vector scales.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if scales is not None:
+        matrix = matrix * np.asarray(scales, dtype=np.float32)[:, None]
+    return matrix
+
+
+def _get_quantized_store_paths(
+    reference_file: str, model: str, precision: str
+) -> Tuple[str, str, str]:
+    matrix_path, _ = get_store_paths(reference_file, model)
+    stem = f"{matrix_path[: -len('.npy')]}.{precision}"
+    return f"{stem}.npy", f"{stem}.scales.npy", f"{stem}.json"
+
+
+def load_or_build_quantized_store(
+    reference_file: str, model: str, matrix: np.ndarray, precision: str
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Loads the reference embeddings in a compact precision, converting the float32 store once.
+
+    The converted vectors are saved beside the float32 store and memory-mapped, so workers
+    only keep the compact copy resident. They are tied to the store they were converted
+    from via its fingerprint (see `get_store_fingerprint`) and rebuilt when it changes
+    or, for "int8", when their scales are missing.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        model (str): Name of the embedding model of the store.
+        matrix (np.ndarray): The float32 store matrix (see `load_reference_store`).
+        precision (str): "float32", "float16" or "int8".
+
+    Returns:
+        Tuple[np.ndarray, Optional[np.ndarray]]: The reference vectors and, for "int8",
+        their per-vector scales.
+    """
+    if precision == "float32":
+        return matrix, None
+
+    vectors_path, scales_path, meta_path = _get_quantized_store_paths(
+        reference_file, model, precision
+    )
+    fingerprint = get_store_fingerprint(reference_file, model)
+    if os.path.exists(vectors_path) and os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        scales_missing = precision == "int8" and not os.path.exists(scales_path)
+        if meta.get("store_fingerprint") == fingerprint and not scales_missing:
+            scales = np.load(scales_path) if precision == "int8" else None
+            return np.load(vectors_path, mmap_mode="r"), scales
+
+    vectors, scales = quantize_embeddings(matrix, precision)
+    np.save(vectors_path, vectors)
+    if scales is not None:
+        np.save(scales_path, scales)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"store_fingerprint": fingerprint, "precision": precision}, f)
+    print(
+        f"Converted {len(vectors)} reference embeddings to {precision} "
+        f"({vectors.nbytes / 2**20:.1f} MiB instead of {len(vectors) * vectors.shape[1] * 4 / 2**20:.1f} MiB)."
+    )
+    return np.load(vectors_path, mmap_mode="r"), scales
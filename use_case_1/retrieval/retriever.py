@@ -1,27 +1,59 @@
 import os
-import pandas as pd
 import numpy as np
-import concurrent.futures
-from typing import List, Optional
-from retrieval.embedder import generate_text_embedding
+from typing import Any, Dict, List, Optional, Tuple
+from retrieval.embedder import EMBEDDING_MODEL, embed_texts_with_cache
+from retrieval.embedding_store import load_embedding_store, normalize_embeddings
+from utils.chunked_io import (
+    CHUNK_SIZE,
+    append_result_chunk,
+    discard_partial_results,
+    finalize_results,
+    iter_complaint_chunks,
+)
+from utils.deduplication import assign_duplicate_clusters
+from utils.journal import (
+    apply_journal,
+    close_journal,
+    open_journal,
+    pending_rows,
+    record_results,
+)
+from retrieval.ann_index import DEFAULT_N_PROBE, search_ivf_index
+from retrieval.category_index import (
+    classify_by_centroid,
+    classify_by_medoids,
+    vote_top_k,
+)
 
 
-def load_reference_data_with_embeddings(file_path: str) -> pd.DataFrame:
+QUERY_BLOCK_SIZE = 1024
+REFERENCE_BLOCK_SIZE = 8192
+MARGIN_TOP_K = 10
+KNN_TOP_K = 5
+
+
+def load_reference_store(
+    reference_file: str, model: str = EMBEDDING_MODEL
+) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Loads the reference dataset and converts stored embedding strings back into NumPy arrays.
+    Memory-maps the reference embedding store and returns it together with the category labels.
 
     Args:
-        file_path (str): Path to the Excel file containing reference complaints.
+        reference_file (str): Path to the Excel file containing reference complaints.
+        model (str, optional): Embedding model of the store.
 
     Returns:
-        pd.DataFrame: DataFrame with complaint text and corresponding embeddings.
+        Tuple[np.ndarray, np.ndarray]: The read-only (n, d) normalized reference matrix
+        and the category label of every row.
     """
-    df = pd.read_excel(file_path)
-    if isinstance(df["embeddings"][0], str):
-        df["embeddings"] = df["embeddings"].apply(
-            lambda x: np.array(eval(x), dtype=float)
+    store = load_embedding_store(reference_file, model)
+    if store is None:
+        raise FileNotFoundError(
+            f"Error: No '{model}' embedding store found for '{reference_file}'."
         )
-    return df
+    reference_matrix, index = store
+    reference_labels = np.asarray([row["label"] for row in index["rows"]], dtype=object)
+    return reference_matrix, reference_labels
 
 
 def compute_cosine_similarity(
@@ -44,37 +76,286 @@ def compute_cosine_similarity(
     )
 
 
+def _top_k_per_row(scores: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the top-k scores of every row in descending order together with their column indices.
+    """
+    if top_k == 1:
+        columns = np.argmax(scores, axis=1)[:, None]
+    elif top_k >= scores.shape[1]:
+        columns = np.argsort(-scores, axis=1)[:, :top_k]
+    else:
+        columns = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        order = np.argsort(-np.take_along_axis(scores, columns, axis=1), axis=1)
+        columns = np.take_along_axis(columns, order, axis=1)
+    return np.take_along_axis(scores, columns, axis=1), columns
+
+
+def search_reference_matrix(
+    query_matrix: np.ndarray,
+    reference_matrix: np.ndarray,
+    top_k: int = 1,
+    query_block_size: int = QUERY_BLOCK_SIZE,
+    reference_block_size: int = REFERENCE_BLOCK_SIZE,
+    reference_scales: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the top-k most similar references for every query row using blocked matrix multiplication.
+
+    Both matrices are expected to hold L2-normalized rows, so the dot product equals the
+    cosine similarity. Queries and references are processed in blocks, which bounds the
+    working set to one (query_block_size x reference_block_size) score matrix regardless
+    of how many complaints or references there are. The reference matrix may be a
+    memory-mapped array, stored as float32, float16 or per-vector-scaled int8 (see
+    `quantize_embeddings`); each block is converted to float32 only while it is scored.
+
+    Args:
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        reference_matrix (np.ndarray): (n_references, d) normalized reference embeddings.
+        top_k (int, optional): Number of neighbours to return per query. Defaults to 1.
+        query_block_size (int, optional): Number of query rows scored per block.
+        reference_block_size (int, optional): Number of reference rows scored per block.
+        reference_scales (Optional[np.ndarray]): Per-vector scales of an int8 reference matrix.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (n_queries, top_k) reference indices and the
+        corresponding cosine similarities, both sorted by descending similarity.
+    """
+    n_queries = query_matrix.shape[0]
+    n_references = reference_matrix.shape[0]
+    top_k = max(1, min(top_k, n_references))
+
+    best_indices = np.full((n_queries, top_k), -1, dtype=np.int64)
+    best_scores = np.full((n_queries, top_k), -np.inf, dtype=np.float32)
+    if n_references == 0:
+        return best_indices, best_scores
+
+    for q_start in range(0, n_queries, query_block_size):
+        q_end = min(q_start + query_block_size, n_queries)
+        query_block = np.asarray(query_matrix[q_start:q_end], dtype=np.float32)
+        block_scores = best_scores[q_start:q_end]
+        block_indices = best_indices[q_start:q_end]
+
+        for r_start in range(0, n_references, reference_block_size):
+            r_end = min(r_start + reference_block_size, n_references)
+            reference_block = np.asarray(
+                reference_matrix[r_start:r_end], dtype=np.float32
+            )
+            similarities = query_block @ reference_block.T
+            if reference_scales is not None:
+                similarities *= reference_scales[r_start:r_end]
+            candidate_scores, candidate_columns = _top_k_per_row(
+                similarities, min(top_k, r_end - r_start)
+            )
+
+            merged_scores = np.concatenate([block_scores, candidate_scores], axis=1)
+            merged_indices = np.concatenate(
+                [block_indices, candidate_columns + r_start], axis=1
+            )
+            top_scores, selected = _top_k_per_row(merged_scores, top_k)
+            block_scores[:] = top_scores
+            block_indices[:] = np.take_along_axis(merged_indices, selected, axis=1)
+
+    return best_indices, best_scores
+
+
+def classify_with_margin(
+    query_matrix: np.ndarray,
+    reference_matrix: np.ndarray,
+    reference_labels: np.ndarray,
+    top_k: int = MARGIN_TOP_K,
+    reference_scales: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Assigns every query the category of its nearest reference and measures how clear-cut that is.
+
+    The margin is the similarity of the nearest reference minus the similarity of the
+    nearest reference with a different category among the top-k neighbours. If all top-k
+    neighbours share the category, the k-th similarity is used, which underestimates the
+    true margin and therefore errs on the side of escalation.
+
+    Args:
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        reference_matrix (np.ndarray): (n_references, d) normalized reference embeddings.
+        reference_labels (np.ndarray): Category label of every reference row.
+        top_k (int, optional): Number of neighbours inspected for the runner-up category.
+        reference_scales (Optional[np.ndarray]): Per-vector scales of an int8 reference matrix.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The assigned category and the similarity margin of
+        every query.
+    """
+    best_indices, best_scores = search_reference_matrix(
+        query_matrix, reference_matrix, top_k=top_k, reference_scales=reference_scales
+    )
+    neighbour_labels = reference_labels[best_indices]
+    categories = neighbour_labels[:, 0]
+
+    differs = neighbour_labels != categories[:, None]
+    has_runner_up = differs.any(axis=1)
+    runner_up = np.where(has_runner_up, differs.argmax(axis=1), best_scores.shape[1] - 1)
+    runner_up_scores = np.take_along_axis(best_scores, runner_up[:, None], axis=1)[:, 0]
+    margins = best_scores[:, 0] - runner_up_scores
+    return categories, margins
+
+
+def classify_query_matrix(
+    query_matrix: np.ndarray,
+    reference_matrix: np.ndarray,
+    reference_labels: np.ndarray,
+    mode: str = "nearest",
+    category_index: Optional[Dict[str, Any]] = None,
+    top_k: int = KNN_TOP_K,
+    ann_index: Optional[Dict[str, Any]] = None,
+    n_probe: int = DEFAULT_N_PROBE,
+    reference_scales: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Assigns a category to every query row with the selected classification mode.
+
+    Args:
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        reference_matrix (np.ndarray): (n_references, d) normalized reference embeddings.
+        reference_labels (np.ndarray): Category label of every reference row.
+        mode (str, optional): "nearest" (single most similar reference), "knn"
+            (similarity-weighted top-k vote), "centroid" or "medoid". Defaults to "nearest".
+        category_index (Optional[Dict[str, Any]]): Category index, required for the
+            "centroid" and "medoid" modes.
+        top_k (int, optional): Number of neighbours voting in "knn" mode.
+        ann_index (Optional[Dict[str, Any]]): IVF index replacing the brute-force search
+            in "nearest" and "knn" modes.
+        n_probe (int, optional): Number of IVF lists scanned per query.
+        reference_scales (Optional[np.ndarray]): Per-vector scales of an int8 reference matrix.
+
+    Returns:
+        np.ndarray: The assigned category of every query.
+    """
+
+    def search(k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if ann_index is not None:
+            return search_ivf_index(ann_index, query_matrix, top_k=k, n_probe=n_probe)
+        return search_reference_matrix(
+            query_matrix, reference_matrix, top_k=k, reference_scales=reference_scales
+        )
+
+    if mode == "centroid":
+        categories, _ = classify_by_centroid(query_matrix, category_index)
+    elif mode == "medoid":
+        categories, _ = classify_by_medoids(query_matrix, category_index)
+    elif mode == "knn":
+        neighbour_indices, neighbour_scores = search(top_k)
+        categories, _ = vote_top_k(
+            np.maximum(neighbour_indices, 0),
+            np.where(neighbour_indices >= 0, neighbour_scores, 0),
+            reference_labels,
+        )
+    else:
+        best_indices, _ = search(1)
+        categories = np.where(
+            best_indices[:, 0] >= 0, reference_labels[best_indices[:, 0]], ""
+        )
+    return categories
+
+
 def categorize_complaints(
-    reference_df: pd.DataFrame, uncategorized_file: str, output_path: str
+    reference_matrix: np.ndarray,
+    reference_labels: np.ndarray,
+    uncategorized_file: str,
+    output_path: str,
+    cache_dir: str,
+    mode: str = "nearest",
+    category_index: Optional[Dict[str, Any]] = None,
+    top_k: int = KNN_TOP_K,
+    ann_index: Optional[Dict[str, Any]] = None,
+    n_probe: int = DEFAULT_N_PROBE,
+    chunk_size: int = CHUNK_SIZE,
+    deduplicate: bool = False,
+    reference_scales: Optional[np.ndarray] = None,
+    model: str = EMBEDDING_MODEL,
+    reference_fingerprint: str = "",
 ) -> None:
     """
     Classifies complaints in the uncategorized dataset by comparing their embeddings to reference embeddings.
 
     Args:
-        reference_df (pd.DataFrame): DataFrame containing labeled complaints and their embeddings.
-        uncategorized_file (str): Path to the Excel file containing uncategorized complaints.
+        reference_matrix (np.ndarray): Normalized reference embeddings (see `load_reference_store`).
+        reference_labels (np.ndarray): Category label of every reference row.
+        uncategorized_file (str): Path to the file (.xlsx, .csv or .parquet) containing uncategorized complaints.
+        output_path (str): Directory where the categorized output file will be saved.
+        cache_dir (str): Root directory of the persistent embedding cache.
+        mode (str, optional): Classification mode, see `classify_query_matrix`.
+        category_index (Optional[Dict[str, Any]]): Category index for "centroid" and "medoid" modes.
+        top_k (int, optional): Number of neighbours voting in "knn" mode.
+        ann_index (Optional[Dict[str, Any]]): IVF index used instead of brute-force search.
+        n_probe (int, optional): Number of IVF lists scanned per query.
+        chunk_size (int, optional): Number of complaints embedded and classified per chunk.
+        deduplicate (bool, optional): Classify one representative per duplicate cluster.
+        reference_scales (Optional[np.ndarray]): Per-vector scales of an int8 reference matrix.
+        model (str, optional): Embedding model of the reference store; complaints are
+            embedded with the same model.
+        reference_fingerprint (str, optional): Fingerprint of the reference store (see
+            `get_store_fingerprint`), so a resumed run notices edited references.
     """
-    test_df = pd.read_excel(uncategorized_file)
+    output_file = os.path.join(
+        output_path, "output_classification_technique_3_vector_embeddings.xlsx"
+    )
+    discard_partial_results(output_file)
+    clusters = (
+        assign_duplicate_clusters(uncategorized_file, chunk_size)
+        if deduplicate
+        else None
+    )
+    journal = open_journal(
+        output_file,
+        uncategorized_file,
+        {
+            "technique": "vector-embedding",
+            "model": model,
+            "reference_rows": len(reference_labels),
+            "reference_store": reference_fingerprint,
+            "mode": mode,
+            "top_k": top_k,
+            "ann": ann_index is not None,
+            "n_probe": n_probe,
+            "deduplicate": deduplicate,
+            "precision": str(reference_matrix.dtype),
+        },
+    )
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        test_df["embedding"] = list(
-            executor.map(generate_text_embedding, test_df["Complaint"])
+    for chunk in iter_complaint_chunks(uncategorized_file, chunk_size):
+        pending = pending_rows(chunk, journal, clusters)
+        query_matrix, valid_mask = normalize_embeddings(
+            embed_texts_with_cache(
+                pending["Complaint"].astype(str).tolist(), cache_dir, model=model
+            )
         )
+        categories_assigned = np.full(len(pending), "", dtype=object)
+        if valid_mask.any():
+            categories_assigned[valid_mask] = classify_query_matrix(
+                query_matrix[valid_mask],
+                reference_matrix,
+                reference_labels,
+                mode=mode,
+                category_index=category_index,
+                top_k=top_k,
+                ann_index=ann_index,
+                n_probe=n_probe,
+                reference_scales=reference_scales,
+            )
 
-    reference_vectors = reference_df["embeddings"].tolist()
-    reference_categories = reference_df["Issue_category_manual"].tolist()
-
-    categories_assigned = []
-    for emb in test_df["embedding"]:
-        similarities = [
-            compute_cosine_similarity(emb, ref_emb) for ref_emb in reference_vectors
-        ]
-        best_match_index = np.argmax(similarities)
-        best_category = reference_categories[best_match_index]
-        categories_assigned.append(best_category)
-
-    test_df["category"] = categories_assigned
+        record_results(
+            output_file,
+            journal,
+            [
+                {"row": position, "category": category, "tier": "vector-embedding"}
+                for position, category in zip(pending.index, categories_assigned)
+                if category
+            ],
+        )
+        chunk = apply_journal(
+            chunk, journal, {"category": "category"}, clusters=clusters
+        )
+        append_result_chunk(output_file, chunk)
 
-    output_file = "output_classification_technique_3_vector_embeddings.xlsx"
-    output_file = os.path.join(output_path, "output_classification_technique_3_vector_embeddings.xlsx")
-    test_df.to_excel(output_file, index=False)
+    finalize_results(output_file)
+    close_journal(output_file)
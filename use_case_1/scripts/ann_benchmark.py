@@ -0,0 +1,162 @@
+import time
+import argparse
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from retrieval.ann_index import build_ivf_index, search_ivf_index
+from retrieval.embedding_store import load_embedding_store
+from retrieval.retriever import search_reference_matrix
+
+
+def recall_at_k(approximate_ids: np.ndarray, exact_ids: np.ndarray) -> float:
+    """
+    Computes the fraction of the exact top-k neighbours that the approximate search also returned.
+
+    Args:
+        approximate_ids (np.ndarray): (n_queries, k) ids returned by the ANN index.
+        exact_ids (np.ndarray): (n_queries, k) ids returned by brute force.
+
+    Returns:
+        float: Recall@k averaged over all queries.
+    """
+    hits = sum(
+        len(np.intersect1d(approximate, exact))
+        for approximate, exact in zip(approximate_ids, exact_ids)
+    )
+    return hits / exact_ids.size
+
+
+def benchmark_ann_index(
+    reference_matrix: np.ndarray,
+    query_matrix: np.ndarray,
+    top_k: int = 10,
+    n_probes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+    n_lists: Optional[int] = None,
+) -> List[Dict[str, float]]:
+    """
+    Compares recall@k and queries per second of the IVF index against brute-force search.
+
+    Args:
+        reference_matrix (np.ndarray): (n, d) normalized reference embeddings.
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        top_k (int, optional): Number of neighbours per query. Defaults to 10.
+        n_probes (Sequence[int], optional): IVF probe counts to evaluate.
+        n_lists (Optional[int]): Number of inverted lists. Defaults to about sqrt(n).
+
+    Returns:
+        List[Dict[str, float]]: One row per configuration with recall@k and queries per second.
+    """
+    start = time.perf_counter()
+    exact_ids, _ = search_reference_matrix(query_matrix, reference_matrix, top_k=top_k)
+    brute_force_seconds = time.perf_counter() - start
+    results = [
+        {
+            "method": "brute-force",
+            "n_probe": 0,
+            "recall_at_k": 1.0,
+            "queries_per_second": len(query_matrix) / brute_force_seconds,
+        }
+    ]
+
+    start = time.perf_counter()
+    index = build_ivf_index(reference_matrix, n_lists)
+    print(
+        f"Built IVF index with {len(index['centroids'])} lists in {time.perf_counter() - start:.2f}s"
+    )
+
+    for n_probe in n_probes:
+        if n_probe > len(index["centroids"]):
+            break
+        start = time.perf_counter()
+        approximate_ids, _ = search_ivf_index(
+            index, query_matrix, top_k=top_k, n_probe=n_probe
+        )
+        seconds = time.perf_counter() - start
+        results.append(
+            {
+                "method": "ivf",
+                "n_probe": n_probe,
+                "recall_at_k": recall_at_k(approximate_ids, exact_ids),
+                "queries_per_second": len(query_matrix) / seconds,
+            }
+        )
+    return results
+
+
+def generate_clustered_vectors(
+    n_rows: int,
+    dimensions: int,
+    n_clusters: int,
+    seed: int = 0,
+    return_labels: bool = False,
+):
+    """
+    Generates normalized vectors scattered around random cluster centres, resembling embedding data.
+
+    With `return_labels`, the cluster of every vector is returned as well.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(n_clusters, dimensions)).astype(np.float32)
+    clusters = rng.integers(n_clusters, size=n_rows)
+    vectors = centres[clusters] + 1.5 * rng.normal(size=(n_rows, dimensions)).astype(
+        np.float32
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    if return_labels:
+        return vectors, clusters
+    return vectors
+
+
+def main():
+    """
+    Benchmarks the IVF index on the reference embedding store or on synthetic clustered data.
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmark the ANN index against brute-force search."
+    )
+    parser.add_argument("--reference-file", help="Reference Excel file with a store.")
+    parser.add_argument("--model", default="text-embedding-ada-002")
+    parser.add_argument("--references", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--n-lists", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.reference_file:
+        store = load_embedding_store(args.reference_file, args.model)
+        if store is None:
+            print(f"No '{args.model}' embedding store found for {args.reference_file}")
+            return
+        reference_matrix = np.asarray(store[0], dtype=np.float32)
+        rng = np.random.default_rng(0)
+        query_matrix = reference_matrix[
+            rng.integers(len(reference_matrix), size=args.queries)
+        ] + 0.01 * rng.normal(size=(args.queries, reference_matrix.shape[1])).astype(
+            np.float32
+        )
+        query_matrix /= np.linalg.norm(query_matrix, axis=1, keepdims=True)
+    else:
+        n_clusters = max(1, args.references // 100)
+        data = generate_clustered_vectors(
+            args.references + args.queries, args.dimensions, n_clusters
+        )
+        reference_matrix, query_matrix = (
+            data[: args.references],
+            data[args.references :],
+        )
+
+    print(
+        f"{len(reference_matrix)} references, {len(query_matrix)} queries, top-{args.top_k}"
+    )
+    print(f"{'method':<12}{'n_probe':>8}{'recall@k':>10}{'queries/s':>12}")
+    for row in benchmark_ann_index(
+        reference_matrix, query_matrix, args.top_k, n_lists=args.n_lists
+    ):
+        print(
+            f"{row['method']:<12}{row['n_probe']:>8}{row['recall_at_k']:>10.3f}{row['queries_per_second']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import os
+import time
+import argparse
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import llm.llm_engine as llm_engine
+import retrieval.embedder as embedder
+from llm.benchmark_clients import (
+    create_metered_client,
+    create_recording_client,
+    create_stub_client,
+)
+from retrieval.embedding_store import normalize_embeddings
+from retrieval.retriever import classify_query_matrix
+from scripts.few_shot_classifier import classify_complaints_packed, get_category
+
+
+HELD_OUT_FRACTION = 0.25
+DEFAULT_SEED = 42
+TECHNIQUES = ["few-shot", "fine-tuning", "vector-embedding"]
+
+
+def split_training_data(
+    training_file: str,
+    held_out_fraction: float = HELD_OUT_FRACTION,
+    seed: int = DEFAULT_SEED,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Splits the labelled training data into a reference part and a held-out evaluation part,
+    stratified by category so every category is represented in both.
+
+    Args:
+        training_file (str): Excel file with "Complaint" and "Issue_category_manual" columns.
+        held_out_fraction (float, optional): Fraction of every category held out.
+        seed (int, optional): Random seed of the split.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Reference rows and held-out rows.
+    """
+    df = pd.read_excel(training_file).dropna(
+        subset=["Complaint", "Issue_category_manual"]
+    )
+    held_out = df.groupby("Issue_category_manual", group_keys=False).sample(
+        frac=held_out_fraction, random_state=seed
+    )
+    return df.drop(held_out.index), held_out
+
+
+def build_technique_classifier(
+    technique: str,
+    reference_df: pd.DataFrame,
+    packed: bool = False,
+    fine_tuned_model: str = "",
+) -> Callable[[List[str]], List[str]]:
+    """
+    Returns a function classifying a batch of complaints with one technique.
+
+    Vector-embedding classification uses the reference part of the split as its reference
+    set; its embeddings are computed here, before the timed run.
+
+    Args:
+        technique (str): "few-shot", "fine-tuning" or "vector-embedding".
+        reference_df (pd.DataFrame): Reference part of the split.
+        packed (bool, optional): Few-shot only: classify several complaints per request.
+        fine_tuned_model (str, optional): Fine-tuned model name.
+
+    Returns:
+        Callable[[List[str]], List[str]]: Batch classifier returning one label per complaint.
+    """
+    if technique == "few-shot":
+        if packed:
+            return classify_complaints_packed
+        return lambda complaints: [get_category(complaint) for complaint in complaints]
+
+    if technique == "fine-tuning":
+        return lambda complaints: [
+            llm_engine.get_category(complaint, fine_tuned_model)
+            for complaint in complaints
+        ]
+
+    vectors, _ = embedder.generate_text_embeddings(
+        reference_df["Complaint"].astype(str).tolist()
+    )
+    reference_matrix, valid_mask = normalize_embeddings(vectors)
+    reference_matrix = reference_matrix[valid_mask]
+    reference_labels = reference_df["Issue_category_manual"].to_numpy(dtype=object)[
+        valid_mask
+    ]
+
+    def classify_embedded(complaints):
+        vectors, _ = embedder.generate_text_embeddings(complaints)
+        query_matrix, valid_mask = normalize_embeddings(vectors)
+        categories = np.full(len(complaints), "", dtype=object)
+        if valid_mask.any():
+            categories[valid_mask] = classify_query_matrix(
+                query_matrix[valid_mask], reference_matrix, reference_labels
+            )
+        return categories.tolist()
+
+    return classify_embedded
+
+
+def run_benchmark(
+    classify_batch: Callable[[List[str]], List[str]],
+    complaints: Sequence[str],
+    labels: Sequence[str],
+    client: Any,
+    batch_size: int = 1,
+    concurrency: int = 1,
+) -> Dict[str, Any]:
+    """
+    Classifies the held-out complaints and measures accuracy, latency, throughput and usage.
+
+    Complaints are classified in batches of `batch_size`, with `concurrency` batches in
+    flight. The latency of a complaint is the time its batch took.
+
+    Args:
+        classify_batch (Callable[[List[str]], List[str]]): Batch classifier of a technique.
+        complaints (Sequence[str]): Held-out complaint texts.
+        labels (Sequence[str]): Their manual categories.
+        client (Any): Metered client from `create_metered_client` used by the technique.
+        batch_size (int, optional): Complaints per classification call. Defaults to 1.
+        concurrency (int, optional): Batches classified at the same time. Defaults to 1.
+
+    Returns:
+        Dict[str, Any]: Accuracy, p50/p95 latency in ms, complaints per second, and call
+        and token counts.
+    """
+    batches = [
+        list(range(start, min(start + batch_size, len(complaints))))
+        for start in range(0, len(complaints), batch_size)
+    ]
+    predictions = [""] * len(complaints)
+    latencies = np.zeros(len(complaints))
+
+    def classify(batch):
+        start = time.perf_counter()
+        results = classify_batch([complaints[position] for position in batch])
+        return batch, results, time.perf_counter() - start
+
+    client.reset_stats()
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for batch, results, seconds in executor.map(classify, batches):
+            for position, result in zip(batch, results):
+                predictions[position] = result
+                latencies[position] = seconds
+    elapsed = time.perf_counter() - start
+
+    correct = [
+        str(prediction).strip().lower() == str(label).strip().lower()
+        for prediction, label in zip(predictions, labels)
+    ]
+    return {
+        "complaints": len(complaints),
+        "accuracy": float(np.mean(correct)) if correct else 0.0,
+        "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "latency_p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "throughput_per_second": len(complaints) / elapsed if elapsed else 0.0,
+        **client.stats,
+    }
+
+
+def main():
+    """
+    Benchmarks the classification techniques on a held-out split of the training data.
+    """
+    current_dir = os.getcwd()
+    parser = argparse.ArgumentParser(
+        description="Benchmark accuracy, latency, throughput and cost of the classification techniques."
+    )
+    parser.add_argument(
+        "--training-file",
+        default=os.path.join(current_dir, "input", "complaints_data_training.xlsx"),
+    )
+    parser.add_argument(
+        "--techniques", nargs="+", choices=TECHNIQUES, default=TECHNIQUES
+    )
+    parser.add_argument(
+        "--client",
+        choices=["stub", "replay", "record", "openai"],
+        default="stub",
+        help="stub: offline keyword/hash stand-in; record: call OpenAI and record responses; replay: serve recorded responses; openai: call OpenAI.",
+    )
+    parser.add_argument(
+        "--recording",
+        default=os.path.join(current_dir, "output", "benchmark_recording.jsonl"),
+    )
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0)
+    parser.add_argument("--held-out-fraction", type=float, default=HELD_OUT_FRACTION)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--packed", action="store_true")
+    parser.add_argument("--fine-tuned-model", default="")
+    parser.add_argument(
+        "--output",
+        default=os.path.join(current_dir, "output", "benchmark_results.csv"),
+    )
+    args = parser.parse_args()
+
+    if args.client == "stub":
+        client = create_stub_client(args.stub_latency_ms / 1000)
+    elif args.client in ("record", "replay"):
+        client = create_recording_client(
+            None if args.client == "replay" else llm_engine.get_client(),
+            args.recording,
+            replay=args.client == "replay",
+        )
+    else:
+        client = llm_engine.get_client()
+    client = create_metered_client(client)
+    llm_engine.client = client
+    embedder.client = client
+
+    reference_df, held_out_df = split_training_data(
+        args.training_file, args.held_out_fraction, args.seed
+    )
+    print(
+        f"{len(reference_df)} reference and {len(held_out_df)} held-out complaints, "
+        f"batch size {args.batch_size}, concurrency {args.concurrency}"
+    )
+
+    rows = []
+    for technique in args.techniques:
+        fine_tuned_model = args.fine_tuned_model or (
+            "ft:stub" if args.client == "stub" else ""
+        )
+        if technique == "fine-tuning" and not fine_tuned_model:
+            print("Skipping fine-tuning: no --fine-tuned-model given.")
+            continue
+        classify_batch = build_technique_classifier(
+            technique, reference_df, args.packed, fine_tuned_model
+        )
+        result = run_benchmark(
+            classify_batch,
+            held_out_df["Complaint"].astype(str).tolist(),
+            held_out_df["Issue_category_manual"].astype(str).tolist(),
+            client,
+            batch_size=args.batch_size,
+            concurrency=args.concurrency,
+        )
+        rows.append({"technique": technique, **result})
+
+    results = pd.DataFrame(rows)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    results.to_csv(args.output, index=False)
+    with pd.option_context("display.width", 200, "display.max_columns", None):
+        print(results.round(3).to_string(index=False))
+    print(f"Benchmark results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import os
+import concurrent.futures
+import numpy as np
+from typing import List, Optional
+
+from llm.llm_engine import get_category as get_fine_tuned_category
+from retrieval.embedder import (
+    EMBEDDING_MODEL,
+    create_reference_embeddings,
+    embed_texts_with_cache,
+)
+from retrieval.embedding_store import (
+    get_active_embedding_model,
+    get_store_fingerprint,
+    normalize_embeddings,
+)
+from retrieval.quantization import load_or_build_quantized_store
+from retrieval.retriever import classify_with_margin, load_reference_store
+from scripts.few_shot_classifier import classify_complaints_packed
+from scripts.fine_tuning import train_fine_tuned_model
+from utils.chunked_io import (
+    CHUNK_SIZE,
+    append_result_chunk,
+    discard_partial_results,
+    finalize_results,
+    iter_complaint_chunks,
+)
+from utils.deduplication import assign_duplicate_clusters
+from utils.journal import (
+    apply_journal,
+    close_journal,
+    is_classified,
+    open_journal,
+    pending_rows,
+    record_results,
+)
+
+
+DEFAULT_MARGIN_THRESHOLD = 0.02
+
+
+def classify_escalated_complaints(
+    complaints: List[str], llm_technique: str, fine_tuned_model: Optional[str]
+) -> List[str]:
+    """
+    Classifies the complaints the embedding tier was not confident about with an LLM.
+
+    Args:
+        complaints (List[str]): Complaint texts to classify.
+        llm_technique (str): "few-shot" or "fine-tuning".
+        fine_tuned_model (Optional[str]): Fine-tuned model name, required for "fine-tuning".
+
+    Returns:
+        List[str]: One category label per complaint.
+    """
+    if not complaints:
+        return []
+    if llm_technique == "few-shot":
+        return classify_complaints_packed(complaints)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        return list(
+            executor.map(
+                lambda complaint: get_fine_tuned_category(complaint, fine_tuned_model),
+                complaints,
+            )
+        )
+
+
+def cascade_classification(
+    reference_data_path: str,
+    uncategorized_data_path: str,
+    output_dir: str,
+    margin_threshold: float = DEFAULT_MARGIN_THRESHOLD,
+    llm_technique: str = "few-shot",
+    training_file: Optional[str] = None,
+    chunk_size: int = CHUNK_SIZE,
+    deduplicate: bool = False,
+    resume_job: Optional[str] = None,
+    precision: str = "float32",
+) -> str:
+    """
+    Classifies complaints with vector embeddings first and escalates only ambiguous ones to an LLM.
+
+    A complaint is decided by the embedding tier when the similarity of its nearest
+    reference exceeds that of the nearest reference of any other category by at least
+    `margin_threshold`. All other complaints, including those that could not be embedded,
+    are classified by the few-shot or fine-tuned LLM. Results of both tiers are recorded in
+    a journal, so rerunning an interrupted run only classifies the rows without a result.
+
+    Args:
+        reference_data_path (str): Path to the Excel file containing reference complaint data with known categories.
+        uncategorized_data_path (str): Path to the Excel file containing uncategorized complaints to be classified.
+        output_dir (str): Path to the directory where the categorized output file will be saved.
+        margin_threshold (float, optional): Minimum top-2 category similarity margin for the
+            embedding tier to decide. Defaults to DEFAULT_MARGIN_THRESHOLD.
+        llm_technique (str, optional): LLM tier, "few-shot" or "fine-tuning". Defaults to "few-shot".
+        training_file (Optional[str]): Training dataset, required for the "fine-tuning" tier.
+        chunk_size (int, optional): Number of complaints processed per chunk.
+        deduplicate (bool, optional): Classify one representative per duplicate cluster.
+        resume_job (Optional[str]): ID of a running fine-tuning job to re-attach to.
+        precision (str, optional): Storage precision of the reference vectors: "float32",
+            "float16" or "int8". Defaults to "float32".
+
+    Returns:
+        str: Path to the categorized output file.
+    """
+    cache_dir = os.path.join(output_dir, "embedding_cache")
+    embedding_model = get_active_embedding_model(reference_data_path, EMBEDDING_MODEL)
+    create_reference_embeddings(reference_data_path, cache_dir, embedding_model)
+    reference_matrix, reference_labels = load_reference_store(
+        reference_data_path, embedding_model
+    )
+    reference_matrix, reference_scales = load_or_build_quantized_store(
+        reference_data_path, embedding_model, reference_matrix, precision
+    )
+
+    fine_tuned_model = None
+    if llm_technique == "fine-tuning":
+        fine_tuned_model = train_fine_tuned_model(
+            training_file, output_dir, resume_job=resume_job
+        )
+        if not fine_tuned_model:
+            print("Fine-tuning failed, low-margin complaints are left unclassified.")
+
+    output_file = os.path.join(
+        output_dir, "output_classification_technique_4_cascade.xlsx"
+    )
+    discard_partial_results(output_file)
+    clusters = (
+        assign_duplicate_clusters(uncategorized_data_path, chunk_size)
+        if deduplicate
+        else None
+    )
+    journal = open_journal(
+        output_file,
+        uncategorized_data_path,
+        {
+            "technique": "cascade",
+            "margin_threshold": margin_threshold,
+            "llm_technique": llm_technique,
+            "model": fine_tuned_model,
+            "embedding_model": embedding_model,
+            "reference_store": get_store_fingerprint(
+                reference_data_path, embedding_model
+            ),
+            "deduplicate": deduplicate,
+            "precision": precision,
+        },
+    )
+
+    n_complaints = 0
+    n_escalated = 0
+    for chunk in iter_complaint_chunks(uncategorized_data_path, chunk_size):
+        pending = pending_rows(chunk, journal, clusters)
+        complaints = pending["Complaint"].astype(str).tolist()
+        query_matrix, valid_mask = normalize_embeddings(
+            embed_texts_with_cache(complaints, cache_dir, model=embedding_model)
+        )
+        categories = np.full(len(pending), "", dtype=object)
+        margins = np.full(len(pending), np.nan, dtype=np.float32)
+        if valid_mask.any():
+            categories[valid_mask], margins[valid_mask] = classify_with_margin(
+                query_matrix[valid_mask],
+                reference_matrix,
+                reference_labels,
+                reference_scales=reference_scales,
+            )
+
+        escalate = ~valid_mask | (margins < margin_threshold)
+        record_results(
+            output_file,
+            journal,
+            [
+                {
+                    "row": pending.index[position],
+                    "category": categories[position],
+                    "margin": float(margins[position]),
+                    "tier": "vector-embedding",
+                }
+                for position in np.flatnonzero(~escalate)
+            ],
+        )
+
+        escalated_positions = np.flatnonzero(escalate)
+        if len(escalated_positions) and (
+            llm_technique == "few-shot" or fine_tuned_model
+        ):
+            escalated_categories = classify_escalated_complaints(
+                [complaints[position] for position in escalated_positions],
+                llm_technique,
+                fine_tuned_model,
+            )
+            record_results(
+                output_file,
+                journal,
+                [
+                    {
+                        "row": pending.index[position],
+                        "category": category,
+                        "margin": None
+                        if np.isnan(margins[position])
+                        else float(margins[position]),
+                        "tier": llm_technique,
+                    }
+                    for position, category in zip(
+                        escalated_positions, escalated_categories
+                    )
+                    if is_classified(category)
+                ],
+            )
+
+        chunk = apply_journal(
+            chunk,
+            journal,
+            {
+                "Category": "category",
+                "Similarity_margin": "margin",
+                "Decided_by": "tier",
+            },
+            clusters=clusters,
+        )
+        chunk.loc[pending.index[escalated_positions], "Similarity_margin"] = margins[
+            escalated_positions
+        ]
+        append_result_chunk(output_file, chunk)
+        n_complaints += len(chunk)
+        n_escalated += int((chunk["Decided_by"] != "vector-embedding").sum())
+
+    finalize_results(output_file)
+    close_journal(output_file)
+    print(
+        f"Embedding tier decided {n_complaints - n_escalated} of {n_complaints} complaints, "
+        f"escalated {n_escalated} to {llm_technique}."
+    )
+    print("Classification completed and saved successfully.")
+    return output_file
@@ -1,50 +1,346 @@
 import os
+import json
 import concurrent.futures
-import pandas as pd
+import numpy as np
+from typing import Any, Callable, Dict, List, Optional, Sequence
 from llm.llm_engine import (
+    CATEGORIES,
+    count_tokens,
+    count_tokens_batch,
+    get_prompt_for_dynamic_few_shot_classification,
     get_prompt_for_few_short_classification,
+    get_prompt_for_packed_few_shot_classification,
     generate_gpt_response,
+    generate_gpt_json_response,
 )
+from utils.chunked_io import (
+    CHUNK_SIZE,
+    append_result_chunk,
+    discard_partial_results,
+    finalize_results,
+    iter_complaint_chunks,
+)
+from retrieval.embedder import embed_texts_with_cache
+from retrieval.embedding_store import normalize_embeddings
+from retrieval.example_selector import (
+    DYNAMIC_PROMPT_TOKEN_BUDGET,
+    load_example_pool,
+    select_examples,
+)
+from utils.deduplication import assign_duplicate_clusters
+from utils.journal import (
+    apply_journal,
+    close_journal,
+    is_classified,
+    open_journal,
+    pending_rows,
+    record_results,
+)
+
 
+PACKED_PROMPT_TOKEN_BUDGET = 12000
+PACKED_OUTPUT_TOKENS_PER_COMPLAINT = 20
+MAX_PACK_SIZE = 50
 
-def get_category(complaint: str) -> str:
+
+def get_category(complaint: str, prompt: Optional[str] = None) -> str:
     """
     Classifies a financial consumer complaint using GPT.
 
     Args:
         complaint (str): The consumer complaint text.
+        prompt (Optional[str]): System prompt to use instead of the fixed few-shot prompt.
 
     Returns:
         str: The predicted category label.
     """
-    prompt = get_prompt_for_few_short_classification()
+    if prompt is None:
+        prompt = get_prompt_for_few_short_classification()
     user_message = f"Consumer complaint: {complaint}"
     return generate_gpt_response(prompt, user_message)
 
 
-def few_shot_classification(input_file: str, output_path: str) -> str:
+def pack_complaints(
+    complaints: Sequence[str], token_budget: int = PACKED_PROMPT_TOKEN_BUDGET
+) -> List[List[int]]:
+    """
+    Splits complaints, in order, into packs that fit a single request's prompt token budget.
+
+    The pack size follows from the budget: the shared system prompt is paid once per pack,
+    and complaints are added until their tokens (plus JSON framing and the expected output)
+    would exceed what is left, or `MAX_PACK_SIZE` is reached.
+
+    Args:
+        complaints (Sequence[str]): Complaint texts.
+        token_budget (int, optional): Maximum prompt tokens per request.
+
+    Returns:
+        List[List[int]]: Packs of complaint positions.
+    """
+    available = token_budget - count_tokens(
+        get_prompt_for_packed_few_shot_classification()
+    )
+    packs = []
+    current_pack = []
+    current_tokens = 0
+    for position, complaint in enumerate(complaints):
+        n_tokens = count_tokens(str(complaint)) + PACKED_OUTPUT_TOKENS_PER_COMPLAINT
+        if current_pack and (
+            len(current_pack) >= MAX_PACK_SIZE or current_tokens + n_tokens > available
+        ):
+            packs.append(current_pack)
+            current_pack = []
+            current_tokens = 0
+        current_pack.append(position)
+        current_tokens += n_tokens
+    if current_pack:
+        packs.append(current_pack)
+    return packs
+
+
+def get_categories_packed(complaints: Dict[str, str]) -> Dict[str, str]:
+    """
+    Classifies several complaints with a single GPT request.
+
+    Args:
+        complaints (Dict[str, str]): Mapping from row id to complaint text.
+
+    Returns:
+        Dict[str, str]: Mapping from row id to a valid category label. Rows that are
+        missing from the response or carry an unknown label are left out.
+    """
+    user_message = json.dumps(
+        [
+            {"row_id": row_id, "complaint": str(complaint)}
+            for row_id, complaint in complaints.items()
+        ],
+        ensure_ascii=False,
+    )
+    response = generate_gpt_json_response(
+        get_prompt_for_packed_few_shot_classification(), user_message
+    )
+    items = response.get("classifications", []) if isinstance(response, dict) else []
+
+    categories_by_name = {category.lower(): category for category in CATEGORIES}
+    categories = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        row_id = str(item.get("row_id", ""))
+        category = categories_by_name.get(str(item.get("category", "")).strip().lower())
+        if row_id in complaints and category:
+            categories[row_id] = category
+    return categories
+
+
+def classify_complaints_packed(
+    complaints: Sequence[str],
+    on_classified: Optional[Callable[[Dict[int, str]], None]] = None,
+) -> List[str]:
+    """
+    Classifies complaints in token-budgeted packs, falling back to single requests where needed.
+
+    Args:
+        complaints (Sequence[str]): Complaint texts.
+        on_classified (Optional[Callable[[Dict[int, str]], None]]): Called with the
+            categories of each finished request, keyed by complaint position.
+
+    Returns:
+        List[str]: One category label per complaint, in input order.
+    """
+    packs = [
+        {str(position): complaints[position] for position in pack}
+        for pack in pack_complaints(complaints)
+    ]
+    categories = [""] * len(complaints)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        for pack, pack_categories in zip(
+            packs, executor.map(get_categories_packed, packs)
+        ):
+            for row_id, category in pack_categories.items():
+                categories[int(row_id)] = category
+            if on_classified and pack_categories:
+                on_classified(
+                    {
+                        int(row_id): category
+                        for row_id, category in pack_categories.items()
+                    }
+                )
+
+    fallback_positions = [
+        position for position, category in enumerate(categories) if not category
+    ]
+    if fallback_positions:
+        print(
+            f"{len(fallback_positions)} complaints missing from packed responses, classifying them individually."
+        )
+        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            fallback_categories = executor.map(
+                get_category, [complaints[position] for position in fallback_positions]
+            )
+            for position, category in zip(fallback_positions, fallback_categories):
+                categories[position] = category
+                if on_classified:
+                    on_classified({position: category})
+
+    print(
+        f"Classified {len(complaints)} complaints with {len(packs)} packed requests and {len(fallback_positions)} single requests."
+    )
+    return categories
+
+
+def build_dynamic_prompts(
+    complaints: Sequence[str],
+    pool: Dict[str, Any],
+    cache_dir: str,
+    k: int,
+    token_budget: int = DYNAMIC_PROMPT_TOKEN_BUDGET,
+) -> List[Optional[str]]:
+    """
+    Builds a few-shot prompt for every complaint from its most similar labelled examples.
+
+    Args:
+        complaints (Sequence[str]): Complaint texts.
+        pool (Dict[str, Any]): Example pool from `load_example_pool`.
+        cache_dir (str): Root directory of the persistent embedding cache.
+        k (int): Maximum number of examples per prompt.
+        token_budget (int, optional): Maximum prompt tokens per request.
+
+    Returns:
+        List[Optional[str]]: One system prompt per complaint, or None where the complaint
+        could not be embedded and the fixed prompt is used instead.
+    """
+    prompts: List[Optional[str]] = [None] * len(complaints)
+    query_matrix, valid_mask = normalize_embeddings(
+        embed_texts_with_cache(complaints, cache_dir, model=pool["model"])
+    )
+    positions = np.flatnonzero(valid_mask)
+    if not len(positions):
+        return prompts
+
+    query_tokens = count_tokens_batch(
+        [f"Consumer complaint: {complaints[position]}" for position in positions]
+    )
+    selections = select_examples(
+        query_matrix[positions], pool, k, token_budget, query_tokens
+    )
+    for position, selection in zip(positions, selections):
+        prompts[position] = get_prompt_for_dynamic_few_shot_classification(
+            [(pool["texts"][row], pool["labels"][row]) for row in selection]
+        )
+    return prompts
+
+
+def few_shot_classification(
+    input_file: str,
+    output_path: str,
+    packed: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    deduplicate: bool = False,
+    dynamic_examples: int = 0,
+    reference_file: Optional[str] = None,
+) -> str:
     """
     Classifies consumer complaints using a GPT-based few-shot learning approach
     and saves the categorized results to an Excel file.
 
+    The input is processed in chunks of `chunk_size` rows and every finished chunk is
+    appended to disk, so memory stays constant. Each model response is also recorded in a
+    journal, so rerunning an interrupted run on the same input only classifies the rows
+    that have no result yet.
+
     Args:
-        input_file (str): path the input Excel file containing complaints.
+        input_file (str): path the input file (.xlsx, .csv or .parquet) containing complaints.
         output_path (str): Path to save the categorized output file.
+        packed (bool, optional): Classify several complaints per request, sharing the
+            few-shot prompt between them. Defaults to False.
+        chunk_size (int, optional): Number of complaints processed per chunk.
+        deduplicate (bool, optional): Classify one representative per cluster of exact and
+            near-duplicate complaints and copy its label to the others. Defaults to False.
+        dynamic_examples (int, optional): If set, prompt every complaint with up to this many
+            of its most similar labelled examples from `reference_file` (at least one per
+            category) instead of the fixed examples. Single requests only. Defaults to 0.
+        reference_file (Optional[str]): Reference complaints Excel file the dynamic
+            examples are selected from.
 
     Returns:
         str : path to file where classfication result file will be saved
     """
-    df = pd.read_excel(input_file)
     complaint_column = "Complaint"
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        categories = list(executor.map(get_category, df[complaint_column]))
-
-    df.insert(loc=len(df.columns), column="Category_model_response", value=categories)
     output_file = os.path.join(
         output_path, "output_classification_technique_1_few_shot.xlsx"
     )
+    discard_partial_results(output_file)
+    clusters = (
+        assign_duplicate_clusters(input_file, chunk_size) if deduplicate else None
+    )
+    cache_dir = os.path.join(output_path, "embedding_cache")
+    pool = (
+        load_example_pool(reference_file, cache_dir)
+        if dynamic_examples and not packed
+        else None
+    )
+    journal = open_journal(
+        output_file,
+        input_file,
+        {
+            "technique": "few-shot",
+            "packed": packed,
+            "deduplicate": deduplicate,
+            "dynamic_examples": dynamic_examples,
+            "reference_store": pool["fingerprint"] if pool else None,
+        },
+    )
+
+    for chunk in iter_complaint_chunks(input_file, chunk_size):
+        pending = pending_rows(chunk, journal, clusters)
+        positions = pending.index.tolist()
+        complaints = pending[complaint_column].astype(str).tolist()
+        failures = {}
+
+        def record(categories: Dict[int, str]):
+            failures.update(
+                (positions[position], category)
+                for position, category in categories.items()
+                if not is_classified(category)
+            )
+            record_results(
+                output_file,
+                journal,
+                [
+                    {
+                        "row": positions[position],
+                        "category": category,
+                        "tier": "few-shot",
+                    }
+                    for position, category in categories.items()
+                    if is_classified(category)
+                ],
+            )
+
+        if packed:
+            classify_complaints_packed(complaints, on_classified=record)
+        else:
+            prompts = (
+                build_dynamic_prompts(complaints, pool, cache_dir, dynamic_examples)
+                if pool is not None
+                else [None] * len(complaints)
+            )
+            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+                for position, category in enumerate(
+                    executor.map(get_category, complaints, prompts)
+                ):
+                    record({position: category})
+
+        chunk = apply_journal(
+            chunk, journal, {"Category_model_response": "category"}, clusters=clusters
+        )
+        for position, response in failures.items():
+            chunk.at[position, "Category_model_response"] = response
+        append_result_chunk(output_file, chunk)
 
-    df.to_excel(output_file, index=False)
+    finalize_results(output_file)
+    close_journal(output_file)
     print("Classification completed and saved successfully.")
     return output_file
@@ -1,42 +1,139 @@
 import concurrent.futures
 import os
-import pandas as pd
+from typing import Optional
 
 
+from llm.fine_tuning_registry import REGISTRY_FILENAME
 from llm.llm_engine import (
     fine_tune_model,
     get_category,
 )
 
 from utils.file_handler import prepare_fine_tuning_data
+from utils.chunked_io import (
+    CHUNK_SIZE,
+    append_result_chunk,
+    discard_partial_results,
+    finalize_results,
+    iter_complaint_chunks,
+)
+from utils.deduplication import assign_duplicate_clusters
+from utils.journal import (
+    apply_journal,
+    close_journal,
+    is_classified,
+    open_journal,
+    pending_rows,
+    record_results,
+)
 
 
-def classify_complaints(input_excel: str, output_excel: str, model_name: str) -> None:
+def classify_complaints(
+    input_excel: str,
+    output_excel: str,
+    model_name: str,
+    chunk_size: int = CHUNK_SIZE,
+    deduplicate: bool = False,
+) -> None:
     """
-    Loads complaints from an Excel file, classifies them, and saves the categorized results.
+    Streams complaints from a file in chunks, classifies them, and saves the categorized results.
+
+    Every response is recorded in a journal, so rerunning an interrupted run with the same
+    input and model only classifies the rows that have no result yet.
 
     Args:
-        input_excel (str): Path to the uncategorized complaints file.
+        input_excel (str): Path to the uncategorized complaints file (.xlsx, .csv or .parquet).
         output_excel (str): Path to save the categorized results.
         model_name (str): The fine-tuned model name.
+        chunk_size (int, optional): Number of complaints processed per chunk.
+        deduplicate (bool, optional): Classify one representative per duplicate cluster.
     """
-    df_unlabeled = pd.read_excel(input_excel)
     complaint_column = "Complaint"
+    discard_partial_results(output_excel)
+    clusters = (
+        assign_duplicate_clusters(input_excel, chunk_size) if deduplicate else None
+    )
+    journal = open_journal(
+        output_excel,
+        input_excel,
+        {"technique": "fine-tuning", "model": model_name, "deduplicate": deduplicate},
+    )
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        categories = list(
-            executor.map(
-                lambda complaint: get_category(complaint, model_name),
-                df_unlabeled[complaint_column],
-            )
+    for chunk in iter_complaint_chunks(input_excel, chunk_size):
+        pending = pending_rows(chunk, journal, clusters)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            for position, category in zip(
+                pending.index,
+                executor.map(
+                    lambda complaint: get_category(complaint, model_name),
+                    pending[complaint_column].astype(str),
+                ),
+            ):
+                if is_classified(category):
+                    record_results(
+                        output_excel,
+                        journal,
+                        [
+                            {
+                                "row": position,
+                                "category": category,
+                                "tier": "fine-tuning",
+                            }
+                        ],
+                    )
+
+        chunk = apply_journal(
+            chunk, journal, {"Category": "category"}, clusters=clusters
         )
+        append_result_chunk(output_excel, chunk)
+
+    finalize_results(output_excel)
+    close_journal(output_excel)
+
+
+def train_fine_tuned_model(
+    training_file: str, output_dir: str, resume_job: Optional[str] = None
+) -> str:
+    """
+    Prepares the fine-tuning dataset and trains a fine-tuned classification model.
+
+    Jobs are recorded in a registry in `output_dir`, so identical training data is never
+    uploaded or trained twice.
+
+    Args:
+        training_file (str): Path to the training dataset (Excel file).
+        output_dir (str): Path to directory where the train and validation JSONL files will be stored.
+        resume_job (Optional[str]): ID of a running fine-tuning job to re-attach to.
 
-    df_unlabeled["Category"] = categories
-    df_unlabeled.to_excel(output_excel, index=False)
+    Returns:
+        str: The fine-tuned model name, or an empty string if fine-tuning failed.
+    """
+    output_prefix: str = os.path.join(
+        output_dir, "complaints_categorization_finetuning"
+    )
+
+    print("Preparing fine-tuning data...")
+    dataset = prepare_fine_tuning_data(training_file, output_prefix)
+    if not dataset["train_file"]:
+        print("No training examples found, fine-tuning skipped.")
+        return ""
+
+    print("Starting fine-tuning process...")
+    return fine_tune_model(
+        dataset["train_file"],
+        registry_file=os.path.join(output_dir, REGISTRY_FILENAME),
+        resume_job=resume_job,
+        validation_filename=dataset["validation_file"],
+    )
 
 
 def fine_tuning_classification(
-    training_file: str, uncategorized_file_path: str, output_dir: str
+    training_file: str,
+    uncategorized_file_path: str,
+    output_dir: str,
+    chunk_size: int = CHUNK_SIZE,
+    deduplicate: bool = False,
+    resume_job: Optional[str] = None,
 ) -> None:
     """
     Prepares and organizes file paths for fine-tuning a GPT-based classification model.
@@ -45,28 +142,30 @@ def fine_tuning_classification(
         training_file (str): Path to the training dataset (Excel file).
         uncategorized_file_path (str) : path to the file with Complaints Data - Uncategorized
         output_dir (str):Path to directory where output files will be stored.
+        chunk_size (int, optional): Number of complaints classified per chunk.
+        deduplicate (bool, optional): Classify one representative per duplicate cluster.
+        resume_job (Optional[str]): ID of a running fine-tuning job to re-attach to.
 
     Returns:
         None
     """
 
-    jsonl_filename: str = "complaints_categorization_finetuning.jsonl"
-    jsonl_file_path: str = os.path.join(output_dir, jsonl_filename)
-
     categorized_output_file: str = "output_classification_technique_2_finetuning.xlsx"
     categorized_output_file_path: str = os.path.join(
         output_dir, categorized_output_file
     )
 
-    print("Preparing fine-tuning data...")
-    prepare_fine_tuning_data(training_file, jsonl_file_path)
-
-    print("Starting fine-tuning process...")
-    fine_tuned_model = fine_tune_model(jsonl_file_path)
+    fine_tuned_model = train_fine_tuned_model(
+        training_file, output_dir, resume_job=resume_job
+    )
     if fine_tuned_model:
         print("Classifying complaints using fine-tuned model...")
         classify_complaints(
-            uncategorized_file_path, categorized_output_file_path, fine_tuned_model
+            uncategorized_file_path,
+            categorized_output_file_path,
+            fine_tuned_model,
+            chunk_size=chunk_size,
+            deduplicate=deduplicate,
         )
 
         print(
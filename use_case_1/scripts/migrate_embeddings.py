@@ -0,0 +1,221 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from retrieval.embedder import (
+    EMBEDDING_MODEL,
+    create_reference_embeddings,
+    embed_texts_with_cache,
+    parse_embedding_model,
+)
+from retrieval.embedding_cache import load_embedding_cache, text_hash
+from retrieval.embedding_store import (
+    get_active_embedding_model,
+    load_embedding_store,
+    set_active_embedding_model,
+)
+from retrieval.projection import (
+    fit_pca_projection,
+    get_projection_path,
+    save_projection,
+)
+from retrieval.retriever import load_reference_store, search_reference_matrix
+
+
+MIGRATION_BATCH_SIZE = 1000
+EVALUATION_SAMPLE_SIZE = 2000
+
+
+def leave_one_out_accuracy(
+    matrix: np.ndarray,
+    labels: np.ndarray,
+    sample_size: int = EVALUATION_SAMPLE_SIZE,
+    seed: int = 0,
+) -> float:
+    """
+    Returns how often a reference row's nearest other reference has the same label.
+
+    Args:
+        matrix (np.ndarray): (n, d) normalized reference embeddings.
+        labels (np.ndarray): Category label of every row.
+        sample_size (int, optional): Number of rows evaluated.
+        seed (int, optional): Random seed of the sample.
+
+    Returns:
+        float: Share of sampled rows whose nearest neighbour shares their label.
+    """
+    if len(matrix) < 2:
+        return 0.0
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(matrix), min(sample_size, len(matrix)), replace=False)
+    ids, _ = search_reference_matrix(matrix[sample], matrix, top_k=2)
+    neighbours = np.where(ids[:, 0] == sample, ids[:, 1], ids[:, 0])
+    return float(np.mean(labels[neighbours] == labels[sample]))
+
+
+def prepare_projection(reference_file: str, cache_dir: str, model: str) -> None:
+    """
+    Fits the PCA projection of a "+pca" model on the reference store of its underlying
+    model, unless it was fitted before.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        cache_dir (str): Root directory of the persistent embedding cache.
+        model (str): PCA model name, e.g. "text-embedding-ada-002+pca256".
+    """
+    path = get_projection_path(cache_dir, model)
+    if os.path.exists(path):
+        return
+
+    base_model = model.partition("+pca")[0]
+    create_reference_embeddings(reference_file, cache_dir, base_model)
+    matrix, _ = load_reference_store(reference_file, base_model)
+    projection = fit_pca_projection(matrix, parse_embedding_model(model)[2])
+    save_projection(path, projection)
+    print(
+        f"Fitted a {projection['components'].shape[1]}-component PCA projection of "
+        f"{len(matrix)} '{base_model}' reference embeddings, keeping "
+        f"{projection['explained_variance_ratio'].sum():.1%} of their variance."
+    )
+
+
+def migrate_reference_embeddings(
+    reference_file: str,
+    cache_dir: str,
+    model: str,
+    batch_size: int = MIGRATION_BATCH_SIZE,
+    pause_seconds: float = 0.0,
+    switch: bool = True,
+) -> str:
+    """
+    Re-embeds the reference complaints with another embedding model and switches
+    classification over to it once the new store is complete.
+
+    The new vectors go to the cache and store of the target model, so classification keeps
+    using the store of the active model while the migration runs. Every batch is persisted
+    before the next one starts: an interrupted migration resumes where it stopped. When
+    all references are embedded, the store is written, the nearest-neighbour label
+    accuracy of both stores is reported (only that of the new one if the active model has
+    no store) and the target model is made active.
+
+    Args:
+        reference_file (str): Path to the reference complaints Excel file.
+        cache_dir (str): Root directory of the persistent embedding cache.
+        model (str): Target embedding model (see `parse_embedding_model`).
+        batch_size (int, optional): Complaints embedded and persisted per step.
+        pause_seconds (float, optional): Pause between steps, leaving rate limit headroom
+            for classification running at the same time.
+        switch (bool, optional): Activate the target model when done. Defaults to True.
+
+    Returns:
+        str: The active embedding model after the migration.
+    """
+    active_model = get_active_embedding_model(reference_file, EMBEDDING_MODEL)
+    compare = load_embedding_store(reference_file, active_model) is not None
+    if not compare:
+        print(
+            f"No '{active_model}' reference store found; the new store will not be "
+            "compared with it."
+        )
+    if parse_embedding_model(model)[2]:
+        prepare_projection(reference_file, cache_dir, model)
+
+    texts = pd.read_excel(reference_file)["Complaint"].astype(str).tolist()
+    cache = load_embedding_cache(cache_dir, model)
+    pending = list(
+        {
+            text_hash(text): text for text in texts if text_hash(text) not in cache
+        }.values()
+    )
+    print(
+        f"Migrating {len(texts)} reference complaints from '{active_model}' to '{model}': "
+        f"{len(texts) - len(pending)} already embedded, {len(pending)} to go."
+    )
+    for start in range(0, len(pending), batch_size):
+        embed_texts_with_cache(
+            pending[start : start + batch_size], cache_dir, cache=cache, model=model
+        )
+        print(f"Embedded {min(start + batch_size, len(pending))}/{len(pending)}.")
+        if pause_seconds and start + batch_size < len(pending):
+            time.sleep(pause_seconds)
+
+    create_reference_embeddings(reference_file, cache_dir, model)
+    new_matrix, new_labels = load_reference_store(reference_file, model)
+    if compare:
+        old_matrix, old_labels = load_reference_store(reference_file, active_model)
+        print(
+            f"'{active_model}': {old_matrix.shape[1]} dimensions, "
+            f"{old_matrix.nbytes / 2**20:.1f} MiB, nearest-neighbour label accuracy "
+            f"{leave_one_out_accuracy(old_matrix, old_labels):.3f}"
+        )
+    print(
+        f"'{model}': {new_matrix.shape[1]} dimensions, "
+        f"{new_matrix.nbytes / 2**20:.1f} MiB, nearest-neighbour label accuracy "
+        f"{leave_one_out_accuracy(new_matrix, new_labels):.3f}"
+    )
+
+    if not switch:
+        print(f"Migration complete; '{active_model}' stays active.")
+        return active_model
+    set_active_embedding_model(reference_file, model)
+    print(f"Switched classification over to '{model}'.")
+    return model
+
+
+def main():
+    """
+    Migrates the reference embeddings to another embedding model, or switches between
+    already migrated ones.
+    """
+    current_dir = os.getcwd()
+    parser = argparse.ArgumentParser(
+        description="Re-embed the reference complaints with another embedding model."
+    )
+    parser.add_argument(
+        "--model",
+        required=True,
+        help='Target model, e.g. "text-embedding-3-small@512" or "text-embedding-ada-002+pca256".',
+    )
+    parser.add_argument(
+        "--reference-file",
+        default=os.path.join(
+            current_dir,
+            "input",
+            "complaints_data_classification_reference_examples.xlsx",
+        ),
+    )
+    parser.add_argument(
+        "--cache-dir", default=os.path.join(current_dir, "output", "embedding_cache")
+    )
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause-seconds", type=float, default=0.0)
+    parser.add_argument(
+        "--no-switch",
+        action="store_true",
+        help="Build the new store but keep the current model active.",
+    )
+    parser.add_argument(
+        "--switch-only",
+        action="store_true",
+        help="Activate the already built store of --model, e.g. to roll back.",
+    )
+    args = parser.parse_args()
+
+    if args.switch_only:
+        set_active_embedding_model(args.reference_file, args.model)
+        print(f"Switched classification over to '{args.model}'.")
+        return
+    migrate_reference_embeddings(
+        args.reference_file,
+        args.cache_dir,
+        args.model,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause_seconds,
+        switch=not args.no_switch,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import time
+import argparse
+import numpy as np
+from typing import Dict, List, Sequence
+
+from retrieval.embedding_store import load_embedding_store
+from retrieval.quantization import PRECISIONS, quantize_embeddings
+from retrieval.retriever import search_reference_matrix
+from scripts.ann_benchmark import generate_clustered_vectors, recall_at_k
+
+
+def benchmark_precisions(
+    reference_matrix: np.ndarray,
+    reference_labels: np.ndarray,
+    query_matrix: np.ndarray,
+    query_labels: np.ndarray,
+    top_k: int = 10,
+    precisions: Sequence[str] = PRECISIONS,
+) -> List[Dict[str, float]]:
+    """
+    Compares reduced-precision reference storage against float32.
+
+    For every precision, the nearest-reference classification of the queries is compared
+    with their true labels (accuracy) and with the float32 result (agreement), and the
+    top-k neighbours with the float32 top-k (recall@k).
+
+    Args:
+        reference_matrix (np.ndarray): (n, d) normalized float32 reference embeddings.
+        reference_labels (np.ndarray): Category label of every reference row.
+        query_matrix (np.ndarray): (n_queries, d) normalized query embeddings.
+        query_labels (np.ndarray): True category label of every query.
+        top_k (int, optional): Number of neighbours compared for recall@k. Defaults to 10.
+        precisions (Sequence[str], optional): Precisions to evaluate.
+
+    Returns:
+        List[Dict[str, float]]: One row per precision with memory, accuracy, agreement,
+        recall@k and queries per second.
+    """
+    results = []
+    exact_ids = None
+    exact_labels = None
+    for precision in precisions:
+        vectors, scales = quantize_embeddings(reference_matrix, precision)
+        memory = vectors.nbytes + (scales.nbytes if scales is not None else 0)
+
+        start = time.perf_counter()
+        ids, _ = search_reference_matrix(
+            query_matrix, vectors, top_k=top_k, reference_scales=scales
+        )
+        seconds = time.perf_counter() - start
+        labels = reference_labels[ids[:, 0]]
+        if exact_ids is None:
+            exact_ids, exact_labels = ids, labels
+
+        results.append(
+            {
+                "precision": precision,
+                "memory_mib": memory / 2**20,
+                "accuracy": float(np.mean(labels == query_labels)),
+                "label_agreement": float(np.mean(labels == exact_labels)),
+                "recall_at_k": recall_at_k(ids, exact_ids),
+                "queries_per_second": len(query_matrix) / seconds,
+            }
+        )
+    return results
+
+
+def main():
+    """
+    Reports the accuracy and memory of float16 and int8 reference storage against float32,
+    on the reference embedding store or on synthetic clustered data.
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare float32, float16 and int8 reference embeddings."
+    )
+    parser.add_argument("--reference-file", help="Reference Excel file with a store.")
+    parser.add_argument("--model", default="text-embedding-ada-002")
+    parser.add_argument("--references", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument(
+        "--held-out-fraction",
+        type=float,
+        default=0.2,
+        help="Fraction of store rows used as labelled queries with --reference-file.",
+    )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.reference_file:
+        store = load_embedding_store(args.reference_file, args.model)
+        if store is None:
+            print(f"No '{args.model}' embedding store found for {args.reference_file}")
+            return
+        matrix = np.asarray(store[0], dtype=np.float32)
+        labels = np.asarray([row["label"] for row in store[1]["rows"]], dtype=object)
+        held_out = rng.random(len(matrix)) < args.held_out_fraction
+        reference_matrix, reference_labels = matrix[~held_out], labels[~held_out]
+        query_matrix, query_labels = matrix[held_out], labels[held_out]
+    else:
+        n_clusters = max(1, args.references // 100)
+        data, labels = generate_clustered_vectors(
+            args.references + args.queries,
+            args.dimensions,
+            n_clusters,
+            return_labels=True,
+        )
+        reference_matrix, query_matrix = (
+            data[: args.references],
+            data[args.references :],
+        )
+        reference_labels, query_labels = (
+            labels[: args.references],
+            labels[args.references :],
+        )
+
+    print(
+        f"{len(reference_matrix)} references, {len(query_matrix)} queries, "
+        f"{reference_matrix.shape[1]} dimensions, top-{args.top_k}"
+    )
+    print(
+        f"{'precision':<10}{'MiB':>10}{'accuracy':>10}{'agreement':>11}{'recall@k':>10}{'queries/s':>12}"
+    )
+    for row in benchmark_precisions(
+        reference_matrix, reference_labels, query_matrix, query_labels, args.top_k
+    ):
+        print(
+            f"{row['precision']:<10}{row['memory_mib']:>10.1f}{row['accuracy']:>10.3f}"
+            f"{row['label_agreement']:>11.3f}{row['recall_at_k']:>10.3f}{row['queries_per_second']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
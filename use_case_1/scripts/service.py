@@ -0,0 +1,649 @@
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import contextlib
+import concurrent.futures
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from llm.llm_engine import get_category as get_fine_tuned_category
+from retrieval.ann_index import DEFAULT_N_PROBE
+from retrieval.embedder import EMBEDDING_MODEL, embed_texts_with_cache
+from retrieval.embedding_cache import load_embedding_cache
+from retrieval.embedding_store import get_active_embedding_model, normalize_embeddings
+from retrieval.index_registry import (
+    DEFAULT_REGISTRY_MAX_BYTES,
+    create_index_registry,
+    discover_reference_indexes,
+)
+from retrieval.quantization import PRECISIONS
+from retrieval.retriever import KNN_TOP_K, classify_query_matrix, classify_with_margin
+from scripts.cascade_classifier import (
+    DEFAULT_MARGIN_THRESHOLD,
+    classify_escalated_complaints,
+)
+from scripts.few_shot_classifier import classify_complaints_packed
+from scripts.fine_tuning import train_fine_tuned_model
+from scripts.vector_embedding import load_embedding_classifier
+from utils.file_handler import check_file_exists
+
+
+MAX_BATCH_SIZE = 64
+MAX_BATCH_WAIT_SECONDS = 0.02
+MAX_CONCURRENT_BATCHES = 4
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+ACTIVE_MODEL_CHECK_SECONDS = 10
+
+BatchClassifier = Callable[[List[str]], List[Dict[str, Any]]]
+
+
+def create_micro_batcher(
+    classify_batch: BatchClassifier,
+    max_batch_size: int = MAX_BATCH_SIZE,
+    max_wait_seconds: float = MAX_BATCH_WAIT_SECONDS,
+    max_concurrent_batches: int = MAX_CONCURRENT_BATCHES,
+) -> Callable[[str], concurrent.futures.Future]:
+    """
+    Collects complaints submitted by concurrent callers into shared classification batches.
+
+    A batch is dispatched once it holds `max_batch_size` complaints or `max_wait_seconds`
+    after its first complaint arrived. At most `max_concurrent_batches` batches are in
+    flight; while all are busy, new complaints keep queueing and form the next, larger batch.
+
+    Args:
+        classify_batch (BatchClassifier): Classifies a list of complaints, returning one
+            result per complaint.
+        max_batch_size (int, optional): Maximum complaints per batch.
+        max_wait_seconds (float, optional): Maximum time a complaint waits for its batch to fill.
+        max_concurrent_batches (int, optional): Maximum batches classified at the same time.
+
+    Returns:
+        Callable[[str], concurrent.futures.Future]: Submits one complaint and returns a
+        future for its result.
+    """
+    pending = queue.Queue()
+    slots = threading.BoundedSemaphore(max_concurrent_batches)
+    executor = concurrent.futures.ThreadPoolExecutor(max_concurrent_batches)
+
+    def run_batch(batch):
+        try:
+            results = list(classify_batch([complaint for complaint, _ in batch]))
+            if len(results) != len(batch):
+                raise RuntimeError(
+                    f"The classifier returned {len(results)} results for "
+                    f"{len(batch)} complaints."
+                )
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            slots.release()
+
+    def collect_batches():
+        while True:
+            batch = [pending.get()]
+            slots.acquire()
+            deadline = time.monotonic() + max_wait_seconds
+            while len(batch) < max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(
+                        pending.get(timeout=remaining)
+                        if remaining > 0
+                        else pending.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+            executor.submit(run_batch, batch)
+
+    threading.Thread(target=collect_batches, daemon=True).start()
+
+    def submit(complaint: Any) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        pending.put((complaint, future))
+        return future
+
+    return submit
+
+
+def load_batch_classifier(
+    technique: str,
+    input_dir: str,
+    output_dir: str,
+    mode: str = "nearest",
+    top_k: int = KNN_TOP_K,
+    use_ann: bool = False,
+    n_probe: int = DEFAULT_N_PROBE,
+    margin_threshold: float = DEFAULT_MARGIN_THRESHOLD,
+    cascade_llm: str = "few-shot",
+    fine_tuned_model: Optional[str] = None,
+    precision: str = "float32",
+    registry: Optional[SimpleNamespace] = None,
+) -> BatchClassifier:
+    """
+    Loads the reference data, embedding cache and models of a technique once and returns a
+    function classifying a batch of complaints with them.
+
+    The active embedding model of the reference data is checked every
+    `ACTIVE_MODEL_CHECK_SECONDS`; when a migration has switched it over, the reference
+    store and cache of the new model are loaded and used from the next batch on.
+
+    Args:
+        technique (str): "few-shot", "fine-tuning", "vector-embedding" or "cascade".
+        input_dir (str): Directory with the reference and training files.
+        output_dir (str): Directory with the embedding cache and fine-tuning registry.
+        mode (str, optional): Vector-embedding classification mode.
+        top_k (int, optional): Number of neighbours voting in "knn" mode.
+        use_ann (bool, optional): Search an IVF index instead of all references.
+        n_probe (int, optional): Number of IVF lists scanned per complaint.
+        margin_threshold (float, optional): Cascade margin threshold.
+        cascade_llm (str, optional): LLM tier of the cascade.
+        fine_tuned_model (Optional[str]): Fine-tuned model name. If omitted, the model is
+            taken from the fine-tuning registry (training it if needed).
+        precision (str, optional): Storage precision of the reference vectors.
+        registry (Optional[SimpleNamespace]): Per-institution reference indexes from
+            `create_institution_registry`. If given, the classifier takes
+            (institution, complaint) pairs and searches each institution's references.
+
+    Returns:
+        BatchClassifier: Function returning one result dict per complaint.
+    """
+    if technique == "few-shot":
+        return lambda complaints: [
+            {"category": category, "decided_by": technique}
+            for category in classify_complaints_packed(complaints)
+        ]
+
+    if technique == "fine-tuning" or (
+        technique == "cascade" and cascade_llm == "fine-tuning"
+    ):
+        if not fine_tuned_model:
+            training_file = check_file_exists(
+                input_dir, "complaints_data_training.xlsx"
+            )
+            fine_tuned_model = train_fine_tuned_model(training_file, output_dir)
+        if not fine_tuned_model:
+            raise RuntimeError("No fine-tuned model is available.")
+
+    if technique == "fine-tuning":
+
+        def classify_fine_tuned(complaints):
+            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+                categories = executor.map(
+                    lambda complaint: get_fine_tuned_category(
+                        complaint, fine_tuned_model
+                    ),
+                    complaints,
+                )
+                return [
+                    {"category": category, "decided_by": technique}
+                    for category in categories
+                ]
+
+        return classify_fine_tuned
+
+    cache_dir = os.path.join(output_dir, "embedding_cache")
+    caches = {}
+    cache_lock = threading.Lock()
+
+    def embed(complaints, model):
+        with cache_lock:
+            if model not in caches:
+                caches[model] = load_embedding_cache(cache_dir, model)
+        return normalize_embeddings(
+            embed_texts_with_cache(
+                complaints,
+                cache_dir,
+                cache=caches[model],
+                model=model,
+                lock=cache_lock,
+            )
+        )
+
+    def classify_embedded(classifier, complaints, query_matrix, valid_mask):
+        categories = np.full(len(complaints), "", dtype=object)
+        if valid_mask.any():
+            categories[valid_mask] = classify_query_matrix(
+                query_matrix[valid_mask],
+                classifier["matrix"],
+                classifier["labels"],
+                mode=mode,
+                category_index=classifier["category_index"],
+                top_k=top_k,
+                ann_index=classifier["ann_index"],
+                n_probe=n_probe,
+                reference_scales=classifier["scales"],
+            )
+        return [
+            {"category": category, "decided_by": technique} for category in categories
+        ]
+
+    def classify_cascade(classifier, complaints, query_matrix, valid_mask):
+        categories = np.full(len(complaints), "", dtype=object)
+        margins = np.full(len(complaints), np.nan, dtype=np.float32)
+        if valid_mask.any():
+            categories[valid_mask], margins[valid_mask] = classify_with_margin(
+                query_matrix[valid_mask],
+                classifier["matrix"],
+                classifier["labels"],
+                reference_scales=classifier["scales"],
+            )
+        escalate = ~valid_mask | (margins < margin_threshold)
+        escalated_positions = np.flatnonzero(escalate)
+        categories[escalated_positions] = classify_escalated_complaints(
+            [complaints[position] for position in escalated_positions],
+            cascade_llm,
+            fine_tuned_model,
+        )
+        return [
+            {
+                "category": categories[position],
+                "margin": None
+                if np.isnan(margins[position])
+                else float(margins[position]),
+                "decided_by": cascade_llm if escalate[position] else "vector-embedding",
+            }
+            for position in range(len(complaints))
+        ]
+
+    classify_vectors = (
+        classify_embedded if technique == "vector-embedding" else classify_cascade
+    )
+
+    if registry is not None:
+
+        def classify_institutions(items):
+            results = [None] * len(items)
+            groups = {}
+            for position, (institution, _) in enumerate(items):
+                if institution in registry.names:
+                    groups.setdefault(institution, []).append(position)
+                else:
+                    results[position] = {
+                        "error": f"Unknown institution '{institution}'."
+                    }
+
+            classifiers = {}
+            for institution in list(groups):
+                try:
+                    classifiers[institution] = registry.get(institution)
+                except Exception as e:
+                    print(f"Failed to load the references of '{institution}': {e}")
+                    for position in groups.pop(institution):
+                        results[position] = {
+                            "error": f"References of '{institution}' could not be loaded: {e}"
+                        }
+            by_model = {}
+            for institution, positions in groups.items():
+                by_model.setdefault(classifiers[institution]["model"], []).extend(
+                    positions
+                )
+            embedded = {}
+            for model, positions in by_model.items():
+                query_matrix, valid_mask = embed(
+                    [items[position][1] for position in positions], model
+                )
+                for row, position in enumerate(positions):
+                    embedded[position] = (query_matrix[row], valid_mask[row])
+
+            for institution, positions in groups.items():
+                institution_results = classify_vectors(
+                    classifiers[institution],
+                    [items[position][1] for position in positions],
+                    np.stack([embedded[position][0] for position in positions]),
+                    np.array([embedded[position][1] for position in positions]),
+                )
+                for position, result in zip(positions, institution_results):
+                    results[position] = result
+            return results
+
+        return classify_institutions
+
+    reference_data_path = check_file_exists(
+        input_dir, "complaints_data_classification_reference_examples.xlsx"
+    )
+    state = {}
+    state_lock = threading.Lock()
+
+    def load_state():
+        state["classifier"] = load_embedding_classifier(
+            reference_data_path,
+            cache_dir,
+            mode if technique == "vector-embedding" else "nearest",
+            use_ann and technique == "vector-embedding",
+            precision,
+        )
+        state["checked"] = time.monotonic()
+
+    def current_classifier():
+        with state_lock:
+            if time.monotonic() - state["checked"] >= ACTIVE_MODEL_CHECK_SECONDS:
+                state["checked"] = time.monotonic()
+                model = get_active_embedding_model(reference_data_path, EMBEDDING_MODEL)
+                if model != state["classifier"]["model"]:
+                    print(f"Switching to the '{model}' reference embeddings.")
+                    load_state()
+            return state["classifier"]
+
+    def classify_references(complaints):
+        classifier = current_classifier()
+        query_matrix, valid_mask = embed(complaints, classifier["model"])
+        return classify_vectors(classifier, complaints, query_matrix, valid_mask)
+
+    load_state()
+    return classify_references
+
+
+def create_institution_registry(
+    institutions_dir: str,
+    output_dir: str,
+    technique: str,
+    mode: str = "nearest",
+    use_ann: bool = False,
+    precision: str = "float32",
+    max_bytes: int = DEFAULT_REGISTRY_MAX_BYTES,
+) -> SimpleNamespace:
+    """
+    Creates a registry of the reference indexes of all institutions in a directory, loaded
+    on first request and evicted least recently used beyond `max_bytes`. An index is
+    loaded again when a migration switches the active embedding model of its institution.
+
+    Args:
+        institutions_dir (str): Directory with one reference Excel file per institution.
+        output_dir (str): Directory with the embedding cache.
+        technique (str): "vector-embedding" or "cascade".
+        mode (str, optional): Vector-embedding classification mode.
+        use_ann (bool, optional): Load an IVF index per institution.
+        precision (str, optional): Storage precision of the reference vectors.
+        max_bytes (int, optional): Memory cap of the resident indexes.
+
+    Returns:
+        SimpleNamespace: Registry from `create_index_registry`.
+    """
+    cache_dir = os.path.join(output_dir, "embedding_cache")
+    return create_index_registry(
+        discover_reference_indexes(institutions_dir),
+        lambda reference_file: load_embedding_classifier(
+            reference_file,
+            cache_dir,
+            mode if technique == "vector-embedding" else "nearest",
+            use_ann and technique == "vector-embedding",
+            precision,
+        ),
+        max_bytes=max_bytes,
+        current_version=lambda reference_file: get_active_embedding_model(
+            reference_file, EMBEDDING_MODEL
+        ),
+        version_check_seconds=ACTIVE_MODEL_CHECK_SECONDS,
+    )
+
+
+def handle_request(
+    payload: Dict[str, Any],
+    submit: Callable[[Any], concurrent.futures.Future],
+    institutions: bool = False,
+) -> Dict[str, Any]:
+    """
+    Answers one classification request.
+
+    A request holds either a single `complaint` or a list of `complaints`, and optionally
+    an `id` that is echoed back. Every complaint is submitted to the micro-batcher
+    individually, so complaints of different callers share model calls. A service with
+    institution reference indexes requires the `institution` whose references are used.
+
+    Args:
+        payload (Dict[str, Any]): The decoded request.
+        submit (Callable[[Any], concurrent.futures.Future]): Micro-batcher from `create_micro_batcher`.
+        institutions (bool, optional): Submit (institution, complaint) pairs.
+
+    Returns:
+        Dict[str, Any]: The result of a single complaint, a `results` list for several
+        complaints, or an `error`.
+    """
+    if not isinstance(payload, dict):
+        return {"error": "Request must be a JSON object"}
+    response = {"id": payload["id"]} if "id" in payload else {}
+    if institutions != ("institution" in payload):
+        response["error"] = (
+            "Request needs an 'institution'."
+            if institutions
+            else "This service has no institution reference indexes."
+        )
+        return response
+
+    def item(complaint):
+        if institutions:
+            return str(payload["institution"]), str(complaint)
+        return str(complaint)
+
+    try:
+        if isinstance(payload.get("complaints"), list):
+            futures = [submit(item(complaint)) for complaint in payload["complaints"]]
+            response["results"] = [future.result() for future in futures]
+        elif "complaint" in payload:
+            response.update(submit(item(payload["complaint"])).result())
+        else:
+            response["error"] = "Request needs a 'complaint' or a 'complaints' list."
+    except Exception as e:
+        response["error"] = str(e)
+    return response
+
+
+def run_http_server(
+    submit: Callable[[Any], concurrent.futures.Future],
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    registry: Optional[SimpleNamespace] = None,
+) -> None:
+    """
+    Serves classification requests over HTTP until interrupted.
+
+    POST /classify takes a JSON request (see `handle_request`); GET /health reports
+    readiness and, with institution reference indexes, the registry's counters.
+    """
+
+    class ClassificationRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                body = {"status": "ok"}
+                if registry is not None:
+                    body["index_registry"] = {
+                        **registry.stats,
+                        "resident": registry.resident(),
+                    }
+                self._send_json(200, body)
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if self.path != "/classify":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send_json(400, {"error": f"Invalid JSON: {e}"})
+                return
+            response = handle_request(payload, submit, registry is not None)
+            self._send_json(400 if "error" in response else 200, response)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), ClassificationRequestHandler)
+    print(f"Classification service listening on http://{host}:{port}/classify")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run_stdin_worker(
+    submit: Callable[[Any], concurrent.futures.Future],
+    output: TextIO,
+    max_in_flight: int = 256,
+    institutions: bool = False,
+) -> None:
+    """
+    Answers JSONL classification requests from stdin on stdout until stdin is closed.
+
+    Requests are handled concurrently, so consecutive lines share model calls; responses
+    are written to `output` as they complete and carry the request's `id`.
+    """
+    output_lock = threading.Lock()
+
+    def answer(line):
+        try:
+            response = handle_request(json.loads(line), submit, institutions)
+        except json.JSONDecodeError as e:
+            response = {"error": f"Invalid JSON: {e}"}
+        except Exception as e:
+            response = {"error": str(e)}
+        with output_lock:
+            output.write(json.dumps(response, ensure_ascii=False) + "\n")
+            output.flush()
+
+    with concurrent.futures.ThreadPoolExecutor(max_in_flight) as executor:
+        for line in sys.stdin:
+            if line.strip():
+                executor.submit(answer, line)
+
+
+def main():
+    """
+    Starts the resident classification service as an HTTP server or a stdin/stdout JSONL worker.
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve complaint classification requests from a long-lived process."
+    )
+    parser.add_argument(
+        "--technique",
+        choices=["few-shot", "fine-tuning", "vector-embedding", "cascade"],
+        default="vector-embedding",
+    )
+    parser.add_argument(
+        "--stdin",
+        action="store_true",
+        help="Read JSONL requests from stdin instead of serving HTTP.",
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--embedding-mode",
+        choices=["nearest", "knn", "centroid", "medoid"],
+        default="nearest",
+    )
+    parser.add_argument("--knn-k", type=int, default=KNN_TOP_K)
+    parser.add_argument("--ann", action="store_true")
+    parser.add_argument("--n-probe", type=int, default=DEFAULT_N_PROBE)
+    parser.add_argument(
+        "--margin-threshold", type=float, default=DEFAULT_MARGIN_THRESHOLD
+    )
+    parser.add_argument(
+        "--cascade-llm", choices=["few-shot", "fine-tuning"], default="few-shot"
+    )
+    parser.add_argument("--fine-tuned-model", default=None)
+    parser.add_argument("--precision", choices=PRECISIONS, default="float32")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE)
+    parser.add_argument(
+        "--max-wait-ms", type=float, default=MAX_BATCH_WAIT_SECONDS * 1000
+    )
+    parser.add_argument(
+        "--institutions-dir",
+        default=None,
+        help="Vector-embedding and cascade only: directory with one reference Excel file per institution; requests then name their 'institution'.",
+    )
+    parser.add_argument(
+        "--registry-max-mib",
+        type=float,
+        default=DEFAULT_REGISTRY_MAX_BYTES / 2**20,
+        help="Memory cap of the resident institution reference indexes.",
+    )
+    args = parser.parse_args()
+    if args.institutions_dir and args.technique not in ("vector-embedding", "cascade"):
+        parser.error(
+            "--institutions-dir requires the vector-embedding or cascade technique."
+        )
+    if (
+        args.ann
+        and args.technique == "vector-embedding"
+        and args.precision != "float32"
+    ):
+        parser.error(
+            "--ann searches float32 vectors and cannot be combined with a lower --precision."
+        )
+
+    current_dir = os.getcwd()
+    input_dir = os.path.join(current_dir, "input")
+    output_dir = os.path.join(current_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+
+    output = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr if args.stdin else output):
+        try:
+            registry = None
+            if args.institutions_dir:
+                registry = create_institution_registry(
+                    args.institutions_dir,
+                    output_dir,
+                    args.technique,
+                    mode=args.embedding_mode,
+                    use_ann=args.ann,
+                    precision=args.precision,
+                    max_bytes=int(args.registry_max_mib * 2**20),
+                )
+                print(
+                    f"{len(registry.names)} institution reference indexes found, loaded on first request."
+                )
+            classify_batch = load_batch_classifier(
+                args.technique,
+                input_dir,
+                output_dir,
+                mode=args.embedding_mode,
+                top_k=args.knn_k,
+                use_ann=args.ann,
+                n_probe=args.n_probe,
+                margin_threshold=args.margin_threshold,
+                cascade_llm=args.cascade_llm,
+                fine_tuned_model=args.fine_tuned_model,
+                precision=args.precision,
+                registry=registry,
+            )
+        except (FileNotFoundError, RuntimeError) as e:
+            print(e)
+            sys.exit(1)
+
+        submit = create_micro_batcher(
+            classify_batch,
+            max_batch_size=args.max_batch_size,
+            max_wait_seconds=args.max_wait_ms / 1000,
+        )
+        if args.stdin:
+            run_stdin_worker(submit, output, institutions=registry is not None)
+        else:
+            run_http_server(submit, args.host, args.port, registry)
+
+
+if __name__ == "__main__":
+    main()
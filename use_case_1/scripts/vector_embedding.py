@@ -1,12 +1,99 @@
-from retrieval.embedder import create_reference_embeddings
+import os
+from typing import Any, Dict
+from retrieval.embedder import EMBEDDING_MODEL, create_reference_embeddings
+from retrieval.ann_index import DEFAULT_N_PROBE, load_or_build_ivf_index
+from retrieval.category_index import load_or_build_category_index
+from retrieval.embedding_store import (
+    get_active_embedding_model,
+    get_store_fingerprint,
+    load_store_row_keys,
+)
+from retrieval.quantization import load_or_build_quantized_store
+from utils.chunked_io import CHUNK_SIZE
 from retrieval.retriever import (
-    load_reference_data_with_embeddings,
+    KNN_TOP_K,
+    load_reference_store,
     categorize_complaints,
 )
 
 
+def load_embedding_classifier(
+    reference_data_path: str,
+    cache_dir: str,
+    mode: str = "nearest",
+    use_ann: bool = False,
+    precision: str = "float32",
+) -> Dict[str, Any]:
+    """
+    Loads everything vector-embedding classification needs for the reference data.
+
+    The store of the reference file's active embedding model is used (see
+    `get_active_embedding_model`), so a migration to another model only takes effect once
+    it has been switched over.
+
+    Args:
+        reference_data_path (str): Path to the Excel file containing reference complaint data with known categories.
+        cache_dir (str): Root directory of the persistent embedding cache.
+        mode (str, optional): "nearest", "knn", "centroid" or "medoid". Defaults to "nearest".
+        use_ann (bool, optional): Load or build an IVF index for "nearest" and "knn" modes.
+        precision (str, optional): Storage precision of the reference vectors searched by
+            brute force: "float32", "float16" or "int8". Defaults to "float32". The IVF
+            index holds float32 vectors, so `use_ann` requires "float32".
+
+    Returns:
+        Dict[str, Any]: The embedding `model`, the reference `matrix`, its `labels` and
+        int8 `scales` (or None), and the `category_index` and `ann_index` (or None).
+    """
+    if use_ann and mode in ("nearest", "knn") and precision != "float32":
+        raise ValueError(
+            f"The ANN index holds float32 vectors and cannot be used with {precision}."
+        )
+    model = get_active_embedding_model(reference_data_path, EMBEDDING_MODEL)
+    create_reference_embeddings(reference_data_path, cache_dir, model)
+
+    reference_matrix, reference_labels = load_reference_store(
+        reference_data_path, model
+    )
+
+    category_index = None
+    if mode in ("centroid", "medoid"):
+        category_index = load_or_build_category_index(
+            reference_data_path, model, reference_matrix, reference_labels
+        )
+
+    ann_index = None
+    if use_ann and mode in ("nearest", "knn"):
+        ann_index = load_or_build_ivf_index(
+            reference_data_path,
+            model,
+            reference_matrix,
+            load_store_row_keys(reference_data_path, model),
+        )
+    reference_vectors, reference_scales = load_or_build_quantized_store(
+        reference_data_path, model, reference_matrix, precision
+    )
+    return {
+        "model": model,
+        "fingerprint": get_store_fingerprint(reference_data_path, model),
+        "matrix": reference_vectors,
+        "labels": reference_labels,
+        "scales": reference_scales,
+        "category_index": category_index,
+        "ann_index": ann_index,
+    }
+
+
 def embedding_classification(
-    reference_data_path: str, uncategorized_data_path: str, output_dir: str
+    reference_data_path: str,
+    uncategorized_data_path: str,
+    output_dir: str,
+    mode: str = "nearest",
+    top_k: int = KNN_TOP_K,
+    use_ann: bool = False,
+    n_probe: int = DEFAULT_N_PROBE,
+    chunk_size: int = CHUNK_SIZE,
+    deduplicate: bool = False,
+    precision: str = "float32",
 ) -> None:
     """
     perform the classification process using vector embeddings.
@@ -14,12 +101,37 @@ def embedding_classification(
         reference_data_path (str): Path to the Excel file containing reference complaint data with known categories.
         uncategorized_data_path (str): Path to the Excel file containing uncategorized complaints to be classified.
         output_dir (str): Path to the directory where the categorized output file will be saved.
+        mode (str, optional): "nearest", "knn", "centroid" or "medoid". Defaults to "nearest".
+        top_k (int, optional): Number of neighbours voting in "knn" mode.
+        use_ann (bool, optional): Search an IVF index instead of scoring every reference.
+        n_probe (int, optional): Number of IVF lists scanned per complaint.
+        chunk_size (int, optional): Number of complaints processed per chunk.
+        deduplicate (bool, optional): Classify one representative per duplicate cluster.
+        precision (str, optional): Storage precision of the reference vectors: "float32",
+            "float16" or "int8". Defaults to "float32".
 
     Returns:
         None: The function saves the categorized complaints to an Excel file in `output_dir`.
     """
-    create_reference_embeddings(reference_data_path)
-
-    reference_df = load_reference_data_with_embeddings(reference_data_path)
+    cache_dir = os.path.join(output_dir, "embedding_cache")
+    classifier = load_embedding_classifier(
+        reference_data_path, cache_dir, mode, use_ann, precision
+    )
 
-    categorize_complaints(reference_df, uncategorized_data_path, output_dir)
+    categorize_complaints(
+        classifier["matrix"],
+        classifier["labels"],
+        uncategorized_data_path,
+        output_dir,
+        cache_dir,
+        mode=mode,
+        category_index=classifier["category_index"],
+        top_k=top_k,
+        ann_index=classifier["ann_index"],
+        n_probe=n_probe,
+        chunk_size=chunk_size,
+        deduplicate=deduplicate,
+        reference_scales=classifier["scales"],
+        model=classifier["model"],
+        reference_fingerprint=classifier["fingerprint"],
+    )
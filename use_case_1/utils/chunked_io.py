@@ -0,0 +1,206 @@
+import os
+import shutil
+import pandas as pd
+from typing import Iterator, List
+
+
+CHUNK_SIZE = 1000
+
+
+def iter_complaint_chunks(
+    input_file: str, chunk_size: int = CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Reads a complaints file in fixed-size row chunks without loading the whole file.
+
+    CSV files are read with pandas' chunked reader, Parquet files batch by batch with
+    pyarrow and Excel files row by row with openpyxl's read-only mode. Every chunk keeps
+    the row positions of the full file as its index.
+
+    Args:
+        input_file (str): Path to a .csv, .parquet or .xlsx file.
+        chunk_size (int, optional): Number of rows per chunk. Defaults to CHUNK_SIZE.
+
+    Yields:
+        pd.DataFrame: The next chunk of rows.
+    """
+    extension = os.path.splitext(input_file)[1].lower()
+    if extension == ".csv":
+        yield from pd.read_csv(input_file, chunksize=chunk_size)
+    elif extension == ".parquet":
+        yield from _iter_parquet_chunks(input_file, chunk_size)
+    elif extension in (".xlsx", ".xlsm"):
+        yield from _iter_excel_chunks(input_file, chunk_size)
+    else:
+        raise ValueError(f"Unsupported complaints file format: '{extension}'")
+
+
+def _iter_parquet_chunks(input_file: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Reading Parquet files requires 'pyarrow'.") from e
+
+    start = 0
+    for batch in pq.ParquetFile(input_file).iter_batches(batch_size=chunk_size):
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(start, start + len(chunk))
+        start += len(chunk)
+        yield chunk
+
+
+def _iter_excel_chunks(input_file: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(column) for column in header]
+
+        start = 0
+        buffer = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            buffer.append(row[: len(columns)])
+            if len(buffer) == chunk_size:
+                yield pd.DataFrame(
+                    buffer,
+                    columns=columns,
+                    index=pd.RangeIndex(start, start + chunk_size),
+                )
+                start += chunk_size
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(
+                buffer, columns=columns, index=pd.RangeIndex(start, start + len(buffer))
+            )
+    finally:
+        workbook.close()
+
+
+def get_partial_results_path(output_file: str) -> str:
+    """
+    Returns the path of the directory that collects finished chunks of an output file.
+    """
+    return f"{output_file}.partial"
+
+
+def discard_partial_results(output_file: str) -> None:
+    """
+    Removes partial results left behind by an earlier, interrupted run.
+    """
+    partial_dir = get_partial_results_path(output_file)
+    if os.path.exists(partial_dir):
+        shutil.rmtree(partial_dir)
+
+
+def append_result_chunk(output_file: str, chunk: pd.DataFrame) -> None:
+    """
+    Appends a finished chunk to the partial results of an output file and flushes it to disk.
+
+    Every chunk is pickled to its own file, so its column types (dates, text IDs with
+    leading zeros, ...) reach the final file unchanged. Only the chunk being processed is
+    ever held in memory, and a crash loses at most the chunk that was in flight.
+
+    Args:
+        output_file (str): Final output path the results are collected for.
+        chunk (pd.DataFrame): Classified rows to append.
+    """
+    partial_dir = get_partial_results_path(output_file)
+    os.makedirs(partial_dir, exist_ok=True)
+    chunk_file = os.path.join(
+        partial_dir, f"chunk_{len(_list_partial_chunks(partial_dir)):06d}.pkl"
+    )
+    with open(f"{chunk_file}.tmp", "wb") as f:
+        chunk.to_pickle(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{chunk_file}.tmp", chunk_file)
+
+
+def _list_partial_chunks(partial_dir: str) -> List[str]:
+    if not os.path.exists(partial_dir):
+        return []
+    return [
+        os.path.join(partial_dir, filename)
+        for filename in sorted(os.listdir(partial_dir))
+        if filename.endswith(".pkl")
+    ]
+
+
+def finalize_results(output_file: str) -> str:
+    """
+    Converts the partial results of an output file into its final format, chunk by chunk.
+
+    The format follows the output file's extension (.csv, .parquet or .xlsx). Without any
+    partial results, an empty file of that format is written.
+
+    Args:
+        output_file (str): Final output path.
+
+    Returns:
+        str: Path to the final output file.
+    """
+    partial_dir = get_partial_results_path(output_file)
+    chunk_files = _list_partial_chunks(partial_dir)
+    chunks = (pd.read_pickle(chunk_file) for chunk_file in chunk_files)
+    extension = os.path.splitext(output_file)[1].lower()
+
+    if extension == ".csv":
+        with open(output_file, "w", encoding="utf-8", newline="") as f:
+            for position, chunk in enumerate(chunks):
+                chunk.to_csv(f, header=position == 0, index=False)
+
+    elif extension == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Writing Parquet files requires 'pyarrow'.") from e
+
+        writer = None
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    writer = pq.ParquetWriter(output_file, table.schema)
+                else:
+                    table = pa.Table.from_pandas(
+                        chunk, schema=writer.schema, preserve_index=False
+                    )
+                writer.write_table(table)
+            if writer is None:
+                pq.write_table(pa.table({}), output_file)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        worksheet = workbook.create_sheet()
+        for position, chunk in enumerate(chunks):
+            if position == 0:
+                worksheet.append(list(chunk.columns))
+            for row in chunk.itertuples(index=False):
+                worksheet.append(
+                    [None if _is_missing(value) else value for value in row]
+                )
+        workbook.save(output_file)
+
+    discard_partial_results(output_file)
+    return output_file
+
+
+def _is_missing(value) -> bool:
+    """
+    Returns whether a cell value is a missing scalar (NaN, NaT or None).
+    """
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
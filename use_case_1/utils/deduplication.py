@@ -0,0 +1,141 @@
+import re
+import zlib
+import hashlib
+import unicodedata
+import numpy as np
+from typing import Dict, List
+
+from utils.chunked_io import CHUNK_SIZE, iter_complaint_chunks
+
+
+SHINGLE_SIZE = 3
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_rng = np.random.default_rng(1)
+_PERMUTATION_A = _rng.integers(1, 1 << 32, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERMUTATION_B = _rng.integers(0, 1 << 32, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_complaint(text: str) -> str:
+    """
+    Normalizes a complaint for duplicate detection: Unicode NFKC, case folding and
+    collapsed whitespace and punctuation.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+
+def word_shingles(normalized_text: str, size: int = SHINGLE_SIZE) -> List[str]:
+    """
+    Returns the overlapping word n-grams of a normalized complaint.
+
+    Texts shorter than `size` words form a single shingle.
+    """
+    words = normalized_text.split()
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i : i + size]) for i in range(len(words) - size + 1)]
+
+
+def minhash_signature(shingles: List[str]) -> np.ndarray:
+    """
+    Computes the MinHash signature of a set of shingles.
+
+    Each shingle is hashed to 32 bits with CRC32 and passed through
+    `MINHASH_PERMUTATIONS` universal hash functions modulo a Mersenne prime; the signature
+    holds the minimum of every function. The fraction of equal positions in two
+    signatures estimates the Jaccard similarity of the shingle sets.
+
+    Args:
+        shingles (List[str]): Shingles of one complaint.
+
+    Returns:
+        np.ndarray: (MINHASH_PERMUTATIONS,) uint64 signature.
+    """
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) for shingle in set(shingles)),
+        dtype=np.uint64,
+    )
+    permuted = (
+        _PERMUTATION_A[:, None] * hashes[None, :] + _PERMUTATION_B[:, None]
+    ) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def assign_duplicate_clusters(
+    input_file: str,
+    chunk_size: int = CHUNK_SIZE,
+    near_duplicates: bool = True,
+    threshold: float = NEAR_DUPLICATE_THRESHOLD,
+) -> np.ndarray:
+    """
+    Groups the complaints of a file into clusters of exact and near-duplicates.
+
+    The file is streamed once. A complaint whose normalized text was seen before joins the
+    cluster of that text. Otherwise its MinHash signature is split into `LSH_BANDS` bands,
+    and the cluster representatives sharing a band are compared with it; it joins the most
+    similar one whose estimated Jaccard similarity of word shingles reaches `threshold`,
+    or starts a new cluster. Every cluster is represented by its first row, so the
+    representative always comes before its duplicates.
+
+    Args:
+        input_file (str): Path to the complaints file (.xlsx, .csv or .parquet).
+        chunk_size (int, optional): Number of rows read at a time.
+        near_duplicates (bool, optional): Also cluster near-duplicates. Defaults to True.
+        threshold (float, optional): Minimum estimated Jaccard similarity of near-duplicates.
+
+    Returns:
+        np.ndarray: For every row position, the row position of its cluster's representative.
+    """
+    rows_per_band = MINHASH_PERMUTATIONS // LSH_BANDS
+    exact_clusters: Dict[bytes, int] = {}
+    band_buckets: Dict[bytes, List[int]] = {}
+    signatures: Dict[int, np.ndarray] = {}
+    clusters = []
+
+    for chunk in iter_complaint_chunks(input_file, chunk_size):
+        for position, complaint in zip(chunk.index, chunk["Complaint"]):
+            normalized = normalize_complaint("" if complaint is None else complaint)
+            digest = hashlib.sha256(normalized.encode("utf-8")).digest()[:16]
+            if digest in exact_clusters:
+                clusters.append(exact_clusters[digest])
+                continue
+
+            representative = position
+            if near_duplicates and normalized:
+                signature = minhash_signature(word_shingles(normalized))
+                bands = [
+                    bytes([band])
+                    + signature[
+                        band * rows_per_band : (band + 1) * rows_per_band
+                    ].tobytes()
+                    for band in range(LSH_BANDS)
+                ]
+                candidates = {
+                    candidate
+                    for band in bands
+                    for candidate in band_buckets.get(band, ())
+                }
+                best_similarity = threshold
+                for candidate in candidates:
+                    similarity = float(np.mean(signatures[candidate] == signature))
+                    if similarity >= best_similarity:
+                        representative, best_similarity = candidate, similarity
+                if representative == position:
+                    signatures[position] = signature
+                    for band in bands:
+                        band_buckets.setdefault(band, []).append(position)
+
+            exact_clusters[digest] = representative
+            clusters.append(representative)
+
+    clusters = np.asarray(clusters, dtype=np.int64)
+    n_representatives = int(np.sum(clusters == np.arange(len(clusters))))
+    print(
+        f"Deduplication: {len(clusters)} complaints in {n_representatives} clusters, "
+        f"{len(clusters) - n_representatives} duplicates will reuse their representative's label."
+    )
+    return clusters
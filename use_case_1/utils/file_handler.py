@@ -1,35 +1,182 @@
-import pandas as pd
 import json
 import os
-from llm.llm_engine import get_prompt_for_fine_tuned_classification, create_user_prompt
+import hashlib
+import numpy as np
+from typing import Any, Dict
+from llm.llm_engine import (
+    count_tokens,
+    count_tokens_batch,
+    create_user_prompt,
+    get_prompt_for_fine_tuned_classification,
+)
+from utils.chunked_io import CHUNK_SIZE, iter_complaint_chunks
 
 
-def prepare_fine_tuning_data(training_file: str, jsonl_filename: str) -> None:
+VALIDATION_FRACTION = 0.1
+FINE_TUNING_MAX_FILE_BYTES = 512 * 1024**2
+FINE_TUNING_MAX_EXAMPLE_TOKENS = 65536
+FINE_TUNING_MIN_EXAMPLES = 10
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_EXAMPLE = 3
+
+
+def prepare_fine_tuning_data(
+    training_file: str,
+    output_prefix: str,
+    validation_fraction: float = VALIDATION_FRACTION,
+    max_file_bytes: int = FINE_TUNING_MAX_FILE_BYTES,
+    max_example_tokens: int = FINE_TUNING_MAX_EXAMPLE_TOKENS,
+    chunk_size: int = CHUNK_SIZE,
+) -> Dict[str, Any]:
     """
-    Reads an Excel file containing training data and converts it into a JSONL format
+    Streams labelled complaints into a train and a validation JSONL file in the chat format
     required for fine-tuning OpenAI models.
 
+    The file is read chunk by chunk and every example is serialized from a prefix that
+    already holds the encoded system prompt. Exact duplicate examples (same complaint and
+    label) are dropped. The split is stratified: every category sends every
+    1/`validation_fraction`-th example to validation. Tokens are counted per example with
+    the model's tokenizer; examples above `max_example_tokens` are dropped. Once a file is
+    full, i.e. an example would take it beyond `max_file_bytes`, all further examples of
+    that split are dropped and counted.
+
     Args:
-        training_file (str): Path to the training dataset (Excel).
-        jsonl_filename (str): Path to save the JSONL formatted file.
+        training_file (str): Path to the training dataset (.xlsx, .csv or .parquet).
+        output_prefix (str): Path prefix of the files, e.g. "output/finetuning" gives
+            "output/finetuning.train.jsonl".
+        validation_fraction (float, optional): Fraction of every category held out for validation.
+        max_file_bytes (int, optional): Maximum size of a file.
+        max_example_tokens (int, optional): Maximum tokens of a single example.
+        chunk_size (int, optional): Number of rows read at a time.
+
+    Returns:
+        Dict[str, Any]: The "train_file" and "validation_file" paths (None if the split has
+        no examples) and example and token statistics.
     """
-    df = pd.read_excel(training_file)
-
-    with open(jsonl_filename, "w", encoding="utf-8") as f:
-        for _, row in df.iterrows():
-            complaint_text = str(row["Complaint"])
-            category_label = str(row["Issue_category_manual"])
-            example = {
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": get_prompt_for_fine_tuned_classification(),
-                    },
-                    {"role": "user", "content": create_user_prompt(complaint_text)},
-                    {"role": "assistant", "content": category_label},
-                ]
-            }
-            f.write(json.dumps(example, ensure_ascii=False) + "\n")
+    system_prompt = get_prompt_for_fine_tuned_classification()
+    prefix = (
+        '{"messages": [{"role": "system", "content": '
+        + json.dumps(system_prompt, ensure_ascii=False)
+        + '}, {"role": "user", "content": '
+    )
+    middle = '}, {"role": "assistant", "content": '
+    suffix = "}]}\n"
+    base_tokens = (
+        count_tokens(system_prompt) + 3 * TOKENS_PER_MESSAGE + TOKENS_PER_EXAMPLE
+    )
+
+    seen = set()
+    category_counts: Dict[str, list] = {}
+    label_tokens: Dict[str, int] = {}
+    outputs: Dict[str, Dict[str, Any]] = {}
+    full = set()
+    example_tokens = {"train": [], "validation": []}
+    dropped = {"duplicates": 0, "too_long": 0, "empty": 0, "file_full": 0}
+
+    os.makedirs(os.path.dirname(output_prefix) or ".", exist_ok=True)
+    try:
+        for chunk in iter_complaint_chunks(training_file, chunk_size):
+            complete = (
+                chunk["Complaint"].notna() & chunk["Issue_category_manual"].notna()
+            )
+            dropped["empty"] += int((~complete).sum())
+            chunk = chunk[complete]
+            user_messages = [
+                create_user_prompt(str(complaint)) for complaint in chunk["Complaint"]
+            ]
+            labels = chunk["Issue_category_manual"].astype(str).str.strip().tolist()
+            for label in set(labels) - label_tokens.keys():
+                label_tokens[label] = count_tokens(label)
+
+            for user_message, label, user_tokens in zip(
+                user_messages, labels, count_tokens_batch(user_messages)
+            ):
+                key = hashlib.blake2b(
+                    f"{user_message}\0{label}".encode("utf-8"), digest_size=16
+                ).digest()
+                if key in seen:
+                    dropped["duplicates"] += 1
+                    continue
+                seen.add(key)
+
+                tokens = base_tokens + user_tokens + label_tokens[label]
+                if tokens > max_example_tokens:
+                    dropped["too_long"] += 1
+                    continue
+
+                counts = category_counts.setdefault(label, [0, 0])
+                counts[0] += 1
+                split = "train"
+                if int(counts[0] * validation_fraction) > counts[1]:
+                    split = "validation"
+                    counts[1] += 1
+
+                line = (
+                    prefix
+                    + json.dumps(user_message, ensure_ascii=False)
+                    + middle
+                    + json.dumps(label, ensure_ascii=False)
+                    + suffix
+                ).encode("utf-8")
+                output = outputs.get(split)
+                if output is None:
+                    path = f"{output_prefix}.{split}.jsonl"
+                    output = outputs[split] = {
+                        "path": path,
+                        "bytes": 0,
+                        "file": open(path, "wb", buffering=1 << 20),
+                    }
+                if split in full or output["bytes"] + len(line) > max_file_bytes:
+                    full.add(split)
+                    dropped["file_full"] += 1
+                    counts[0] -= 1
+                    if split == "validation":
+                        counts[1] -= 1
+                    continue
+                output["file"].write(line)
+                output["bytes"] += len(line)
+                example_tokens[split].append(tokens)
+    finally:
+        for output in outputs.values():
+            output["file"].close()
+
+    stats: Dict[str, Any] = {
+        "train_file": outputs["train"]["path"] if example_tokens["train"] else None,
+        "validation_file": outputs["validation"]["path"]
+        if example_tokens["validation"]
+        else None,
+        "dropped": dropped,
+        "categories": {
+            label: {"train": n - n_val, "validation": n_val}
+            for label, (n, n_val) in sorted(category_counts.items())
+        },
+    }
+    for split, tokens in example_tokens.items():
+        tokens = np.asarray(tokens, dtype=np.int64)
+        stats[split] = {
+            "examples": int(len(tokens)),
+            "tokens": int(tokens.sum()),
+            "mean_example_tokens": float(tokens.mean()) if len(tokens) else 0.0,
+            "max_example_tokens": int(tokens.max()) if len(tokens) else 0,
+        }
+
+    print(
+        f"Fine-tuning data: {stats['train']['examples']} train and "
+        f"{stats['validation']['examples']} validation examples "
+        f"({stats['train']['tokens']} and {stats['validation']['tokens']} tokens), "
+        f"dropped {dropped['duplicates']} duplicates, {dropped['too_long']} over "
+        f"{max_example_tokens} tokens and {dropped['empty']} incomplete rows."
+    )
+    if stats["train"]["examples"] < FINE_TUNING_MIN_EXAMPLES:
+        print(
+            f"Warning: fine-tuning requires at least {FINE_TUNING_MIN_EXAMPLES} training examples."
+        )
+    if dropped["file_full"]:
+        print(
+            f"Warning: {dropped['file_full']} examples did not fit into the {max_file_bytes} "
+            "byte limit of a fine-tuning file and were dropped."
+        )
+    return stats
 
 
 def check_file_exists(directory: str, filename: str) -> str:
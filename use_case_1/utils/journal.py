@@ -0,0 +1,186 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, Iterable, Optional
+
+
+_journal_lock = threading.Lock()
+
+
+def get_journal_path(output_file: str) -> str:
+    """
+    Returns the path of the progress journal kept beside an output file.
+    """
+    return f"{output_file}.journal.jsonl"
+
+
+def fingerprint_file(file_path: str) -> str:
+    """
+    Returns the sha256 hex digest of a file's content, read in blocks.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def open_journal(
+    output_file: str, input_file: str, settings: Dict[str, Any]
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Opens the append-only progress journal of a classification run.
+
+    The first line of the journal identifies the run by the input file's content hash and
+    the technique settings. If they match, the rows classified so far are returned so the
+    run can resume; otherwise a fresh journal is started.
+
+    Args:
+        output_file (str): Final output path of the run.
+        input_file (str): Path to the complaints file being classified.
+        settings (Dict[str, Any]): Technique and parameters that determine the results.
+
+    Returns:
+        Dict[int, Dict[str, Any]]: Journal records keyed by input row position.
+    """
+    journal_path = get_journal_path(output_file)
+    header = {"input_fingerprint": fingerprint_file(input_file), "settings": settings}
+    header = json.loads(json.dumps(header, default=str))
+
+    records = {}
+    if os.path.exists(journal_path):
+        with open(journal_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        if lines and _parse_line(lines[0]) == header:
+            for line in lines[1:]:
+                record = _parse_line(line)
+                if record is not None and "row" in record:
+                    records[int(record["row"])] = record
+            if records:
+                print(f"Resuming from journal: {len(records)} rows already classified.")
+            return records
+
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+    return records
+
+
+def _parse_line(line: str) -> Any:
+    """
+    Parses one journal line, ignoring a torn last line left by an interrupted write.
+    """
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return None
+
+
+def record_results(
+    output_file: str,
+    journal: Dict[int, Dict[str, Any]],
+    records: Iterable[Dict[str, Any]],
+) -> None:
+    """
+    Appends classification results to the journal and flushes them to disk.
+
+    Records must carry the input row position under `row`. Only results worth keeping
+    should be recorded; rows left out are classified again when the run resumes.
+
+    Args:
+        output_file (str): Final output path of the run.
+        journal (Dict[int, Dict[str, Any]]): Journal from `open_journal`, updated in place.
+        records (Iterable[Dict[str, Any]]): Results to append.
+    """
+    records = list(records)
+    if not records:
+        return
+    lines = "".join(
+        json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records
+    )
+    with _journal_lock:
+        with open(get_journal_path(output_file), "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        for record in records:
+            journal[int(record["row"])] = record
+
+
+def pending_rows(
+    chunk: pd.DataFrame,
+    journal: Dict[int, Dict[str, Any]],
+    clusters: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """
+    Returns the rows of a chunk that still need to be classified.
+
+    Every row is looked up in the journal's keys, so the cost grows with the chunk, not
+    with the number of rows journaled so far.
+
+    Args:
+        chunk (pd.DataFrame): Input rows, indexed by input row position.
+        journal (Dict[int, Dict[str, Any]]): Journal from `open_journal`.
+        clusters (Optional[np.ndarray]): Duplicate clusters from
+            `assign_duplicate_clusters`; only cluster representatives are returned.
+
+    Returns:
+        pd.DataFrame: Rows without a journaled result.
+    """
+    pending = np.fromiter(
+        (int(row) not in journal for row in chunk.index), dtype=bool, count=len(chunk)
+    )
+    if clusters is not None:
+        pending &= clusters[chunk.index] == chunk.index
+    return chunk[pending]
+
+
+def apply_journal(
+    chunk: pd.DataFrame,
+    journal: Dict[int, Dict[str, Any]],
+    columns: Dict[str, str],
+    default: Any = "",
+    clusters: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """
+    Adds the journaled results of a chunk's rows as output columns.
+
+    With duplicate clusters, every row takes the result of its cluster's representative
+    and the representative's row position is added as the "Duplicate_cluster" column.
+
+    Args:
+        chunk (pd.DataFrame): Input rows, indexed by input row position.
+        journal (Dict[int, Dict[str, Any]]): Journal from `open_journal`.
+        columns (Dict[str, str]): Mapping from output column to journal record field.
+        default (Any, optional): Value for rows without a result. Defaults to "".
+        clusters (Optional[np.ndarray]): Duplicate clusters from `assign_duplicate_clusters`.
+
+    Returns:
+        pd.DataFrame: The chunk with the output columns appended.
+    """
+    sources = chunk.index if clusters is None else clusters[chunk.index]
+    for column, field in columns.items():
+        chunk[column] = [
+            journal.get(int(source), {}).get(field, default) for source in sources
+        ]
+    if clusters is not None:
+        chunk["Duplicate_cluster"] = sources
+    return chunk
+
+
+def close_journal(output_file: str) -> None:
+    """
+    Removes the journal once its results have been merged into the final output.
+    """
+    journal_path = get_journal_path(output_file)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+
+def is_classified(category: str) -> bool:
+    """
+    Tells whether a model response is a usable label rather than an empty or error response.
+    """
+    return bool(category) and not str(category).startswith("Error:")
@@ -6,6 +6,13 @@ from dotenv import load_dotenv
 load_dotenv()
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Cached evaluations are keyed by the model and prompt version; bump a prompt's version
+# whenever its wording changes so that evaluations made with the old wording are redone.
+ASSESSMENT_MODEL = "gpt-4o"
+COMPLIANCE_ASSESSMENT_PROMPT_VERSION = "compliance-assessment-v1"
+SCORE_WITH_JUSTIFICATION_PROMPT_VERSION = "score-with-justification-v1"
+SCORES_OF_ALL_PRINCIPLES_PROMPT_VERSION = "scores-of-all-principles-v1"
+
 
 def get_prompt_for_extracting_ads() -> str:
     return """
@@ -22,13 +29,32 @@ def get_prompt_for_extracting_ads() -> str:
     """
 
 
-def call_openai_for_ad_content(base64_image, prompt):
+def get_prompt_for_refreshing_ad_text(previous_texts: str) -> str:
+    return f"""
+        You are provided with a financial promotion posted on social media (Facebook). Its visual design has already been described; your task is only to return its text.
+        Below is the text extracted from a near-identical version of the promotion. Compare it with the promotion provided and correct any differences, so that the text matches the provided promotion verbatim.
+
+        # Previously extracted text
+        {previous_texts}
+
+        # Output
+        Your response consists of a valid JSON object with the following key-value pairs:
+        facebook_post_text: The exact text from the Facebook post accompanying the promotion.
+        promotion_text: The exact text from the financial promotion itself.
+    """
+
+
+def call_openai_for_ad_content(
+    base64_image, prompt, detail="auto", mime_type="image/jpeg"
+):
     """
     Makes a call to the OpenAI API to extract ad content from a given base64-encoded image.
 
     Parameters:
     - base64_image: The base64-encoded string representing the ad image.
     - prompt: The prompt to send to OpenAI.
+    - detail: The vision detail level, "auto", "low" or "high".
+    - mime_type: The MIME type of the encoded image.
 
     Returns:
     - dict: The parsed ad content or None if an error occurred.
@@ -44,7 +70,8 @@ def call_openai_for_ad_content(base64_image, prompt):
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+                                "url": f"data:{mime_type};base64,{base64_image}",
+                                "detail": detail,
                             },
                         },
                     ],
@@ -129,7 +156,7 @@ def get_openai_resp(prompt: str) -> dict:
     """
     try:
         completion = client.chat.completions.create(
-            model="gpt-4o",
+            model=ASSESSMENT_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
             response_format={"type": "json_object"},
@@ -192,23 +219,74 @@ def get_prompt_for_score_with_justification(
             """
 
 
-def call_openai_with_logprobs(prompt: str):
+def get_prompt_for_scores_of_all_principles(
+    principles_string: str, principle_ids: list, promotion_string: str
+) -> str:
+    """
+    Generates a prompt to score a promotion against all principles in a single response,
+    one line per principle in a fixed format.
+
+    Parameters:
+    - principles_string (str): JSON-formatted list of the regulatory principles.
+    - principle_ids (list): IDs of the principles, in the order their lines must follow.
+    - promotion_string (str): JSON-formatted string of the promotion's extracted content.
+
+    Returns:
+    - str: The formatted prompt for the OpenAI model.
+    """
+    output_lines = "\n".join(
+        f"Principle {principle_id}: [score] Justification: [justification]"
+        for principle_id in principle_ids
+    )
+    return f"""
+            # Role:
+            You are a financial supervision analyst with a specialization in consumer protection.
+            Your task is to analyze financial promotions posted on social media (Facebook) for their compliance with prescribed regulatory requirements for financial promotions.
+
+            # Instructions:
+            1. Review in detail the promotion description in the JSON provided.
+            2. Assess the content of the promotion and its visual design components vis-à-vis each of the stated regulatory principles
+            3. Each principle is defined in terms of one or multiple attributes, providing additional clarity on implementation expectations. 
+            4. For each principle, assign a quantitative score (integer) between 0 and 3 indicating how well the promotion aligns with that principle and its attributes, whereby 3 reflects the highest alignment.
+            5. Provide a qualitative justification for each proposed score.
+            
+            # Additional guidance:
+            * Strictly only rely on the promotion description in arriving at your conclusion.
+            * Formulate each justification in the form of a single, detailed sentence, worded neutrally and objectively. 
+            * If applicable, cite specific evidence to support your justification.
+            * Do not offer any recommendations on the basis of the findings. Focus exclusively on stating the finding and supporting evidence.
+
+            # Principles:
+            {principles_string}
+
+            # Input (Promotion):
+            {promotion_string}
+
+            # Output:
+            Your output consists of exactly one line per principle, in the order below, where [score] is the single digit numerical compliance score (0, 1, 2, or 3) and [justification] is the justification on the same line:
+{output_lines}
+            You must not add anything else before, between or after these lines.
+            """
+
+
+def call_openai_with_logprobs(prompt: str, top_logprobs: int = 3):
     """
     Sends a prompt to OpenAI and returns the raw response with logprobs.
 
     Parameters:
     - prompt (str): The prompt to send to the model..
+    - top_logprobs (int): Number of most likely alternatives returned per token.
 
     Returns:
     - response: The raw OpenAI completion response object, or None if error.
     """
     try:
         response = client.chat.completions.create(
-            model="gpt-4o",
+            model=ASSESSMENT_MODEL,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.1,
             logprobs=True,
-            top_logprobs=3,
+            top_logprobs=top_logprobs,
         )
         return response
     except Exception as e:
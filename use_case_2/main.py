@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 from scripts.step_1_extract_ads import extracting_text_and_visuals
 from scripts.step_2_compliance_check import performing_compliance_check
 from scripts.step_3_generate_report import create_excel_from_json
@@ -12,12 +13,48 @@ def main():
     2. step_2_compliance_check.py --> can be replaced or enhanced  by ( step_2b_advanced_scoring.py)
     3. step_3_generate_report.py
 
+    With --report-only, the Excel report is rebuilt from the cached evaluations of the
+    promotions extracted before, without any requests.
     """
+    parser = argparse.ArgumentParser(
+        description="Assess the compliance of social media promotions."
+    )
+    parser.add_argument(
+        "--report-only",
+        action="store_true",
+        help="Rebuild the Excel report from the cached evaluations without calling the model.",
+    )
+    parser.add_argument(
+        "--no-reuse-similar",
+        action="store_true",
+        help="Extract every promotion, even if a near-identical one was extracted before.",
+    )
+    parser.add_argument(
+        "--refresh-text",
+        action="store_true",
+        help="Re-extract the texts of reused near-identical promotions at low detail.",
+    )
+    args = parser.parse_args()
+
     current_directory = os.getcwd()
     input_dir = os.path.join(current_directory, "input")
     output_dir = os.path.join(current_directory, "output")
     os.makedirs(input_dir, exist_ok=True)
     os.makedirs(output_dir, exist_ok=True)
+    if args.report_only:
+        promotion_descriptions_json = os.path.join(output_dir, "results_output.json")
+        if not os.path.exists(promotion_descriptions_json):
+            print(
+                f" '{promotion_descriptions_json}' is missing; run the full pipeline first. Exiting......."
+            )
+            sys.exit(1)
+        print("Step3------------------rebuilding excel report from cache--------\n")
+        promotion_evaluations_json = performing_compliance_check(
+            promotion_descriptions_json, input_dir, output_dir, cache_only=True
+        )
+        if promotion_evaluations_json:
+            create_excel_from_json(promotion_evaluations_json, output_dir)
+        return
     promotions_dir = os.path.join(input_dir, "Promotions")
     if not os.path.exists(promotions_dir) or not os.listdir(promotions_dir):
         print(
@@ -30,7 +67,10 @@ def main():
             "Step1------------------extracting text and visual information------------\n"
         )
         promotion_descriptions_json = extracting_text_and_visuals(
-            promotions_dir, output_dir
+            promotions_dir,
+            output_dir,
+            reuse_similar=not args.no_reuse_similar,
+            refresh_text=args.refresh_text,
         )
         if promotion_descriptions_json:
             print("Step2------------------performing compliance check--------\n")
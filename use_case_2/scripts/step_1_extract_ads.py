@@ -1,58 +1,277 @@
 import os
 import json
-import base64
-from utils.file_handler import read_json_file, write_to_json_file
-from llm.llm_engine import call_openai_for_ad_content, get_prompt_for_extracting_ads
+import concurrent.futures
+from utils.file_handler import (
+    append_to_jsonl_file,
+    read_jsonl_file,
+    write_to_json_file,
+)
+from utils.extraction_index import create_extraction_index
+from utils.image_processing import estimate_image_tokens, preprocess_image
+from llm.llm_engine import (
+    call_openai_for_ad_content,
+    get_prompt_for_extracting_ads,
+    get_prompt_for_refreshing_ad_text,
+)
 
 
-def encode_image(image_path):
+MAX_CONCURRENT_EXTRACTIONS = 4
+REUSE_LOG_KEYS = ("reused_from", "phash_distance", "dhash_distance")
+TEXT_KEYS = ("facebook_post_text", "promotion_text")
+REFRESH_DETAIL = "low"
+
+
+def _image_tokens(image: dict, status: str) -> int:
+    """
+    Returns the estimated vision tokens sent for an extracted or refreshed promotion.
+    """
+    if status == "refreshed":
+        return estimate_image_tokens(image["width"], image["height"], REFRESH_DETAIL)
+    return image["tokens"]
+
+
+def _send_promotion(filename: str, image: dict, prompt: str, detail: str = None):
     """
-    Encodes an image file to a base64 string.
+    Sends a preprocessed promotion image with a prompt, at its own detail level unless
+    `detail` is given, and reports its size and estimated vision tokens.
+    """
+    detail = detail or image["detail"]
+    print(
+        f"{filename}: {image['width']}x{image['height']}, {detail} detail, "
+        f"~{estimate_image_tokens(image['width'], image['height'], detail)} image tokens, "
+        f"{image['original_bytes'] / 1024:.0f} KiB -> "
+        f"{image['processed_bytes'] / 1024:.0f} KiB"
+    )
+    return call_openai_for_ad_content(
+        image["base64"], prompt, detail=detail, mime_type=image["mime_type"]
+    )
+
+
+def extract_promotion(
+    promotion_dir: str,
+    filename: str,
+    cache_dir: str,
+    detail: str = "auto",
+    index=None,
+    refresh_text: bool = False,
+) -> tuple:
+    """
+    Extracts the text and visual description of a single promotion image.
+
+    The image is preprocessed (see `preprocess_image`) before it is sent, and its estimated
+    vision tokens are reported. If an extraction index is given and it holds a
+    near-identical promotion, its extraction is reused without a request. With
+    `refresh_text`, the texts are extracted again from the new image at low detail, so a
+    repost that changes e.g. a rate or a disclaimer is assessed on its own text; if that
+    fails, the reused texts are kept. The match and its distances are kept in the record
+    under `REUSE_LOG_KEYS`.
 
     Args:
-        image_path (str): The file path of the image to be encoded.
+        promotion_dir (str): Path to the directory containing promotion files.
+        filename (str): File name of the promotion image.
+        cache_dir (str): Directory of the processed image cache.
+        detail (str, optional): Detail policy, "auto", "low" or "high".
+        index (SimpleNamespace, optional): Index from `create_extraction_index`.
+        refresh_text (bool, optional): Re-extract the texts of a reused extraction at low
+            detail. Without it, the texts of the matched promotion are reused as well.
 
     Returns:
-        str: A base64-encoded string representation of the image.
+        tuple: The extracted content with its "image_name", or the "image_name" and an
+        "error" if the extraction failed, the preprocessed image (None if it could not be
+        processed) and how the promotion was handled: "extracted", "reused" or "refreshed".
     """
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
+    try:
+        image = preprocess_image(
+            os.path.join(promotion_dir, filename), cache_dir, detail
+        )
+    except Exception as e:
+        return (
+            {"image_name": filename, "error": f"Could not process image: {e}"},
+            None,
+            "extracted",
+        )
+
+    match = index.claim(filename, image["phash"], image["dhash"]) if index else None
+    if match:
+        source, phash_distance, dhash_distance = match
+        print(
+            f"{filename}: near-identical to {source['image_name']} (pHash distance "
+            f"{phash_distance}, dHash distance {dhash_distance}), reusing its extraction"
+        )
+        record = dict(source["extraction"])
+        record["image_name"] = filename
+        record["reused_from"] = source["image_name"]
+        record["phash_distance"] = phash_distance
+        record["dhash_distance"] = dhash_distance
+        if not refresh_text:
+            return record, image, "reused"
+
+        texts = {key: record.get(key) for key in TEXT_KEYS}
+        try:
+            refreshed = _send_promotion(
+                filename,
+                image,
+                get_prompt_for_refreshing_ad_text(json.dumps(texts, indent=2)),
+                detail=REFRESH_DETAIL,
+            )
+        except Exception as e:
+            refreshed = None
+            print(f"Error while refreshing the text of {filename}: {e}")
+        if not isinstance(refreshed, dict) or not all(
+            key in refreshed for key in TEXT_KEYS
+        ):
+            print(
+                f"[WARNING] Could not refresh the text of {filename}, keeping the text of "
+                f"{source['image_name']}"
+            )
+            return record, image, "refreshed"
+        record.update({key: refreshed[key] for key in TEXT_KEYS})
+        return record, image, "refreshed"
+
+    if index:
+        print(f"{filename}: no near-identical prior extraction")
+    parsed_content = None
+    try:
+        parsed_content = _send_promotion(
+            filename, image, get_prompt_for_extracting_ads()
+        )
+    except Exception as e:
+        return {"image_name": filename, "error": str(e)}, image, "extracted"
+    finally:
+        if index:
+            index.add(
+                filename,
+                image["phash"],
+                image["dhash"],
+                dict(parsed_content) if isinstance(parsed_content, dict) else None,
+            )
+
+    if not isinstance(parsed_content, dict):
+        return (
+            {"image_name": filename, "error": "No ad content extracted"},
+            image,
+            "extracted",
+        )
+    parsed_content["image_name"] = filename
+    return parsed_content, image, "extracted"
 
 
-def extracting_text_and_visuals(promotion_dir: str, output_dir: str) -> str | None:
+def extracting_text_and_visuals(
+    promotion_dir: str,
+    output_dir: str,
+    max_workers: int = MAX_CONCURRENT_EXTRACTIONS,
+    detail: str = "auto",
+    reuse_similar: bool = True,
+    refresh_text: bool = False,
+) -> str | None:
     """
     Extracts text and visual elements from promotion files.
 
+    Promotions are extracted concurrently by up to `max_workers` workers. Every finished
+    extraction, successful or not, is appended as one record to 'results_output.jsonl',
+    so a rerun skips the images that were already extracted and retries the failed ones.
+    Once all images are processed, the successful records are written to
+    'results_output.json' for the next step. Preprocessed images are cached in
+    'image_cache' within the output directory.
+
+    Full extractions are also kept in 'extraction_index.jsonl' with the perceptual hashes
+    of their images. A promotion that is near-identical to an indexed one, e.g. a repost
+    of the same creative, reuses its extraction instead of being extracted again.
+    Which promotion was reused and the hash distances are logged in 'results_output.jsonl'
+    only, not passed on to the next step.
+
     Args:
         promotion_dir (str): Path to the directory containing promotion files.
         output_dir (str): Path to the directory where 'promotion_descriptions.json' will be saved.
+        max_workers (int, optional): Maximum number of concurrent extractions.
+        detail (str, optional): Vision detail policy, "auto" (per image), "low" or "high".
+        reuse_similar (bool, optional): Reuse the extractions of near-identical promotions.
+        refresh_text (bool, optional): Re-extract the texts of reused extractions at low
+            detail.
 
     Returns:
-        str: Path to the results file('promotion_descriptions.json).
+        str: Path to the results file('promotion_descriptions.json), or None if no
+        promotion could be extracted.
     """
 
     results_file = os.path.join(output_dir, "results_output.json")
-    if not os.path.exists(results_file):
-        with open(results_file, "w") as f:
-            json.dump([], f)
-
-    for filename in os.listdir(promotion_dir):
-        image_path = os.path.join(promotion_dir, filename)
-        base64_image = encode_image(image_path)
-
-        prompt = get_prompt_for_extracting_ads()
-        parsed_content = call_openai_for_ad_content(base64_image, prompt)
-
-        if parsed_content:
-            parsed_content["image_name"] = filename
-        else:
-            print(f"OpenAI Failed to extract ad content from {filename}")
-            return None
-
-        if os.path.exists(results_file):
-            results = read_json_file(results_file)
-        else:
-            results = []
-        results.append(parsed_content)
-        write_to_json_file(results_file, results, indent=4)
+    results_log = os.path.join(output_dir, "results_output.jsonl")
+    cache_dir = os.path.join(output_dir, "image_cache")
+    index = None
+    if reuse_similar:
+        index = create_extraction_index(
+            os.path.join(output_dir, "extraction_index.jsonl")
+        )
+
+    extracted = {
+        record["image_name"]: record
+        for record in read_jsonl_file(results_log)
+        if "image_name" in record and "error" not in record
+    }
+    filenames = sorted(os.listdir(promotion_dir))
+    pending = [filename for filename in filenames if filename not in extracted]
+    if len(pending) < len(filenames):
+        print(
+            f"Skipping {len(filenames) - len(pending)} promotions already extracted in {results_log}"
+        )
+
+    failures = {}
+    image_tokens = 0
+    reused = 0
+    image_bytes = [0, 0]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                extract_promotion,
+                promotion_dir,
+                filename,
+                cache_dir,
+                detail,
+                index,
+                refresh_text,
+            )
+            for filename in pending
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            record, image, status = future.result()
+            if status != "extracted" and "error" not in record:
+                reused += 1
+            if image and status != "reused":
+                image_tokens += _image_tokens(image, status)
+                image_bytes[0] += image["original_bytes"]
+                image_bytes[1] += image["processed_bytes"]
+            append_to_jsonl_file(results_log, record)
+            if "error" in record:
+                failures[record["image_name"]] = record["error"]
+                print(
+                    f"OpenAI Failed to extract ad content from {record['image_name']}: {record['error']}"
+                )
+            else:
+                extracted[record["image_name"]] = record
+
+    if image_bytes[0]:
+        print(
+            f"Sent ~{image_tokens} image tokens; images reduced from "
+            f"{image_bytes[0] / 2**20:.1f} MiB to {image_bytes[1] / 2**20:.1f} MiB."
+        )
+    if reused:
+        print(
+            f"Reused the extractions of near-identical promotions for {reused} images."
+        )
+    if failures:
+        print(
+            f"{len(failures)} of {len(filenames)} promotions could not be extracted; rerun to retry them."
+        )
+    results = [
+        {
+            key: value
+            for key, value in extracted[filename].items()
+            if key not in REUSE_LOG_KEYS
+        }
+        for filename in filenames
+        if filename in extracted
+    ]
+    if not results:
+        return None
+    write_to_json_file(results_file, results, indent=4)
     return results_file
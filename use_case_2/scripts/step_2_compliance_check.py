@@ -1,19 +1,158 @@
 import os
 import json
+import time
+import concurrent.futures
+from utils.evaluation_cache import create_evaluation_cache
 from utils.file_handler import read_json_file, write_to_json_file
-from llm.llm_engine import get_openai_resp, get_prompt_for_compliance_assessment
+from llm.llm_engine import (
+    ASSESSMENT_MODEL,
+    COMPLIANCE_ASSESSMENT_PROMPT_VERSION,
+    get_openai_resp,
+    get_prompt_for_compliance_assessment,
+)
+
+
+MAX_IN_FLIGHT_ASSESSMENTS = 8
+
+
+def parse_evaluation_results(parsed_response) -> list:
+    """
+    Converts a compliance assessment response into a list of principle results.
+
+    Parameters:
+    - parsed_response (dict | list): Parsed model response, keyed by principle ID or a list
+      of results.
+
+    Returns:
+    - list: One dictionary per principle with its "principle_id", "score" and "justification".
+    """
+    evaluation_results = []
+    if isinstance(parsed_response, dict):
+        for k, v in parsed_response.items():
+            result_item = {
+                "principle_id": k,
+                "score": v.get("score"),
+                "justification": v.get("justification"),
+            }
+            evaluation_results.append(result_item)
+    elif isinstance(parsed_response, list):
+        for item in parsed_response:
+            evaluation_results.append(
+                {
+                    "principle_id": item.get("principle_id"),
+                    "score": item.get("score"),
+                    "justification": item.get("justification"),
+                }
+            )
+    return evaluation_results
+
+
+def match_results_to_principles(principles: list, evaluation_results: list) -> list:
+    """
+    Pairs the principles of a chunk with the results of their assessment.
+
+    Results are matched by principle ID first. Results keyed differently, e.g.
+    "Principle 1" instead of "1", are then assigned to the unmatched principles in order
+    and take their principle ID; the mapping is logged, as are results and principles
+    left over.
+
+    Parameters:
+    - principles (list): The assessed principles, in chunk order.
+    - evaluation_results (list): Results from `parse_evaluation_results`.
+
+    Returns:
+    - list: (principle, result) pairs of the matched principles.
+    """
+    results_by_id = {
+        str(result["principle_id"]): result for result in evaluation_results
+    }
+    matched = []
+    unmatched_principles = []
+    for principle in principles:
+        result = results_by_id.pop(str(principle.get("principle_id")), None)
+        if result is None:
+            unmatched_principles.append(principle)
+        else:
+            matched.append((principle, result))
+
+    unmatched_results = list(results_by_id.values())
+    for principle, result in zip(unmatched_principles, unmatched_results):
+        print(
+            f"[WARNING] Assigning the result keyed '{result['principle_id']}' to "
+            f"principle {principle.get('principle_id')} by its position."
+        )
+        matched.append(
+            (principle, {**result, "principle_id": principle.get("principle_id")})
+        )
+    if len(unmatched_results) > len(unmatched_principles):
+        print(
+            "[WARNING] Ignoring results for unknown principles "
+            + ", ".join(
+                f"'{result['principle_id']}'"
+                for result in unmatched_results[len(unmatched_principles) :]
+            )
+            + "."
+        )
+    if len(unmatched_principles) > len(unmatched_results):
+        print(
+            "[WARNING] No result for principles "
+            + ", ".join(
+                str(principle.get("principle_id"))
+                for principle in unmatched_principles[len(unmatched_results) :]
+            )
+            + "."
+        )
+    return matched
+
+
+def assess_chunk(chunk_string: str, promotion_string: str) -> tuple:
+    """
+    Assesses one promotion against one chunk of principles.
+
+    Parameters:
+    - chunk_string (str): JSON-formatted string of the principles.
+    - promotion_string (str): JSON-formatted string of the promotion.
+
+    Returns:
+    - tuple: The principle results and the request latency in seconds.
+    """
+    started = time.perf_counter()
+    prompt = get_prompt_for_compliance_assessment(chunk_string, promotion_string)
+    try:
+        parsed_response = get_openai_resp(prompt)
+    except Exception as e:
+        print(f"Error while assessing compliance: {e}")
+        parsed_response = None
+    return parse_evaluation_results(parsed_response), time.perf_counter() - started
 
 
 def performing_compliance_check(
-    promotion_descriptions_json: str, input_dir: str, output_dir: str
+    promotion_descriptions_json: str,
+    input_dir: str,
+    output_dir: str,
+    max_in_flight: int = MAX_IN_FLIGHT_ASSESSMENTS,
+    cache_only: bool = False,
 ) -> str:
     """
     Performs compliance checks on a list of promotion descriptions.
 
+    Evaluations are cached per promotion and principle in 'evaluation_cache.jsonl' (see
+    `create_evaluation_cache`), and only the principles of a chunk that are not cached for
+    a promotion are assessed. A reworded principle is therefore re-assessed on its own,
+    while a new promotion is assessed with the unchanged chunks of principles.
+
+    Every remaining (promotion, principle chunk) assessment is issued concurrently, with at
+    most `max_in_flight` requests in flight at a time. The results are assembled from the
+    cache in promotion and principle order, so the output does not depend on the order
+    requests finish in. At the end, the wall-clock time is compared with the sum of all
+    request latencies, i.e. the time the assessments would have taken one after another.
+
     Parameters:
     - promotion_descriptions_json (list): A list of promotion description dictionaries (from Step 1).
     - input_dir (str): Directory containing the evaluation criteria JSON.
     - output_dir (str): Directory where the output 'promotion_evaluations.json' will be saved.
+    - max_in_flight (int): Maximum number of concurrent requests.
+    - cache_only (bool): Only assemble the cached evaluations, without any requests.
 
     Returns:
     - str: path to 'promotion_evaluations.json' file.
@@ -28,43 +167,65 @@ def performing_compliance_check(
     promotions_data = read_json_file(promotion_descriptions_json)
     principles_data = read_json_file(principles_path)
     principles = principles_data.get("principles", [])
+    cache = create_evaluation_cache(
+        os.path.join(output_dir, "evaluation_cache.jsonl"),
+        ASSESSMENT_MODEL,
+        COMPLIANCE_ASSESSMENT_PROMPT_VERSION,
+    )
 
     principle_chunks = [principles[i : i + 3] for i in range(0, len(principles), 3)]
+    assessments = []
+    for promotion_index, promotion in enumerate(promotions_data):
+        for chunk in principle_chunks:
+            missing = [
+                principle
+                for principle in chunk
+                if cache.get(promotion, principle) is None
+            ]
+            if missing:
+                assessments.append((promotion_index, missing))
+    uncached = sum(len(missing) for _, missing in assessments)
+    print(
+        f"{len(promotions_data) * len(principles) - uncached} of "
+        f"{len(promotions_data) * len(principles)} principle evaluations are cached; "
+        f"{'not assessing' if cache_only else 'assessing'} the other {uncached}."
+    )
+    if cache_only:
+        assessments = []
 
-    promotions_evaluations = []
-
-    for promotion in promotions_data:
-        promotion_evaluation = dict(promotion)
-        evaluation_results = []
+    promotion_strings = {
+        promotion_index: json.dumps(promotions_data[promotion_index], indent=2)
+        for promotion_index in {promotion_index for promotion_index, _ in assessments}
+    }
 
-        for chunk in principle_chunks:
-            chunk_string = json.dumps(chunk, indent=2)
-            promotion_string = json.dumps(promotion, indent=2)
+    started = time.perf_counter()
+    latencies = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {
+            executor.submit(
+                assess_chunk,
+                json.dumps(missing, indent=2),
+                promotion_strings[promotion_index],
+            ): (promotion_index, missing)
+            for promotion_index, missing in assessments
+        }
+        for future in concurrent.futures.as_completed(futures):
+            promotion_index, missing = futures[future]
+            evaluation_results, latency = future.result()
+            latencies.append(latency)
+            for principle, result in match_results_to_principles(
+                missing, evaluation_results
+            ):
+                cache.put(promotions_data[promotion_index], principle, result)
+    wall_clock = time.perf_counter() - started
 
-            prompt = get_prompt_for_compliance_assessment(
-                chunk_string, promotion_string
-            )
-            parsed_response = get_openai_resp(prompt)
-
-            if isinstance(parsed_response, dict):
-                for k, v in parsed_response.items():
-                    result_item = {
-                        "principle_id": k,
-                        "score": v.get("score"),
-                        "justification": v.get("justification"),
-                    }
-                    evaluation_results.append(result_item)
-            elif isinstance(parsed_response, list):
-                for item in parsed_response:
-                    evaluation_results.append(
-                        {
-                            "principle_id": item.get("principle_id"),
-                            "score": item.get("score"),
-                            "justification": item.get("justification"),
-                        }
-                    )
-
-        promotion_evaluation["evaluation_result"] = evaluation_results
-        promotions_evaluations.append(promotion_evaluation)
+    promotions_evaluations = cache.build_evaluations(promotions_data, principles)
     write_to_json_file(promotion_evaluations_file, promotions_evaluations, indent=2)
+
+    if latencies:
+        print(
+            f"Completed {len(latencies)} assessments in {wall_clock:.1f}s with up to "
+            f"{max_in_flight} in flight; one after another they would have taken "
+            f"~{sum(latencies):.1f}s ({sum(latencies) / max(wall_clock, 1e-9):.1f}x speedup)."
+        )
     return promotion_evaluations_file
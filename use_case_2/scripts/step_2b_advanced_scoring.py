@@ -2,104 +2,251 @@ import os
 import json
 import math
 import re
+import bisect
+from utils.evaluation_cache import create_evaluation_cache
 from utils.file_handler import read_json_file, write_to_json_file
 from llm.llm_engine import (
+    ASSESSMENT_MODEL,
+    SCORE_WITH_JUSTIFICATION_PROMPT_VERSION,
+    SCORES_OF_ALL_PRINCIPLES_PROMPT_VERSION,
     call_openai_with_logprobs,
     get_prompt_for_score_with_justification,
+    get_prompt_for_scores_of_all_principles,
 )
 
 
-def compute_compliance_scoring(
-    promotion_descriptions_json: list, input_dir: str, output_dir: str
-) -> str:
+SCORING_MODES = ("per-principle", "multi-principle")
+SCORE_VALUES = ("0", "1", "2", "3")
+SCORE_LINE_PATTERN = re.compile(
+    r"^\s*Principle\s+(?P<principle_id>[^:\n]+?)\s*:\s*(?P<score>[0-3])\s*"
+    r"Justification:\s*(?P<justification>.*)$",
+    re.MULTILINE,
+)
+
+
+def score_principle(chunk: list, promotion_string: str) -> dict | None:
     """
-    Computes the compliance scores
+    Scores a promotion against a single principle, weighting the scores by the
+    probabilities of the first response token.
 
     Parameters:
-    - promotion_descriptions_json (list): A list of promotion description dictionaries (from Step 1).
-    - input_dir (str): Directory containing the evaluation criteria JSON.
-    - output_dir (str): Directory where the output 'promotion_evaluations.json' will be saved.
+    - chunk (list): List holding the principle.
+    - promotion_string (str): JSON-formatted string of the promotion.
 
     Returns:
-    - str: path to 'promotion_evaluations.json' file.
+    - dict: The "principle_id", "score" and "justification", or None if the request failed.
     """
-    principles_path = os.path.join(input_dir, "evaluation_criteria.json")
+    principle_dict = chunk[0]
+    principle_id = principle_dict.get("principle_id", "unknown")
 
-    if not os.path.exists(principles_path):
-        print(f"[ERROR] File not found: {principles_path}")
+    chunk_string = json.dumps(chunk, indent=2)
+    prompt = get_prompt_for_score_with_justification(chunk_string, promotion_string)
+
+    response = call_openai_with_logprobs(prompt)
+
+    if not response:
         return None
-    promotion_evaluations_file = os.path.join(output_dir, "promotion_evaluations.json")
 
-    promotions_data = read_json_file(promotion_descriptions_json)
-    principles_data = read_json_file(principles_path)
-    principles = principles_data.get("principles", [])
+    api_response = response.choices[0].message.content
 
-    principle_chunks = [principles[i : i + 1] for i in range(0, len(principles), 1)]
+    composite_score = 0.0
+    choice_logprobs = response.choices[0].logprobs
+    if choice_logprobs and choice_logprobs.content:
+        first_token_logprobs = choice_logprobs.content[0]
+        top_logprobs_for_first_token = first_token_logprobs.top_logprobs
 
-    promotions_evaluations = []
+        for logprob_entry in top_logprobs_for_first_token:
+            token_str = logprob_entry.token
+            token_logprob = logprob_entry.logprob
 
-    for promotion in promotions_data:
-        promotion_evaluation = dict(promotion)
-        evaluation_results = []
+            probability = math.exp(token_logprob)
 
-        for chunk in principle_chunks:
-            if not chunk:
-                continue
+            try:
+                token_int = int(token_str)
+            except ValueError:
+                token_int = 0
 
-            principle_dict = chunk[0]
-            principle_id = principle_dict.get("principle_id", "unknown")
+            composite_score += token_int * probability
 
-            chunk_string = json.dumps(chunk, indent=2)
-            promotion_string = json.dumps(promotion, indent=2)
-            prompt = get_prompt_for_score_with_justification(
-                chunk_string, promotion_string
-            )
+    justification_match = re.split(r"Justification:s*", api_response, maxsplit=1)
+    if len(justification_match) == 2:
+        justification = justification_match[1].strip()
+    else:
+        justification = "No justification found."
 
-            response = call_openai_with_logprobs(prompt)
+    score_str = f"{round(composite_score, 2)}"
 
-            if not response:
-                continue
+    return {
+        "principle_id": principle_id,
+        "score": score_str,
+        "justification": justification,
+    }
 
-            api_response = response.choices[0].message.content
 
-            composite_score = 0.0
-            choice_logprobs = response.choices[0].logprobs
-            if choice_logprobs and choice_logprobs.content:
-                first_token_logprobs = choice_logprobs.content[0]
-                top_logprobs_for_first_token = first_token_logprobs.top_logprobs
+def expected_score(token_logprobs, fallback: str) -> float:
+    """
+    Computes the probability-weighted score of a score token from its top alternatives.
 
-                for logprob_entry in top_logprobs_for_first_token:
-                    token_str = logprob_entry.token
-                    token_logprob = logprob_entry.logprob
+    Only alternatives that are valid scores count, and their probabilities are
+    renormalized; if none is, the emitted score is used.
 
-                    probability = math.exp(token_logprob)
+    Parameters:
+    - token_logprobs: Logprobs entry of the score token.
+    - fallback (str): The emitted score.
 
-                    try:
-                        token_int = int(token_str)
-                    except ValueError:
-                        token_int = 0
+    Returns:
+    - float: The expected score.
+    """
+    weights = {}
+    for logprob_entry in token_logprobs.top_logprobs:
+        value = logprob_entry.token.strip()
+        if value in SCORE_VALUES:
+            weights[value] = weights.get(value, 0.0) + math.exp(logprob_entry.logprob)
+    total = sum(weights.values())
+    if not total:
+        return float(fallback)
+    return sum(int(value) * weight for value, weight in weights.items()) / total
+
+
+def score_all_principles(principles: list, promotion_string: str) -> list:
+    """
+    Scores a promotion against all principles with a single request.
 
-                    composite_score += token_int * probability
+    The response holds one line per principle in a fixed format. The score digit of each
+    line is located in the response tokens by its character offset, and its expected value
+    is computed from the top logprobs of that token.
 
-            justification_match = re.split(
-                r"Justification:s*", api_response, maxsplit=1
-            )
-            if len(justification_match) == 2:
-                justification = justification_match[1].strip()
-            else:
-                justification = "No justification found."
+    Parameters:
+    - principles (list): The principles.
+    - promotion_string (str): JSON-formatted string of the promotion.
 
-            score_str = f"{round(composite_score, 2)}"
+    Returns:
+    - list: The "principle_id", "score" and "justification" of every principle found in
+      the response, in the order of `principles`.
+    """
+    principle_ids = [
+        str(principle.get("principle_id", "unknown")) for principle in principles
+    ]
+    prompt = get_prompt_for_scores_of_all_principles(
+        json.dumps(principles, indent=2), principle_ids, promotion_string
+    )
+    response = call_openai_with_logprobs(prompt, top_logprobs=len(SCORE_VALUES))
+
+    if not response:
+        return []
+
+    choice = response.choices[0]
+    token_logprobs = choice.logprobs.content if choice.logprobs else None
+    token_logprobs = token_logprobs or []
+    text = "".join(entry.token for entry in token_logprobs) or choice.message.content
+
+    token_offsets = []
+    offset = 0
+    for entry in token_logprobs:
+        token_offsets.append(offset)
+        offset += len(entry.token)
+
+    scored = {}
+    for match in SCORE_LINE_PATTERN.finditer(text):
+        principle_id = match.group("principle_id").strip()
+        if principle_id not in principle_ids or principle_id in scored:
+            continue
+        score = float(match.group("score"))
+        position = match.start("score")
+        token_index = bisect.bisect_right(token_offsets, position) - 1
+        if token_index >= 0:
+            score = expected_score(token_logprobs[token_index], match.group("score"))
+        scored[principle_id] = {
+            "principle_id": principle_id,
+            "score": f"{round(score, 2)}",
+            "justification": match.group("justification").strip()
+            or "No justification found.",
+        }
+
+    missing = [
+        principle_id for principle_id in principle_ids if principle_id not in scored
+    ]
+    if missing:
+        print(
+            f"[WARNING] No score found for principles {', '.join(missing)}, scoring them separately."
+        )
+    return [
+        scored[principle_id] for principle_id in principle_ids if principle_id in scored
+    ]
 
-            result_item = {
-                "principle_id": principle_id,
-                "score": score_str,
-                "justification": justification,
-            }
-            evaluation_results.append(result_item)
 
-        promotion_evaluation["evaluation_result"] = evaluation_results
-        promotions_evaluations.append(promotion_evaluation)
+def compute_compliance_scoring(
+    promotion_descriptions_json: list,
+    input_dir: str,
+    output_dir: str,
+    mode: str = "per-principle",
+    cache_only: bool = False,
+) -> str:
+    """
+    Computes the compliance scores
+
+    In "per-principle" mode, each promotion is scored with one request per principle; in
+    "multi-principle" mode, against all principles with a single request, and principles
+    whose score line is missing or malformed are scored with their own request. Both weight
+    the scores by their token probabilities. Scores are cached per promotion and principle
+    in 'evaluation_cache.jsonl' (see `create_evaluation_cache`), separately for each mode,
+    and only the principles without a cached score are scored.
+
+    Parameters:
+    - promotion_descriptions_json (list): A list of promotion description dictionaries (from Step 1).
+    - input_dir (str): Directory containing the evaluation criteria JSON.
+    - output_dir (str): Directory where the output 'promotion_evaluations.json' will be saved.
+    - mode (str): "per-principle" or "multi-principle".
+    - cache_only (bool): Only assemble the cached scores, without any requests.
 
+    Returns:
+    - str: path to 'promotion_evaluations.json' file.
+    """
+    if mode not in SCORING_MODES:
+        raise ValueError(f"Unknown scoring mode '{mode}'.")
+    principles_path = os.path.join(input_dir, "evaluation_criteria.json")
+
+    if not os.path.exists(principles_path):
+        print(f"[ERROR] File not found: {principles_path}")
+        return None
+    promotion_evaluations_file = os.path.join(output_dir, "promotion_evaluations.json")
+
+    promotions_data = read_json_file(promotion_descriptions_json)
+    principles_data = read_json_file(principles_path)
+    principles = principles_data.get("principles", [])
+    cache = create_evaluation_cache(
+        os.path.join(output_dir, "evaluation_cache.jsonl"),
+        ASSESSMENT_MODEL,
+        SCORES_OF_ALL_PRINCIPLES_PROMPT_VERSION
+        if mode == "multi-principle"
+        else SCORE_WITH_JUSTIFICATION_PROMPT_VERSION,
+    )
+
+    for promotion in promotions_data:
+        if cache_only:
+            break
+        missing = [
+            principle
+            for principle in principles
+            if cache.get(promotion, principle) is None
+        ]
+        if not missing:
+            continue
+        promotion_string = json.dumps(promotion, indent=2)
+
+        results_by_id = {}
+        if mode == "multi-principle":
+            results_by_id = {
+                result["principle_id"]: result
+                for result in score_all_principles(missing, promotion_string)
+            }
+        for principle in missing:
+            result_item = results_by_id.get(
+                str(principle.get("principle_id", "unknown"))
+            ) or score_principle([principle], promotion_string)
+            if result_item:
+                cache.put(promotion, principle, result_item)
+
+    promotions_evaluations = cache.build_evaluations(promotions_data, principles)
     write_to_json_file(promotion_evaluations_file, promotions_evaluations, indent=2)
     return promotion_evaluations_file
@@ -0,0 +1,103 @@
+import json
+import hashlib
+import threading
+from types import SimpleNamespace
+from utils.file_handler import append_to_jsonl_file, read_jsonl_file
+
+
+def content_hash(value) -> str:
+    """
+    Returns a SHA-256 hash of a JSON-serializable value that does not depend on key order.
+    """
+    serialized = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def promotion_content_hash(promotion: dict) -> str:
+    """
+    Returns the hash of a promotion's extracted content. The file name and any evaluation
+    results are left out, so a renamed or reposted promotion with the same content hashes
+    alike.
+    """
+    return content_hash(
+        {
+            key: value
+            for key, value in promotion.items()
+            if key not in ("image_name", "evaluation_result")
+        }
+    )
+
+
+def create_evaluation_cache(
+    cache_file: str, model: str, prompt_version: str
+) -> SimpleNamespace:
+    """
+    Creates a persistent cache of principle evaluations.
+
+    Every evaluation is keyed by the hash of the promotion content, the hash of the
+    principle's text, the model and the prompt version, so rewording one principle only
+    invalidates the evaluations of that principle, and changing the model or prompt only
+    those made with it. Evaluations are appended to a JSONL file as they are stored.
+
+    Parameters:
+    - cache_file (str): JSONL file holding one record per evaluation.
+    - model (str): Model the evaluations are made with.
+    - prompt_version (str): Version of the prompt the evaluations are made with.
+
+    Returns:
+    - SimpleNamespace: Object with `get(promotion, principle)`, which returns the cached
+      result or None, `put(promotion, principle, result)` and
+      `build_evaluations(promotions, principles)`, which returns the promotions with the
+      cached results of all principles as "evaluation_result".
+    """
+    entries = {
+        record["key"]: record["result"]
+        for record in read_jsonl_file(cache_file)
+        if "key" in record and "result" in record
+    }
+    lock = threading.Lock()
+
+    def key_of(promotion_hash, principle_hash):
+        return content_hash([promotion_hash, principle_hash, model, prompt_version])
+
+    def get(promotion: dict, principle: dict):
+        key = key_of(promotion_content_hash(promotion), content_hash(principle))
+        with lock:
+            return entries.get(key)
+
+    def put(promotion: dict, principle: dict, result: dict):
+        promotion_hash = promotion_content_hash(promotion)
+        principle_hash = content_hash(principle)
+        record = {
+            "key": key_of(promotion_hash, principle_hash),
+            "promotion_hash": promotion_hash,
+            "principle_hash": principle_hash,
+            "model": model,
+            "prompt_version": prompt_version,
+            "result": result,
+        }
+        with lock:
+            append_to_jsonl_file(cache_file, record)
+            entries[record["key"]] = result
+
+    def build_evaluations(promotions: list, principles: list) -> list:
+        promotions_evaluations = []
+        missing = 0
+        for promotion in promotions:
+            promotion_evaluation = dict(promotion)
+            evaluation_results = []
+            for principle in principles:
+                result = get(promotion, principle)
+                if result is None:
+                    missing += 1
+                else:
+                    evaluation_results.append(result)
+            promotion_evaluation["evaluation_result"] = evaluation_results
+            promotions_evaluations.append(promotion_evaluation)
+        if missing:
+            print(
+                f"[WARNING] {missing} of {len(promotions) * len(principles)} principle evaluations are missing from the cache."
+            )
+        return promotions_evaluations
+
+    return SimpleNamespace(get=get, put=put, build_evaluations=build_evaluations)
@@ -0,0 +1,87 @@
+import threading
+from types import SimpleNamespace
+from utils.file_handler import append_to_jsonl_file, read_jsonl_file
+from utils.image_processing import hamming_distance
+
+
+PHASH_DISTANCE_THRESHOLD = 10
+DHASH_DISTANCE_THRESHOLD = 10
+
+
+def create_extraction_index(
+    index_file: str,
+    phash_threshold: int = PHASH_DISTANCE_THRESHOLD,
+    dhash_threshold: int = DHASH_DISTANCE_THRESHOLD,
+) -> SimpleNamespace:
+    """
+    Creates a persistent index of prior promotion extractions, keyed by the perceptual
+    hashes of their images.
+
+    A promotion matches a prior extraction when both its pHash and dHash are within the
+    thresholds (Hamming distance); the closest match wins. Promotions that are extracted
+    at the same time take part as well: a promotion that resembles one still being
+    extracted waits for it instead of being extracted twice.
+
+    Parameters:
+    - index_file (str): JSONL file holding one record per extraction.
+    - phash_threshold (int): Maximum pHash distance of a match.
+    - dhash_threshold (int): Maximum dHash distance of a match.
+
+    Returns:
+    - SimpleNamespace: Object with `claim(image_name, phash, dhash)`, which returns the
+      closest matching (record, phash distance, dhash distance) or None if the caller
+      should extract the promotion itself, and `add(image_name, phash, dhash, extraction)`,
+      which must follow every claim that returned None (with extraction None on failure).
+    """
+    entries = [
+        record
+        for record in read_jsonl_file(index_file)
+        if {"image_name", "phash", "dhash", "extraction"} <= record.keys()
+    ]
+    in_progress = {}
+    lock = threading.Lock()
+
+    def closest(records, phash, dhash):
+        best = None
+        for record in records:
+            phash_distance = hamming_distance(phash, record["phash"])
+            dhash_distance = hamming_distance(dhash, record["dhash"])
+            if phash_distance > phash_threshold or dhash_distance > dhash_threshold:
+                continue
+            if best is None or (phash_distance, dhash_distance) < best[1:]:
+                best = (record, phash_distance, dhash_distance)
+        return best
+
+    def claim(image_name: str, phash: str, dhash: str):
+        while True:
+            with lock:
+                match = closest(entries, phash, dhash)
+                if match:
+                    return match
+                running = closest(in_progress.values(), phash, dhash)
+                if running is None:
+                    in_progress[image_name] = {
+                        "image_name": image_name,
+                        "phash": phash,
+                        "dhash": dhash,
+                        "done": threading.Event(),
+                    }
+                    return None
+            running[0]["done"].wait()
+
+    def add(image_name: str, phash: str, dhash: str, extraction):
+        with lock:
+            if extraction is not None:
+                record = {
+                    "image_name": image_name,
+                    "phash": phash,
+                    "dhash": dhash,
+                    "extraction": extraction,
+                }
+                append_to_jsonl_file(index_file, record)
+                entries.append(record)
+            running = in_progress.pop(image_name, None)
+        if running:
+            running["done"].set()
+
+    return SimpleNamespace(claim=claim, add=add)
@@ -1,3 +1,4 @@
+import os
 import json
 
 
@@ -31,3 +32,52 @@ def read_json_file(file_path: str) -> dict:
     except (FileNotFoundError, json.JSONDecodeError) as e:
         print(f"Error reading JSON file '{file_path}': {e}")
         return {}
+
+
+def append_to_jsonl_file(file_path: str, record: dict) -> None:
+    """
+    Appends a record as a single line to a JSON Lines file and flushes it to disk.
+
+    If an interrupted write left the file without a trailing newline, the torn line is
+    terminated first, so the record does not end up on the same line.
+
+    Args:
+        file_path (str): Path to the JSONL file.
+        record (dict): Record to append.
+    Returns:
+        None
+    """
+    line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+    with open(file_path, "a+b") as fp:
+        if fp.seek(0, os.SEEK_END) > 0:
+            fp.seek(-1, os.SEEK_END)
+            if fp.read(1) != b"\n":
+                line = b"\n" + line
+        fp.write(line)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+
+def read_jsonl_file(file_path: str) -> list:
+    """
+    Reads all records of a JSON Lines file. A torn last line left behind by an
+    interrupted write is skipped.
+
+    Args:
+        file_path (str): Path to the JSONL file.
+
+    Returns:
+        list: Parsed records, or an empty list if the file does not exist.
+    """
+    if not os.path.exists(file_path):
+        return []
+    records = []
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"Skipping unreadable line {line_number} of '{file_path}': {e}")
+    return records
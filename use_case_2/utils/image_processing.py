@@ -0,0 +1,276 @@
+import io
+import os
+import json
+import math
+import base64
+import hashlib
+import threading
+from PIL import Image, ImageChops, ImageOps
+
+
+MAX_IMAGE_SIDE = 2048
+HIGH_DETAIL_SHORT_SIDE = 768
+LOW_DETAIL_SIDE = 512
+TILE_SIZE = 512
+TILE_SNAP_TOLERANCE = 0.15
+BASE_IMAGE_TOKENS = 85
+TOKENS_PER_TILE = 170
+JPEG_QUALITY = 85
+BORDER_TOLERANCE = 12
+DETAIL_POLICIES = ("auto", "low", "high")
+HASH_SIZE = 8
+PHASH_SAMPLE_SIZE = 32
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    """
+    Estimates the vision input tokens of an image sent with the given detail level.
+
+    A low detail image costs a fixed number of tokens. A high detail image is scaled to fit
+    within 2048x2048, then down to a shortest side of 768 pixels, and costs a fixed number
+    of tokens per 512x512 tile it covers.
+
+    Parameters:
+    - width (int): Image width in pixels.
+    - height (int): Image height in pixels.
+    - detail (str): "low" or "high".
+
+    Returns:
+    - int: Estimated number of input tokens.
+    """
+    if detail == "low":
+        return BASE_IMAGE_TOKENS
+    width, height = _fit_high_detail(width, height)
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return BASE_IMAGE_TOKENS + TOKENS_PER_TILE * tiles
+
+
+def _fit_high_detail(width: int, height: int) -> tuple:
+    """
+    Returns the size a high detail image is scaled to before it is split into tiles.
+    """
+    scale = min(1.0, MAX_IMAGE_SIDE / max(width, height))
+    scale = min(scale, HIGH_DETAIL_SHORT_SIDE / min(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _snap_to_tiles(width: int, height: int) -> tuple:
+    """
+    Shrinks an image that slightly overshoots a multiple of the tile size, so it covers
+    one row or column of tiles less. Images that would have to shrink by more than
+    TILE_SNAP_TOLERANCE are left as they are.
+    """
+    scales = [
+        (side // TILE_SIZE) * TILE_SIZE / side
+        for side in (width, height)
+        if side > TILE_SIZE and side % TILE_SIZE
+    ]
+    scales = [scale for scale in scales if scale >= 1 - TILE_SNAP_TOLERANCE]
+    if not scales:
+        return width, height
+    scale = max(scales)
+    return max(1, math.floor(width * scale)), max(1, math.floor(height * scale))
+
+
+def trim_uniform_border(image: Image.Image, tolerance: int = BORDER_TOLERANCE):
+    """
+    Crops a uniform border, e.g. the padding around a screenshot, off an image.
+
+    The border color is taken from the top left pixel; pixels that differ from it by at most
+    `tolerance` per channel count as border.
+
+    Parameters:
+    - image (Image.Image): RGB image.
+    - tolerance (int): Maximum per-channel difference to the border color.
+
+    Returns:
+    - Image.Image: The cropped image, or the image itself if it has no uniform border.
+    """
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    difference = ImageChops.difference(image, background).convert("L")
+    bbox = difference.point(lambda value: 255 if value > tolerance else 0).getbbox()
+    if not bbox or bbox == (0, 0) + image.size:
+        return image
+    return image.crop(bbox)
+
+
+def difference_hash(image: Image.Image) -> str:
+    """
+    Computes the dHash of an image: whether each pixel of a small grayscale thumbnail is
+    brighter than its right neighbour.
+
+    Parameters:
+    - image (Image.Image): Image to hash.
+
+    Returns:
+    - str: 64-bit hash as a hexadecimal string.
+    """
+    pixels = list(
+        image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).getdata()
+    )
+    bits = 0
+    for row in range(HASH_SIZE):
+        for column in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + column]
+            bits = (bits << 1) | (left > pixels[row * (HASH_SIZE + 1) + column + 1])
+    return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def perceptual_hash(image: Image.Image) -> str:
+    """
+    Computes the pHash of an image: whether each of the lowest-frequency DCT coefficients
+    of a grayscale thumbnail is above their median.
+
+    Parameters:
+    - image (Image.Image): Image to hash.
+
+    Returns:
+    - str: 64-bit hash as a hexadecimal string.
+    """
+    size = PHASH_SAMPLE_SIZE
+    pixels = list(image.convert("L").resize((size, size), Image.LANCZOS).getdata())
+    cosines = [
+        [math.cos(math.pi * (2 * x + 1) * u / (2 * size)) for x in range(size)]
+        for u in range(HASH_SIZE)
+    ]
+    rows = [
+        [
+            sum(c * p for c, p in zip(cosines[u], pixels[y * size : (y + 1) * size]))
+            for u in range(HASH_SIZE)
+        ]
+        for y in range(size)
+    ]
+    coefficients = [
+        sum(cosines[v][y] * rows[y][u] for y in range(size))
+        for v in range(HASH_SIZE)
+        for u in range(HASH_SIZE)
+    ]
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    bits = 0
+    for coefficient in coefficients:
+        bits = (bits << 1) | (coefficient > median)
+    return f"{bits:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def hamming_distance(first_hash: str, second_hash: str) -> int:
+    """
+    Returns the number of differing bits of two hexadecimal image hashes.
+    """
+    return bin(int(first_hash, 16) ^ int(second_hash, 16)).count("1")
+
+
+def _choose_detail(width: int, height: int, detail: str) -> str:
+    """
+    Applies the detail policy: in "auto" mode, images that fit into a single low detail
+    image lose nothing at low detail, while larger images keep their fine print at high
+    detail.
+    """
+    if detail != "auto":
+        return detail
+    return "low" if max(width, height) <= LOW_DETAIL_SIDE else "high"
+
+
+def _settings_key(detail: str) -> str:
+    """
+    Returns the preprocessing settings a cached image depends on.
+    """
+    return json.dumps(
+        [
+            detail,
+            MAX_IMAGE_SIDE,
+            HIGH_DETAIL_SHORT_SIDE,
+            LOW_DETAIL_SIDE,
+            TILE_SIZE,
+            TILE_SNAP_TOLERANCE,
+            JPEG_QUALITY,
+            BORDER_TOLERANCE,
+        ]
+    )
+
+
+def preprocess_image(image_path: str, cache_dir: str, detail: str = "auto") -> dict:
+    """
+    Prepares a promotion image for a vision request.
+
+    The image is trimmed of uniform borders, scaled to the size the API would scale it to
+    anyway, snapped to tile-efficient dimensions and re-encoded as JPEG. Processed images
+    are cached in `cache_dir` by the hash of the original file and the preprocessing
+    settings, so an unchanged image is only processed once. The perceptual hashes are taken
+    of the trimmed image, so reposts that only differ in padding hash alike.
+
+    Parameters:
+    - image_path (str): Path of the original image.
+    - cache_dir (str): Directory of the processed image cache.
+    - detail (str): Detail policy, "auto", "low" or "high".
+
+    Returns:
+    - dict: The base64 encoded image, its "mime_type", "detail", "width", "height",
+      estimated "tokens", its "phash" and "dhash" and the "original_bytes" and
+      "processed_bytes" sizes.
+    """
+    if detail not in DETAIL_POLICIES:
+        raise ValueError(f"Unknown detail policy '{detail}'.")
+
+    with open(image_path, "rb") as image_file:
+        original = image_file.read()
+    key = hashlib.sha256(original + _settings_key(detail).encode("utf-8")).hexdigest()
+    image_cache_path = os.path.join(cache_dir, f"{key}.jpg")
+    meta_cache_path = os.path.join(cache_dir, f"{key}.json")
+
+    meta = {}
+    if os.path.exists(image_cache_path) and os.path.exists(meta_cache_path):
+        with open(meta_cache_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(image_cache_path, "rb") as image_file:
+            processed = image_file.read()
+    if "phash" not in meta:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(original)))
+        if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        else:
+            image = image.convert("RGB")
+
+        image = trim_uniform_border(image)
+        chosen_detail = _choose_detail(*image.size, detail)
+        if chosen_detail == "low":
+            scale = min(1.0, LOW_DETAIL_SIDE / max(image.size))
+            size = (
+                max(1, round(image.width * scale)),
+                max(1, round(image.height * scale)),
+            )
+        else:
+            size = _snap_to_tiles(*_fit_high_detail(*image.size))
+        if size != image.size:
+            image = image.resize(size, Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        processed = buffer.getvalue()
+        meta = {
+            "mime_type": "image/jpeg",
+            "detail": chosen_detail,
+            "width": image.width,
+            "height": image.height,
+            "tokens": estimate_image_tokens(image.width, image.height, chosen_detail),
+            "phash": perceptual_hash(image),
+            "dhash": difference_hash(image),
+        }
+
+        os.makedirs(cache_dir, exist_ok=True)
+        for path, data, mode in (
+            (image_cache_path, processed, "wb"),
+            (meta_cache_path, json.dumps(meta), "w"),
+        ):
+            temporary_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary_path, mode) as f:
+                f.write(data)
+            os.replace(temporary_path, path)
+
+    return {
+        "base64": base64.b64encode(processed).decode("utf-8"),
+        **meta,
+        "original_bytes": len(original),
+        "processed_bytes": len(processed),
+    }